@@ -0,0 +1,248 @@
+"""AI 路徑壓力測試：以模擬的頻道訊息大量觸發 AI 回覆流程。
+
+流程與 app.py 的 on_message 相同 (呼叫同一個 stream_ai_reply)：頻率限制 → 對話記憶 →
+AIGateway 串流 → ProgressiveReply 逐步編輯訊息。Gemini 由 FakeGemini 模擬 (在獨立執行緒中運行，
+不影響被測事件迴圈)，Discord 訊息則以記錄時間的假物件代替。
+
+量測項目：事件迴圈延遲、首段可見延遲 (只計算真正的回答片段)、完整回覆延遲、
+錯誤回覆 (負載削減、逾時等) 的延遲百分位數、
+佇列深度、負載削減與頻率限制的次數。
+
+使用方式：
+  python AIBenchmark.py --messages 5000 --rate 500 --concurrency 4 --queue 32
+  python AIBenchmark.py --base-url http://127.0.0.1:8765   # 使用已啟動的 FakeGemini
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from AIGateway import (
+    AI_BUSY_MESSAGE, AI_ERROR_MESSAGE, AI_TIMEOUT_MESSAGE, AIGateway, AIQueueFullError, AITimeoutError,
+    stream_ai_reply
+)
+from AIMemory import ChannelMemoryStore
+from AIRateLimit import AIRateLimiter, RequestCoalescer
+from FakeGemini import FakeGeminiConfig, FakeGeminiServer, make_fake_client
+
+# 事件迴圈延遲的取樣間隔 (秒)
+LOOP_LAG_INTERVAL = 0.01
+
+
+class FakeMessage:
+    """模擬 discord.Message，只記錄編輯次數。"""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.edits = 0
+
+    async def edit(self, content: str):
+        self.content = content
+        self.edits += 1
+
+
+def percentiles(values, points=(0.5, 0.95, 0.99)) -> dict:
+    if not values:
+        return {f"p{int(p * 100)}": None for p in points} | {"max": None}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        result[f"p{int(p * 100)}"] = round(ordered[index] * 1000, 2)
+    result["max"] = round(ordered[-1] * 1000, 2)
+    return result
+
+
+class AIBenchmark:
+    def __init__(self, args, client):
+        self.args = args
+        self.gateway = AIGateway(
+            client,
+            max_concurrency=args.concurrency,
+            max_queue=args.queue,
+            timeout=args.timeout,
+        )
+        self.rate_limiter = AIRateLimiter(global_rate_per_minute=args.global_rate) if args.rate_limit else None
+        self.memory = ChannelMemoryStore()
+        self.coalescer = RequestCoalescer()
+        self.random = random.Random(args.seed)
+
+        # 第一個回答片段顯示的時間；錯誤回覆 (負載削減等) 另外統計，避免拉低首段延遲
+        self.first_visible = []
+        self.error_replies = []
+        self.completed = []
+        self.loop_lag = []
+        self.queue_depth = []
+        self.outcomes = {"ok": 0, "shed": 0, "timeout": 0, "error": 0, "rate_limited": 0}
+        self.messages_sent = 0
+        self.message_edits = 0
+
+    async def _monitor(self, stop: asyncio.Event):
+        """量測事件迴圈延遲並取樣佇列深度。"""
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag.append(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+            self.queue_depth.append(self.gateway.queue_depth)
+
+    async def handle_message(self, channel_id: int, user_id: int, prompt: str):
+        """模擬 on_message 的 AI 分支。"""
+        received = time.perf_counter()
+        if self.rate_limiter and self.rate_limiter.check(channel_id % self.args.guilds, user_id):
+            self.outcomes["rate_limited"] += 1
+            return
+
+        sent = []
+
+        async def send(text):
+            if not sent:
+                elapsed = time.perf_counter() - received
+                if text in (AI_BUSY_MESSAGE, AI_TIMEOUT_MESSAGE, AI_ERROR_MESSAGE):
+                    self.error_replies.append(elapsed)
+                else:
+                    self.first_visible.append(elapsed)
+            message = FakeMessage(text)
+            sent.append(message)
+            self.messages_sent += 1
+            return message
+
+        errors = []
+        contents = self.memory.build_contents(channel_id, prompt)
+        reply_text = await stream_ai_reply(
+            self.gateway, contents, send, send, "抱歉，我無法理解您的問題。",
+            coalescer=self.coalescer,
+            coalesce_key=(channel_id, prompt),
+            edit_interval=self.args.edit_interval,
+            on_error=errors.append,
+        )
+        if errors:
+            error = errors[0]
+            if isinstance(error, AIQueueFullError):
+                self.outcomes["shed"] += 1
+            elif isinstance(error, AITimeoutError):
+                self.outcomes["timeout"] += 1
+            else:
+                self.outcomes["error"] += 1
+            return
+
+        self.outcomes["ok"] += 1
+        self.completed.append(time.perf_counter() - received)
+        self.message_edits += sum(message.edits for message in sent)
+        if reply_text:
+            self.memory.record(channel_id, prompt, reply_text)
+
+    async def run(self) -> dict:
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(self._monitor(stop))
+        interval = 1 / self.args.rate if self.args.rate > 0 else 0
+        tasks = []
+
+        started = time.perf_counter()
+        for index in range(self.args.messages):
+            channel_id = self.random.randrange(self.args.channels)
+            user_id = self.random.randrange(self.args.users)
+            prompt = f"第 {index} 則模擬問題，來自頻道 {channel_id}"
+            tasks.append(asyncio.create_task(self.handle_message(channel_id, user_id, prompt)))
+            if interval:
+                # 依目標速率排程，而不是每則固定 sleep，避免累積誤差
+                delay = started + (index + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif index % 100 == 0:
+                    await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await monitor
+
+        return {
+            "config": {
+                "messages": self.args.messages,
+                "rate_per_second": self.args.rate,
+                "channels": self.args.channels,
+                "users": self.args.users,
+                "concurrency": self.args.concurrency,
+                "queue": self.args.queue,
+                "timeout": self.args.timeout,
+                "rate_limit": self.args.rate_limit,
+                "fake_latency": self.args.latency,
+                "fake_error_rate": self.args.error_rate,
+            },
+            "elapsed_seconds": round(elapsed, 3),
+            "outcomes": self.outcomes,
+            "first_visible_ms": percentiles(self.first_visible),
+            "error_reply_ms": percentiles(self.error_replies),
+            "completed_ms": percentiles(self.completed),
+            "loop_lag_ms": percentiles(self.loop_lag),
+            "max_queue_depth": max(self.queue_depth, default=0),
+            "discord_messages_sent": self.messages_sent,
+            "discord_message_edits": self.message_edits,
+            "gateway": self.gateway.stats(),
+        }
+
+
+def start_fake_server_thread(config: FakeGeminiConfig, seed) -> str:
+    """在獨立執行緒中啟動 FakeGemini，回傳 base_url。"""
+    ready = threading.Event()
+    result = {}
+
+    def runner():
+        loop = asyncio.new_event_loop()
+        server = FakeGeminiServer(config, seed=seed)
+        result["url"] = loop.run_until_complete(server.start(port=0))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=runner, daemon=True).start()
+    ready.wait()
+    return result["url"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI 路徑壓力測試")
+    parser.add_argument('--messages', type=int, default=2000, help="模擬訊息總數")
+    parser.add_argument('--rate', type=float, default=200, help="每秒送出的訊息數 (0 表示一次全部送出)")
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4, help="AIGateway 並行上限")
+    parser.add_argument('--queue', type=int, default=32, help="AIGateway 等待佇列上限")
+    parser.add_argument('--timeout', type=float, default=30.0, help="AIGateway 逾時 (秒)")
+    parser.add_argument('--edit-interval', type=float, default=1.2, help="串流編輯間隔 (秒)")
+    parser.add_argument('--rate-limit', action='store_true', help="啟用令牌桶頻率限制")
+    parser.add_argument('--global-rate', type=int, default=120, help="全域每分鐘請求上限")
+    parser.add_argument('--base-url', default=None, help="使用已啟動的 FakeGemini，而不是內建的")
+    parser.add_argument('--latency', type=float, default=0.3, help="模擬 Gemini 首段延遲 (秒)")
+    parser.add_argument('--chunks', type=int, default=8)
+    parser.add_argument('--reply-length', type=int, default=600)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="將結果寫入 JSON 檔案")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    base_url = args.base_url or start_fake_server_thread(
+        FakeGeminiConfig(
+            latency=args.latency,
+            chunks=args.chunks,
+            reply_length=args.reply_length,
+            error_rate=args.error_rate,
+        ),
+        args.seed,
+    )
+    benchmark = AIBenchmark(args, make_fake_client(base_url))
+    return await benchmark.run()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
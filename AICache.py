@@ -0,0 +1,102 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# --- 預設配置 ---
+# 快取最多保留的回覆數量 (超過時淘汰最久未使用的項目)
+DEFAULT_MAX_ENTRIES = 512
+# 每筆快取的存活時間 (秒)
+DEFAULT_TTL_SECONDS = 3600
+
+# 與 on_message 相同的提及移除規則 (額外涵蓋身分組提及)
+MENTION_PATTERN = re.compile(r'<@[!&]?\d+>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """正規化問題文字：移除提及、合併空白、忽略大小寫。"""
+    prompt = MENTION_PATTERN.sub('', prompt)
+    return WHITESPACE_PATTERN.sub(' ', prompt).strip().casefold()
+
+
+def history_digest(history) -> str:
+    """對話歷史的摘要值 (SHA-1)。"""
+    encoded = json.dumps(history, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class AIResponseCache:
+    """AI 回覆快取：以 (模型, 伺服器範圍, 正規化問題) 為鍵，TTL + LRU 淘汰。"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # {key: (expires_at, response_text)}，順序即為最近使用順序
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, scope, prompt: str, history=None) -> Optional[tuple]:
+        """建立快取鍵；正規化後為空的問題不快取。
+
+        history 為本次問題之前的對話 (Gemini contents 格式)，以摘要值加入鍵中：
+        相同的問題只有在對話內容也相同時才會命中，避免沿用不同上下文的回覆。
+        """
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return None
+        digest = history_digest(history) if history else ''
+        return (model, str(scope), normalized, digest)
+
+    def get(self, key) -> Optional[str]:
+        """取得未過期的快取回覆，並將其標記為最近使用。"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value: str):
+        """寫入快取，超過容量時淘汰最久未使用的項目。"""
+        if not value:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self, scope=None):
+        """清除快取；指定 scope 時只清除該伺服器的項目。"""
+        if scope is None:
+            self._entries.clear()
+            return
+        scope = str(scope)
+        for key in [k for k in self._entries if k[1] == scope]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
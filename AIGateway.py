@@ -0,0 +1,361 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from AICache import AIResponseCache
+
+# --- 預設配置 ---
+DEFAULT_MODEL = 'gemini-2.5-flash'
+# 同時送往 Gemini 的請求上限
+DEFAULT_MAX_CONCURRENCY = 4
+# 等待中的請求上限 (超過即直接拒絕，避免無限堆積)
+DEFAULT_MAX_QUEUE = 32
+# 單一請求逾時 (秒)；串流模式下為等待首個/下一個片段的最長時間
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# 保留多少筆延遲樣本用於統計
+LATENCY_SAMPLE_SIZE = 200
+
+# Discord 單則訊息字數上限
+DISCORD_MESSAGE_LIMIT = 2000
+# 串流回覆編輯同一則訊息的最短間隔 (秒)，Discord 編輯限速約為 5 次 / 5 秒
+STREAM_EDIT_INTERVAL = 1.2
+
+# 回覆給用戶的錯誤訊息
+AI_BUSY_MESSAGE = "⏳ 目前 AI 請求太多了，請稍後再試一次。"
+AI_TIMEOUT_MESSAGE = "⌛ AI 回應逾時，請稍後再試。"
+AI_ERROR_MESSAGE = "❌ AI 服務發生錯誤。"
+
+
+class AIGatewayError(Exception):
+    """AI 閘道錯誤的基底類別。"""
+
+
+class AIQueueFullError(AIGatewayError):
+    """等待佇列已滿，請求被拒絕 (負載削減)。"""
+
+
+class AITimeoutError(AIGatewayError):
+    """請求超過設定的逾時時間。"""
+
+
+class AIGateway:
+    """非同步 Gemini 閘道：限制並行數、限制等待佇列、逾時與延遲統計。
+
+    所有 AI 呼叫都應透過 `generate()` 進行，避免同步呼叫阻塞事件迴圈。
+    """
+
+    def __init__(self, client, model: str = DEFAULT_MODEL,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 cache: Optional[AIResponseCache] = None):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._active = 0
+
+        # 統計資料
+        self._latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._first_chunk_latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self.total_requests = 0
+        self.total_rejected = 0
+        self.total_timeouts = 0
+        self.total_errors = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """目前正在等待執行位置的請求數量。"""
+        return self._waiting
+
+    def _admit(self):
+        """檢查是否還有等待空間，沒有則直接拒絕。"""
+        if self._active >= self.max_concurrency and self._waiting >= self.max_queue:
+            self.total_rejected += 1
+            raise AIQueueFullError("AI 請求佇列已滿")
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """取得一個執行位置，並負責計數、錯誤分類與延遲統計。"""
+        self._admit()
+        self.total_requests += 1
+        started = time.perf_counter()
+
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        try:
+            yield started
+        except asyncio.TimeoutError:
+            self.total_timeouts += 1
+            raise AITimeoutError(f"AI 請求超過 {self.timeout:.0f} 秒未回應")
+        except Exception:
+            self.total_errors += 1
+            raise
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+            self._latencies.append(time.perf_counter() - started)
+
+    async def _call_model(self, contents, model: str):
+        """實際呼叫 Gemini (使用 google-genai 的非同步介面)。"""
+        response = await self.client.aio.models.generate_content(model=model, contents=contents)
+        return response.text
+
+    def _cache_key(self, contents, model: str, cache_scope):
+        """cache_scope 為 None 時代表不使用快取 (例如伺服器已關閉快取)。"""
+        if self.cache is None or cache_scope is None:
+            return None
+        if isinstance(contents, str):
+            return self.cache.make_key(model, cache_scope, contents)
+        # 帶有對話記憶時，以最後一個用戶問題 + 先前對話的摘要作為鍵
+        try:
+            last = contents[-1]
+            if last['role'] != 'user':
+                return None
+            prompt = "".join(part.get('text', '') for part in last['parts'])
+        except (IndexError, KeyError, TypeError, AttributeError):
+            return None
+        return self.cache.make_key(model, cache_scope, prompt, history=contents[:-1])
+
+    async def generate(self, contents, model: Optional[str] = None, cache_scope=None) -> Optional[str]:
+        """送出一次 AI 請求並回傳文字結果。
+
+        佇列已滿時拋出 AIQueueFullError，逾時時拋出 AITimeoutError，
+        其他 API 錯誤則原樣拋出。
+        """
+        model = model or self.model
+        cache_key = self._cache_key(contents, model, cache_scope)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        async with self._slot() as started:
+            remaining = self.timeout - (time.perf_counter() - started)
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            text = await asyncio.wait_for(self._call_model(contents, model), timeout=remaining)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, text)
+        return text
+
+    async def stream(self, contents, model: Optional[str] = None, cache_scope=None) -> AsyncIterator[str]:
+        """以串流方式送出 AI 請求，逐段產生文字片段。
+
+        逾時計算的是「等待下一個片段」的時間，長回答不會因總時長而被中斷。
+        快取命中時直接產生整段回覆，不佔用執行位置。
+        """
+        model = model or self.model
+        cache_key = self._cache_key(contents, model, cache_scope)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async with self._slot() as started:
+            remaining = self.timeout - (time.perf_counter() - started)
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            response_stream = await asyncio.wait_for(
+                self.client.aio.models.generate_content_stream(model=model, contents=contents),
+                timeout=remaining
+            )
+            chunks = response_stream.__aiter__()
+            first_chunk = True
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                except StopAsyncIteration:
+                    break
+                if first_chunk:
+                    self._first_chunk_latencies.append(time.perf_counter() - started)
+                    first_chunk = False
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+
+        # 只有完整結束的串流才寫入快取
+        if cache_key is not None:
+            self.cache.put(cache_key, "".join(parts))
+
+    def stats(self) -> dict:
+        """回傳目前的佇列與延遲統計 (延遲單位: 毫秒)。"""
+        samples = sorted(self._latencies)
+        first_chunk_samples = sorted(self._first_chunk_latencies)
+
+        def percentile(p, values=samples):
+            if not values:
+                return 0.0
+            index = min(len(values) - 1, int(round(p * (len(values) - 1))))
+            return values[index] * 1000
+
+        return {
+            "active": self._active,
+            "queue_depth": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "total_requests": self.total_requests,
+            "total_rejected": self.total_rejected,
+            "total_timeouts": self.total_timeouts,
+            "total_errors": self.total_errors,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "first_chunk_p50_ms": percentile(0.50, first_chunk_samples),
+        }
+
+
+def _split_point(text: str, limit: int) -> int:
+    """在 limit 之內找一個乾淨的切割位置 (優先換行，其次空白)。"""
+    for separator in ('\n', ' '):
+        index = text.rfind(separator, 0, limit + 1)
+        if index > limit // 2:
+            return index
+    return limit
+
+
+class ProgressiveReply:
+    """將串流文字逐步寫入 Discord 訊息。
+
+    收到第一個片段就立即發送訊息，之後以固定間隔編輯同一則訊息；
+    超過 2000 字時在換行或空白處切開，剩餘內容改以新訊息接續。
+    """
+
+    def __init__(self, send_first: Callable[[str], Awaitable], send_followup: Callable[[str], Awaitable],
+                 edit_interval: float = STREAM_EDIT_INTERVAL, limit: int = DISCORD_MESSAGE_LIMIT):
+        self._send_first = send_first
+        self._send_followup = send_followup
+        self.edit_interval = edit_interval
+        self.limit = limit
+
+        self.messages = []
+        self._buffer = ""
+        self._shown = ""
+        # 最後一則訊息是否仍在接收內容 (尚未寫滿)
+        self._open = False
+        self._last_edit = 0.0
+
+    @property
+    def has_output(self) -> bool:
+        return bool(self.messages)
+
+    async def _post(self, text: str):
+        sender = self._send_followup if self.messages else self._send_first
+        self.messages.append(await sender(text))
+        self._shown = text
+        self._open = True
+        self._last_edit = time.monotonic()
+
+    async def _flush(self):
+        if self._buffer != self._shown:
+            await self.messages[-1].edit(content=self._buffer)
+            self._shown = self._buffer
+            self._last_edit = time.monotonic()
+
+    async def feed(self, chunk: str):
+        """加入一段新文字，必要時發送、切割或 (節流後) 編輯訊息。"""
+        self._buffer += chunk
+
+        while len(self._buffer) > self.limit:
+            cut = _split_point(self._buffer, self.limit)
+            head, self._buffer = self._buffer[:cut].rstrip(), self._buffer[cut:].lstrip()
+            if self._open:
+                if head != self._shown:
+                    await self.messages[-1].edit(content=head)
+            else:
+                await self._post(head)
+            # 這則訊息已寫滿，後續內容改用新訊息
+            self._open = False
+            self._shown = ""
+
+        if not self._buffer.strip():
+            return
+        if not self._open:
+            await self._post(self._buffer)
+        elif time.monotonic() - self._last_edit >= self.edit_interval:
+            await self._flush()
+
+    async def finish(self):
+        """串流結束時寫入最後尚未顯示的內容。"""
+        if not self._buffer.strip():
+            return
+        if self._open:
+            await self._flush()
+        else:
+            await self._post(self._buffer)
+
+
+async def stream_ai_reply(gateway: AIGateway, contents, send_first: Callable[[str], Awaitable],
+                          send_followup: Callable[[str], Awaitable], empty_message: str, cache_scope=None,
+                          coalescer=None, coalesce_key=None, edit_interval: float = STREAM_EDIT_INTERVAL,
+                          on_error: Optional[Callable[[Exception], None]] = None) -> Optional[str]:
+    """以串流方式回覆 AI 結果：第一個片段到達即發送，之後節流編輯訊息。
+
+    coalesce_key 相同且仍在進行中的請求 (coalescer 為 AIRateLimit.RequestCoalescer) 不會重複呼叫 Gemini，
+    而是等待並沿用其回覆。發生錯誤時會回覆錯誤訊息並呼叫 on_error(例外)，沒有提供時印出一般錯誤。
+    成功時回傳完整的回覆文字，失敗或沿用他人回覆時回傳 None。
+    """
+    writer = ProgressiveReply(send_first, send_followup, edit_interval=edit_interval)
+    if coalescer is None:
+        coalesce_key = None
+
+    if coalesce_key is not None:
+        pending = coalescer.get(coalesce_key)
+        if pending is not None:
+            shared_text = await asyncio.shield(pending)
+            if shared_text is None:
+                await send_first(AI_ERROR_MESSAGE)
+                return None
+            await writer.feed(shared_text or empty_message)
+            await writer.finish()
+            return None
+        coalescer.start(coalesce_key)
+
+    parts = []
+    completed = False
+    error_message = None
+    try:
+        async with contextlib.aclosing(gateway.stream(contents, cache_scope=cache_scope)) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                await writer.feed(chunk)
+        completed = True
+    except Exception as e:
+        if isinstance(e, AIQueueFullError):
+            error_message = AI_BUSY_MESSAGE
+        elif isinstance(e, AITimeoutError):
+            error_message = AI_TIMEOUT_MESSAGE
+        else:
+            error_message = AI_ERROR_MESSAGE
+            if on_error is None:
+                print(f"AI 回覆時發生錯誤: {e}")
+        if on_error is not None:
+            on_error(e)
+    finally:
+        if coalesce_key is not None:
+            coalescer.finish(coalesce_key, "".join(parts) if completed else None)
+
+    if error_message and writer.has_output:
+        # 已經顯示部分內容時，把錯誤附在最後，避免半截回答看起來像完整答案
+        await writer.feed(f"\n\n{error_message}")
+    elif error_message:
+        await send_first(error_message)
+        return None
+    elif not writer.has_output:
+        await writer.feed(empty_message)
+    await writer.finish()
+    return "".join(parts) if completed else None
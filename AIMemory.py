@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+# --- 預設配置 ---
+# 每個頻道最多保留幾則對話 (一問一答算兩則)
+DEFAULT_MAX_TURNS = 12
+# 每個頻道歷史對話的估計 token 上限
+DEFAULT_TOKEN_BUDGET = 2000
+# 最多同時保留多少個頻道的對話 (超過時淘汰最久未使用者)
+DEFAULT_MAX_SESSIONS = 500
+# 頻道閒置多久 (秒) 後清除其對話
+DEFAULT_IDLE_TTL_SECONDS = 1800
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估計 token 數 (以 UTF-8 位元組數 / 4 計算，中英文皆適用)。"""
+    return max(1, len(text.encode('utf-8')) // 4)
+
+
+class ConversationMemory:
+    """單一頻道的對話記憶：固定長度的環形緩衝區，並受 token 預算限制。"""
+
+    __slots__ = ('max_turns', 'token_budget', 'turns', 'tokens', 'last_used')
+
+    def __init__(self, max_turns: int = DEFAULT_MAX_TURNS, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        # 每一項為 (role, text, token_count)
+        self.turns = deque()
+        self.tokens = 0
+        self.last_used = time.monotonic()
+
+    def _drop_oldest(self):
+        _, _, token_count = self.turns.popleft()
+        self.tokens -= token_count
+
+    def add(self, role: str, text: str):
+        """加入一則對話，超過則數或 token 預算時從最舊的開始丟棄。"""
+        token_count = estimate_tokens(text)
+        if token_count > self.token_budget:
+            # 單則就超過預算時只保留結尾部分
+            text = text[-self.token_budget:]
+            token_count = estimate_tokens(text)
+
+        if len(self.turns) >= self.max_turns:
+            self._drop_oldest()
+        self.turns.append((role, text, token_count))
+        self.tokens += token_count
+
+        while self.tokens > self.token_budget and len(self.turns) > 1:
+            self._drop_oldest()
+        # 保持以用戶發言開頭，避免歷史第一則是沒有問題的回答
+        while self.turns and self.turns[0][0] != 'user':
+            self._drop_oldest()
+
+    def to_contents(self, prompt: str) -> list:
+        """轉換為 Gemini 的 contents 格式，最後附上本次的問題。"""
+        contents = [{"role": role, "parts": [{"text": text}]} for role, text, _ in self.turns]
+        contents.append({"role": "user", "parts": [{"text": prompt}]})
+        return contents
+
+
+class ChannelMemoryStore:
+    """所有頻道的對話記憶，以 LRU 與閒置時間限制總記憶體用量。"""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_ttl: float = DEFAULT_IDLE_TTL_SECONDS,
+                 max_turns: int = DEFAULT_MAX_TURNS,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self._sessions = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now: float):
+        # 最久未使用的頻道在最前面，閒置或超量時依序淘汰
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - oldest.last_used < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, channel_id) -> Optional[ConversationMemory]:
+        """取得頻道的對話記憶 (不存在時回傳 None)。"""
+        self._evict(time.monotonic())
+        return self._sessions.get(channel_id)
+
+    def build_contents(self, channel_id, prompt: str):
+        """組合要送給 Gemini 的內容；頻道沒有歷史時直接回傳問題字串。"""
+        memory = self.get(channel_id)
+        if memory is None or not memory.turns:
+            return prompt
+        return memory.to_contents(prompt)
+
+    def record(self, channel_id, prompt: str, reply: str):
+        """記錄一次完整的問答。"""
+        now = time.monotonic()
+        memory = self._sessions.get(channel_id)
+        if memory is None:
+            memory = self._sessions[channel_id] = ConversationMemory(self.max_turns, self.token_budget)
+        memory.add('user', prompt)
+        memory.add('model', reply)
+        memory.last_used = now
+        self._sessions.move_to_end(channel_id)
+        self._evict(now)
+
+    def clear(self, channel_id):
+        self._sessions.pop(channel_id, None)
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# --- 預設配置 ---
+# 每位用戶每分鐘可發出的 AI 請求數
+DEFAULT_USER_RATE_PER_MINUTE = 6
+# 每個伺服器每分鐘可發出的 AI 請求數
+DEFAULT_GUILD_RATE_PER_MINUTE = 30
+# 整個機器人每分鐘可發出的 AI 請求數 (保護共用的 Gemini 配額)
+DEFAULT_GLOBAL_RATE_PER_MINUTE = 120
+# 最多追蹤多少個用戶/伺服器的令牌桶 (超過時淘汰最久未使用者)
+MAX_TRACKED_BUCKETS = 10000
+
+
+class TokenBucket:
+    """令牌桶：以固定速率補充令牌，容量即為允許的瞬間爆發量。"""
+
+    __slots__ = ('rate_per_minute', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate_per_minute: int):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+
+    def set_rate(self, rate_per_minute: int):
+        if rate_per_minute != self.rate_per_minute:
+            self.rate_per_minute = rate_per_minute
+            self.capacity = float(rate_per_minute)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_minute / 60)
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def consume(self):
+        self.tokens -= 1
+
+    def retry_after(self) -> float:
+        """距離下一個令牌可用還需要幾秒。"""
+        if self.tokens >= 1 or self.rate_per_minute <= 0:
+            return 0.0
+        return (1 - self.tokens) * 60 / self.rate_per_minute
+
+
+class AIRateLimiter:
+    """AI 請求的三層令牌桶限制：全域、每個伺服器、每位用戶。"""
+
+    def __init__(self, global_rate_per_minute: int = DEFAULT_GLOBAL_RATE_PER_MINUTE,
+                 max_tracked: int = MAX_TRACKED_BUCKETS):
+        self.global_bucket = TokenBucket(global_rate_per_minute)
+        self.max_tracked = max_tracked
+        self._user_buckets = OrderedDict()
+        self._guild_buckets = OrderedDict()
+        self.rejected = 0
+
+    def _bucket(self, buckets: OrderedDict, key, rate_per_minute: int) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate_per_minute)
+            if len(buckets) > self.max_tracked:
+                buckets.popitem(last=False)
+        else:
+            bucket.set_rate(rate_per_minute)
+            buckets.move_to_end(key)
+        return bucket
+
+    def check(self, guild_id, user_id,
+              user_rate_per_minute: int = DEFAULT_USER_RATE_PER_MINUTE,
+              guild_rate_per_minute: int = DEFAULT_GUILD_RATE_PER_MINUTE) -> Optional[tuple]:
+        """檢查並消耗令牌。
+
+        全部允許時回傳 None 並各扣一枚令牌；否則不扣任何令牌，
+        回傳 (被限制的層級, 建議重試秒數)，層級為 'user'、'guild' 或 'global'。
+        """
+        now = time.monotonic()
+        buckets = [('user', self._bucket(self._user_buckets, user_id, user_rate_per_minute))]
+        if guild_id is not None:
+            buckets.append(('guild', self._bucket(self._guild_buckets, guild_id, guild_rate_per_minute)))
+        buckets.append(('global', self.global_bucket))
+
+        for scope, bucket in buckets:
+            if not bucket.available(now):
+                self.rejected += 1
+                return scope, bucket.retry_after()
+
+        for _, bucket in buckets:
+            bucket.consume()
+        return None
+
+
+class RequestCoalescer:
+    """合併進行中的相同請求：同一個鍵只會有一個上游呼叫，其餘等待其結果。"""
+
+    def __init__(self):
+        self._inflight = {}
+        self.coalesced = 0
+
+    def get(self, key) -> Optional[asyncio.Future]:
+        """若相同請求正在進行中，回傳其結果的 Future。"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    def start(self, key) -> asyncio.Future:
+        """登記一個新的進行中請求。"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def finish(self, key, result: Optional[str]):
+        """結束請求並將結果分發給所有等待者；失敗時結果為 None。"""
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
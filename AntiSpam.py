@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from array import array
+from collections import Counter, OrderedDict, deque
+from typing import Optional
+
+import discord
+
+# --- 預設門檻 (可由各伺服器設定覆寫) ---
+DEFAULT_THRESHOLDS = {
+    "antispam_window_seconds": 10,    # 滑動視窗長度 (秒)
+    "antispam_max_messages": 8,       # 視窗內最多訊息數
+    "antispam_max_duplicates": 4,     # 視窗內相同內容最多出現次數
+    "antispam_max_mentions": 10,      # 視窗內提及總數上限
+    "antispam_max_links": 6,          # 視窗內連結總數上限
+}
+# 重複字元規則：超過此長度且單一字元比例超過門檻即視為刷屏
+REPEATED_CHAR_MIN_LENGTH = 20
+REPEATED_CHAR_RATIO = 0.5
+
+# 最多追蹤多少位用戶 (超過時淘汰最久未發言者)
+MAX_TRACKED_USERS = 20000
+# 用戶閒置多久 (秒) 後清除其狀態
+IDLE_EVICT_SECONDS = 300
+
+# --- 刷屏清理設定 ---
+# 每位用戶保留最近多少則訊息的 ID (觸發時只刪除偵測視窗內的訊息)
+RECENT_MESSAGES_PER_USER = 100
+# Discord 批次刪除一次最多 100 則，且只能刪除 14 天內的訊息
+BULK_DELETE_BATCH_SIZE = 100
+BULK_DELETE_MAX_AGE_SECONDS = 14 * 24 * 3600 - 60
+# 每批刪除之間的間隔 (秒)，避免連續打到同一個頻道的限速
+BULK_DELETE_PAUSE_SECONDS = 1.0
+
+# --- 跨帳號 / 跨伺服器指紋設定 ---
+# 訊息至少多長才納入指紋統計 (避免 "good morning everyone" 之類的常見短句被誤判)
+FINGERPRINT_MIN_LENGTH = 24
+# 同一指紋由多少位不同用戶發送後標記為散播訊息 (單一用戶的重複訊息由 AntiSpamEngine 處理)
+FINGERPRINT_AUTHOR_THRESHOLD = 8
+# 統計視窗 (秒)；計數器每個視窗輪替一次，實際涵蓋 1~2 個視窗
+FINGERPRINT_WINDOW_SECONDS = 60
+# 被標記的指紋持續多久 (秒)
+FINGERPRINT_FLAG_SECONDS = 600
+# 最多同時標記多少個指紋
+FINGERPRINT_MAX_FLAGGED = 10000
+# 預期每秒納入指紋統計的訊息數 (所有伺服器合計)，用來決定過濾器與計數器的大小
+FINGERPRINT_EXPECTED_RATE = 1000
+# 「此用戶已計數過」判斷的誤判率上限 (誤判時該用戶不會被計入)
+FINGERPRINT_FALSE_POSITIVE_RATE = 0.001
+# Count-Min Sketch 的深度 (寬度依預期訊息量決定)
+SKETCH_DEPTH = 4
+
+MENTION_PATTERN = re.compile(r'<@[!&]?\d+>')
+LINK_PATTERN = re.compile(r'https?://|discord\.gg/', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def content_fingerprint(content: str) -> Optional[int]:
+    """正規化後的內容雜湊 (忽略大小寫與空白差異)，空內容回傳 None。"""
+    normalized = WHITESPACE_PATTERN.sub(' ', content).strip().casefold()
+    return hash(normalized) if normalized else None
+
+
+def repeated_char_ratio(content: str) -> float:
+    """單次掃描計算出現最多的字元所佔比例。"""
+    if not content:
+        return 0.0
+    _, count = Counter(content).most_common(1)[0]
+    return count / len(content)
+
+
+class CountMinSketch:
+    """Count-Min Sketch：固定記憶體的近似計數器 (只會高估，不會低估)。"""
+
+    __slots__ = ('width', 'depth', 'rows')
+
+    def __init__(self, width: int, depth: int = SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    def _indexes(self, h1: int, h2: int):
+        # 雙重雜湊產生每一列的位置
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def estimate(self, h1: int, h2: int) -> int:
+        return min(row[i] for row, i in zip(self.rows, self._indexes(h1, h2)))
+
+    def add(self, h1: int, h2: int) -> int:
+        """保守更新 (只增加等於最小值的計數器)，回傳新的估計值。"""
+        indexes = self._indexes(h1, h2)
+        new_value = min(row[i] for row, i in zip(self.rows, indexes)) + 1
+        for row, i in zip(self.rows, indexes):
+            if row[i] < new_value:
+                row[i] = new_value
+        return new_value
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = array('I', bytes(4 * self.width))
+
+
+class BloomFilter:
+    """固定容量的 Bloom filter：依預期數量與誤判率決定位元數與雜湊數。"""
+
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity: int, false_positive_rate: float = FINGERPRINT_FALSE_POSITIVE_RATE):
+        self.size = max(64, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        # 已加入的項目數 (超過容量時誤判率會快速上升)
+        self.count = 0
+
+    def add(self, h1: int, h2: int) -> bool:
+        """加入一個項目，回傳是否為新項目 (已存在時回傳 False，可能誤判)。"""
+        new = False
+        for i in range(self.hashes):
+            index = (h1 + i * h2) % self.size
+            mask = 1 << (index & 7)
+            if not self.bits[index >> 3] & mask:
+                self.bits[index >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, hashes: tuple) -> bool:
+        h1, h2 = hashes
+        return all(self.bits[index >> 3] & (1 << (index & 7))
+                   for index in ((h1 + i * h2) % self.size for i in range(self.hashes)))
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+
+def _hash_pair(data: bytes):
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class SpamFingerprintSketch:
+    """跨帳號、跨伺服器的散播訊息偵測 (整個程序共用)。
+
+    只保存正規化內容的雜湊，不保存原文。以 Bloom filter 判斷 (指紋, 用戶) 是否已計數過，
+    以 Count-Min Sketch 統計「同一指紋由多少位不同用戶發送」，兩者皆為兩代輪替；
+    超過門檻後標記該指紋，之後任何伺服器出現相同內容都會立即被判定為散播。
+    以用戶而非頻道計數：同一人在多個頻道貼同一句話不會讓整句話被全域標記。
+
+    大小依 expected_rate x window_seconds 決定；實際訊息量超過容量時提前輪替，
+    視窗會變短，但不會因過濾器飽和而把新用戶誤判為已計數。
+    """
+
+    def __init__(self, threshold: int = FINGERPRINT_AUTHOR_THRESHOLD,
+                 window_seconds: float = FINGERPRINT_WINDOW_SECONDS,
+                 flag_seconds: float = FINGERPRINT_FLAG_SECONDS,
+                 expected_rate: float = FINGERPRINT_EXPECTED_RATE,
+                 false_positive_rate: float = FINGERPRINT_FALSE_POSITIVE_RATE,
+                 depth: int = SKETCH_DEPTH):
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.flag_seconds = flag_seconds
+        # 每一代最多計數的 (指紋, 用戶) 數
+        self.capacity = max(1, int(expected_rate * window_seconds))
+        # 計數器寬度至少為容量 (取 2 的次方)，背景訊息造成的高估遠低於門檻
+        width = 1 << (self.capacity - 1).bit_length()
+        # 指紋 -> 發送過的不同用戶數
+        self._counts = [CountMinSketch(width, depth), CountMinSketch(width, depth)]
+        # (指紋, 用戶) -> 是否已計數過，用來只計算「不同用戶」
+        self._seen = [BloomFilter(self.capacity, false_positive_rate), BloomFilter(self.capacity, false_positive_rate)]
+        self._rotate_at = time.monotonic() + window_seconds
+        # 因訊息量超過容量而提前輪替的次數
+        self.early_rotations = 0
+        # {指紋雜湊: 過期時間}
+        self._flagged = OrderedDict()
+        self.flag_count = 0
+
+    @staticmethod
+    def fingerprint(content: str) -> Optional[bytes]:
+        normalized = WHITESPACE_PATTERN.sub(' ', MENTION_PATTERN.sub('', content)).strip().casefold()
+        if len(normalized) < FINGERPRINT_MIN_LENGTH:
+            return None
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    def _rotate(self, now: float):
+        saturated = self._seen[0].count >= self.capacity
+        if now < self._rotate_at and not saturated:
+            return
+        if saturated and now < self._rotate_at:
+            self.early_rotations += 1
+        for pair in (self._counts, self._seen):
+            stale = pair.pop()
+            if now - self._rotate_at >= self.window_seconds:
+                # 超過兩個視窗沒有訊息，兩代都已過期
+                pair[0].clear()
+            stale.clear()
+            pair.insert(0, stale)
+        self._rotate_at = now + self.window_seconds
+
+    def is_flagged(self, fingerprint: bytes, now: float) -> bool:
+        expires_at = self._flagged.get(fingerprint)
+        if expires_at is None:
+            return False
+        if expires_at <= now:
+            del self._flagged[fingerprint]
+            return False
+        return True
+
+    def observe(self, author_id, content: str, now: float = None) -> bool:
+        """記錄一則訊息，若其內容已被判定為多個帳號散播則回傳 True。"""
+        fingerprint = self.fingerprint(content)
+        if fingerprint is None:
+            return False
+        now = time.monotonic() if now is None else now
+        self._rotate(now)
+        if self.is_flagged(fingerprint, now):
+            return True
+
+        h1, h2 = _hash_pair(fingerprint)
+        s1, s2 = _hash_pair(fingerprint + str(author_id).encode())
+        current_seen, previous_seen = self._seen
+        if (s1, s2) in previous_seen or not current_seen.add(s1, s2):
+            # 此用戶已計數過 (同一用戶的重複訊息由 AntiSpamEngine 處理)
+            return False
+
+        authors = self._counts[0].add(h1, h2) + self._counts[1].estimate(h1, h2)
+        if authors < self.threshold:
+            return False
+
+        self._flagged[fingerprint] = now + self.flag_seconds
+        self._flagged.move_to_end(fingerprint)
+        while len(self._flagged) > FINGERPRINT_MAX_FLAGGED:
+            self._flagged.popitem(last=False)
+        self.flag_count += 1
+        return True
+
+
+class UserWindow:
+    """單一用戶的滑動視窗：每則訊息 O(1) 加入、過期時 O(1) 移除並更新累計值。"""
+
+    __slots__ = ('events', 'fingerprints', 'mentions', 'links', 'last_seen', 'recent')
+
+    def __init__(self):
+        # 每一項為 (timestamp, fingerprint, mention_count, link_count)
+        self.events = deque()
+        self.fingerprints = {}
+        self.mentions = 0
+        self.links = 0
+        self.last_seen = 0.0
+        # 最近的訊息 (timestamp, channel_id, message_id)，觸發時用來批次清理
+        self.recent = deque(maxlen=RECENT_MESSAGES_PER_USER)
+
+    def reset(self):
+        """清除視窗統計 (保留最近訊息位置供清理使用)。"""
+        self.events.clear()
+        self.fingerprints.clear()
+        self.mentions = 0
+        self.links = 0
+
+    def expire(self, cutoff: float):
+        while self.events and self.events[0][0] < cutoff:
+            _, fingerprint, mention_count, link_count = self.events.popleft()
+            self.mentions -= mention_count
+            self.links -= link_count
+            if fingerprint is not None:
+                remaining = self.fingerprints[fingerprint] - 1
+                if remaining:
+                    self.fingerprints[fingerprint] = remaining
+                else:
+                    del self.fingerprints[fingerprint]
+
+    def add(self, now: float, fingerprint: Optional[int], mention_count: int, link_count: int) -> int:
+        """加入一則訊息，回傳此內容在視窗內出現的次數。"""
+        self.events.append((now, fingerprint, mention_count, link_count))
+        self.mentions += mention_count
+        self.links += link_count
+        self.last_seen = now
+        if fingerprint is None:
+            return 0
+        count = self.fingerprints.get(fingerprint, 0) + 1
+        self.fingerprints[fingerprint] = count
+        return count
+
+
+class AntiSpamEngine:
+    """多訊號防刷屏引擎：發言速率、重複訊息、提及數、連結數與重複字元。"""
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS, idle_seconds: float = IDLE_EVICT_SECONDS):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._windows = OrderedDict()
+
+    def __len__(self):
+        return len(self._windows)
+
+    def _evict(self, now: float):
+        while self._windows:
+            oldest = next(iter(self._windows.values()))
+            if len(self._windows) <= self.max_users and now - oldest.last_seen < self.idle_seconds:
+                break
+            self._windows.popitem(last=False)
+
+    def _window(self, key) -> UserWindow:
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = UserWindow()
+        else:
+            self._windows.move_to_end(key)
+        return window
+
+    def check(self, guild_id, user_id, content: str, mention_count: int,
+              thresholds: dict = None, now: float = None,
+              channel_id=None, message_id=None) -> Optional[str]:
+        """記錄一則訊息並檢查所有訊號，觸發時回傳原因 (並重置該用戶的視窗)。"""
+        thresholds = thresholds or {}
+
+        def limit(name):
+            return thresholds.get(name) or DEFAULT_THRESHOLDS[name]
+
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+        window = self._window(key)
+        window.expire(now - limit("antispam_window_seconds"))
+        duplicates = window.add(now, content_fingerprint(content), mention_count, len(LINK_PATTERN.findall(content)))
+        if message_id is not None:
+            window.recent.append((now, channel_id, message_id))
+
+        reason = None
+        if len(content) > REPEATED_CHAR_MIN_LENGTH and repeated_char_ratio(content.lower()) > REPEATED_CHAR_RATIO:
+            reason = "重複字元刷屏"
+        elif len(window.events) > limit("antispam_max_messages"):
+            reason = "發言速度過快"
+        elif duplicates > limit("antispam_max_duplicates"):
+            reason = "重複發送相同訊息"
+        elif window.mentions > limit("antispam_max_mentions"):
+            reason = "大量提及其他成員"
+        elif window.links > limit("antispam_max_links"):
+            reason = "大量發送連結"
+
+        if reason:
+            # 已處罰的用戶重新開始計算，避免禁言期間重複觸發
+            window.reset()
+        self._evict(now)
+        return reason
+
+    @staticmethod
+    def window_seconds(thresholds: dict = None) -> float:
+        """伺服器設定的偵測視窗長度 (秒)。"""
+        return (thresholds or {}).get("antispam_window_seconds") or DEFAULT_THRESHOLDS["antispam_window_seconds"]
+
+    def take_recent_messages(self, guild_id, user_id, window_seconds: float, now: float = None) -> dict:
+        """取出並清空用戶最近的訊息位置，回傳 {channel_id: [message_id, ...]}。
+
+        只回傳偵測視窗 (now - window_seconds 之後) 內的訊息，
+        觸發前的正常發言不會被一併刪除。
+        """
+        window = self._windows.get((guild_id, user_id))
+        if window is None:
+            return {}
+        now = time.monotonic() if now is None else now
+        cutoff = now - window_seconds
+        by_channel = {}
+        for timestamp, channel_id, message_id in window.recent:
+            if timestamp >= cutoff:
+                by_channel.setdefault(channel_id, []).append(message_id)
+        window.recent.clear()
+        return by_channel
+
+
+async def bulk_delete_messages(guild: discord.Guild, messages_by_channel: dict) -> int:
+    """以批次刪除 (每次最多 100 則) 清除訊息，回傳實際刪除的數量。
+
+    超過 14 天的訊息無法批次刪除，會被略過。某一批失敗時停止該頻道、繼續其他頻道，
+    並回傳已刪除的數量；所有頻道都因權限不足而無法刪除時拋出 discord.Forbidden。
+    限速 (429) 由 discord.py 自動等待重試，這裡另外在批次之間稍作停頓。
+    """
+    deleted = 0
+    forbidden = None
+    oldest_allowed = time.time() - BULK_DELETE_MAX_AGE_SECONDS
+    first_batch = True
+
+    for channel_id, message_ids in messages_by_channel.items():
+        channel = guild.get_channel_or_thread(channel_id)
+        if channel is None:
+            continue
+        message_ids = sorted({
+            message_id for message_id in message_ids
+            if discord.utils.snowflake_time(message_id).timestamp() > oldest_allowed
+        })
+
+        for start in range(0, len(message_ids), BULK_DELETE_BATCH_SIZE):
+            batch = message_ids[start:start + BULK_DELETE_BATCH_SIZE]
+            if not first_batch:
+                await asyncio.sleep(BULK_DELETE_PAUSE_SECONDS)
+            first_batch = False
+            try:
+                if len(batch) == 1:
+                    await channel.get_partial_message(batch[0]).delete()
+                else:
+                    await channel.delete_messages([discord.Object(id=message_id) for message_id in batch])
+                deleted += len(batch)
+            except discord.NotFound:
+                # 批次刪除會忽略已不存在的訊息；NotFound 代表頻道本身已被刪除
+                break
+            except discord.Forbidden as e:
+                # 此頻道沒有刪除權限，繼續處理其他頻道
+                forbidden = e
+                break
+            except discord.HTTPException as e:
+                print(f"❌ 批次清除頻道 {channel_id} 的訊息時發生錯誤: {e}")
+                break
+
+    if forbidden is not None and not deleted:
+        raise forbidden
+    return deleted
@@ -0,0 +1,179 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Optional
+
+import numpy as np
+
+from GbanTransfer import parse_user_id
+
+# 共享黑名單 (社群提供的大型名單) 的檔案位置
+SHARED_BLACKLIST_FILE = 'shared_blacklist.ids'
+# 檔頭：魔術字串、格式版本、用戶數
+HEADER = struct.Struct('<4sIQ')
+MAGIC = b'GBID'
+FORMAT_VERSION = 1
+# 沒有原因等附加資料的用戶，其位移記為此值
+NO_METADATA = 2 ** 64 - 1
+
+
+def metadata_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.meta.jsonl'
+
+
+class CompactBlacklist:
+    """以記憶體映射 (mmap) 讀取的大型唯讀黑名單。
+
+    .ids 檔案為「檔頭 + 排序好的 uint64 用戶 ID 陣列 + 對應的附加資料位移陣列」，
+    附加資料 (原因等) 另存於 .meta.jsonl，只在需要時依位移讀取一行。
+    成員檢查為對映射陣列的二分搜尋，只會載入實際讀到的頁面，
+    每位用戶在磁碟上只占 16 bytes (ID + 位移)，常駐記憶體與名單大小幾乎無關。
+    """
+
+    def __init__(self, path: str = SHARED_BLACKLIST_FILE):
+        self.path = path
+        self.meta_path = metadata_path(path)
+        self._file = None
+        self._mmap = None
+        self._ids = np.empty(0, dtype='<u8')
+        self._offsets = np.empty(0, dtype='<u8')
+        self._signature = None
+        self.refresh(force=True)
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def close(self):
+        # 先釋放指向 mmap 的陣列，否則無法關閉映射
+        self._ids = np.empty(0, dtype='<u8')
+        self._offsets = np.empty(0, dtype='<u8')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = self._file = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """檔案有變更時重新映射，回傳是否重新載入。"""
+        signature = self._stat_signature()
+        if not force and signature == self._signature:
+            return False
+        self.close()
+        self._signature = signature
+        if signature is None:
+            return True
+
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != FORMAT_VERSION or HEADER.size + count * 16 > len(self._mmap):
+            print(f"警告：{self.path} 檔案格式無效，已略過共享黑名單。")
+            self.close()
+            return True
+        self._ids = np.frombuffer(self._mmap, dtype='<u8', count=count, offset=HEADER.size)
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=count, offset=HEADER.size + count * 8)
+        return True
+
+    def _find(self, user_id: int) -> Optional[int]:
+        if not 0 <= user_id < NO_METADATA:
+            return None
+        index = int(np.searchsorted(self._ids, np.uint64(user_id)))
+        if index < len(self._ids) and int(self._ids[index]) == user_id:
+            return index
+        return None
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._find(user_id) is not None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def contains_many(self, user_ids) -> np.ndarray:
+        """一次檢查多個 ID (例如整個伺服器的成員)，回傳布林陣列。"""
+        user_ids = np.asarray(user_ids, dtype='<u8')
+        if not len(self._ids):
+            return np.zeros(len(user_ids), dtype=bool)
+        indexes = np.minimum(np.searchsorted(self._ids, user_ids), len(self._ids) - 1)
+        return self._ids[indexes] == user_ids
+
+    def get(self, user_id: int) -> Optional[dict]:
+        """回傳用戶的附加資料 (從 .meta.jsonl 讀取一行)；不在名單中時回傳 None。"""
+        index = self._find(user_id)
+        if index is None:
+            return None
+        offset = int(self._offsets[index])
+        if offset == NO_METADATA:
+            return {}
+        try:
+            with open(self.meta_path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+
+async def build_compact_blacklist(records, path: str = SHARED_BLACKLIST_FILE) -> tuple:
+    """從 (原始 ID, 資料) 的非同步迭代器建立 .ids / .meta.jsonl 暫存檔，回傳 (暫存檔路徑, 統計)。
+
+    讀取時只保存 ID 與位移 (每位 16 bytes)，附加資料直接寫入檔案；
+    相同 ID 只保留第一次出現的資料。完成後以 install_compact_blacklist() 取代正式檔案。
+    """
+    temp_path = path + '.tmp'
+    temp_meta_path = metadata_path(path) + '.tmp'
+    ids = array('Q')
+    offsets = array('Q')
+    stats = {'read': 0, 'invalid': 0}
+
+    with open(temp_meta_path, 'wb') as meta:
+        async for raw_id, data in records:
+            stats['read'] += 1
+            user_id = parse_user_id(raw_id)
+            if user_id is None:
+                stats['invalid'] += 1
+                continue
+            if data.get('reason'):
+                offsets.append(meta.tell())
+                meta.write((json.dumps({'reason': str(data['reason'])[:512]}, ensure_ascii=False) + "\n").encode('utf-8'))
+            else:
+                offsets.append(NO_METADATA)
+            ids.append(user_id)
+
+    id_array = np.frombuffer(ids, dtype=np.uint64) if ids else np.empty(0, dtype=np.uint64)
+    offset_array = np.frombuffer(offsets, dtype=np.uint64) if offsets else np.empty(0, dtype=np.uint64)
+    # 穩定排序後去除重複，保留每個 ID 第一次出現的資料
+    order = np.argsort(id_array, kind='stable')
+    id_array = id_array[order]
+    offset_array = offset_array[order]
+    keep = np.ones(len(id_array), dtype=bool)
+    keep[1:] = id_array[1:] != id_array[:-1]
+    id_array = id_array[keep]
+    offset_array = offset_array[keep]
+    stats['duplicates'] = int(len(keep) - keep.sum())
+    stats['count'] = len(id_array)
+
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(id_array)))
+        f.write(id_array.astype('<u8').tobytes())
+        f.write(offset_array.astype('<u8').tobytes())
+    return temp_path, stats
+
+
+def install_compact_blacklist(blacklist: CompactBlacklist, temp_path: str):
+    """以新建立的暫存檔取代共享黑名單 (先關閉映射，Windows 無法取代已映射的檔案)。"""
+    blacklist.close()
+    os.replace(metadata_path(blacklist.path) + '.tmp', blacklist.meta_path)
+    os.replace(temp_path, blacklist.path)
+    blacklist.refresh(force=True)
+
+
+def remove_compact_blacklist(blacklist: CompactBlacklist):
+    blacklist.close()
+    for path in (blacklist.path, blacklist.meta_path):
+        if os.path.exists(path):
+            os.remove(path)
+    blacklist.refresh(force=True)
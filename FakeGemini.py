@@ -0,0 +1,175 @@
+"""本機模擬 Gemini API 伺服器 (不需要 API Key 與外部網路)。
+
+實作 google-genai 會呼叫的兩個 REST 端點：
+  POST /v1beta/models/{model}:generateContent
+  POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+
+可設定回應延遲、片段數、錯誤率，用於測試 AI 路徑與壓力測試。
+
+使用方式：
+  python FakeGemini.py --port 8765 --latency 0.5 --chunks 8 --error-rate 0.05
+並在建立 genai.Client 時指定
+  http_options=types.HttpOptions(base_url="http://127.0.0.1:8765")
+"""
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class FakeGeminiConfig:
+    # 收到請求到第一個片段 (或完整回覆) 的延遲 (秒)
+    latency: float = 0.5
+    # 延遲的隨機抖動幅度 (秒)
+    jitter: float = 0.1
+    # 串流模式下每個片段之間的間隔 (秒)
+    chunk_interval: float = 0.05
+    # 串流模式下的片段數量
+    chunks: int = 8
+    # 回覆的長度 (字元)
+    reply_length: int = 400
+    # 回傳錯誤的機率 (0 ~ 1)
+    error_rate: float = 0.0
+    # 錯誤時使用的 HTTP 狀態碼
+    error_status: int = 503
+
+
+class FakeGeminiServer:
+    """模擬的 Gemini 端點，並統計收到的請求數。"""
+
+    def __init__(self, config: FakeGeminiConfig = None, seed: int = None):
+        self.config = config or FakeGeminiConfig()
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._runner = None
+
+    # --- 回覆內容 ---
+    def _prompt_text(self, body: dict) -> str:
+        contents = body.get('contents') or []
+        if isinstance(contents, dict):
+            contents = [contents]
+        for content in reversed(contents):
+            for part in content.get('parts', []):
+                if part.get('text'):
+                    return part['text']
+        return ""
+
+    def _reply_text(self, prompt: str) -> str:
+        seed_text = f"這是模擬的 Gemini 回覆，問題是「{prompt[:50]}」。"
+        repeated = (seed_text * (self.config.reply_length // max(1, len(seed_text)) + 1))
+        return repeated[:self.config.reply_length]
+
+    @staticmethod
+    def _payload(text: str, finished: bool) -> dict:
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finished:
+            candidate["finishReason"] = "STOP"
+        return {
+            "candidates": [candidate],
+            "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": max(1, len(text) // 4)},
+            "modelVersion": "fake-gemini",
+        }
+
+    def _error_response(self) -> web.Response:
+        self.errors += 1
+        status = self.config.error_status
+        body = {"error": {"code": status, "message": "模擬的 Gemini 錯誤", "status": "UNAVAILABLE"}}
+        return web.json_response(body, status=status)
+
+    async def _wait_first(self):
+        delay = self.config.latency + self.random.uniform(-self.config.jitter, self.config.jitter)
+        await asyncio.sleep(max(0.0, delay))
+
+    # --- HTTP 處理 ---
+    async def handle(self, request: web.Request):
+        self.requests += 1
+        _, _, action = request.match_info['model_action'].partition(':')
+        body = await request.json()
+
+        await self._wait_first()
+        if self.random.random() < self.config.error_rate:
+            return self._error_response()
+
+        text = self._reply_text(self._prompt_text(body))
+        if action == 'generateContent':
+            return web.json_response(self._payload(text, finished=True))
+        if action != 'streamGenerateContent':
+            return web.json_response({"error": {"code": 404, "message": f"未知的動作 {action}"}}, status=404)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = max(1, -(-len(text) // max(1, self.config.chunks)))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(self.config.chunk_interval)
+            data = json.dumps(self._payload(piece, finished=index == len(pieces) - 1), ensure_ascii=False)
+            await response.write(f"data: {data}\r\n\r\n".encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/{version}/models/{model_action}', self.handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> str:
+        """在目前的事件迴圈啟動伺服器，回傳 base_url。"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        # port 為 0 時由系統分配可用的埠號
+        actual_port = self._runner.addresses[0][1]
+        return f"http://{host}:{actual_port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def make_fake_client(base_url: str):
+    """建立指向模擬伺服器的 genai.Client。"""
+    from google import genai
+    from google.genai import types
+    return genai.Client(api_key='fake-key', http_options=types.HttpOptions(base_url=base_url))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本機模擬 Gemini API 伺服器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="第一個片段的延遲 (秒)")
+    parser.add_argument('--jitter', type=float, default=0.1, help="延遲抖動 (秒)")
+    parser.add_argument('--chunks', type=int, default=8, help="串流片段數")
+    parser.add_argument('--chunk-interval', type=float, default=0.05, help="片段間隔 (秒)")
+    parser.add_argument('--reply-length', type=int, default=400, help="回覆字元數")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="錯誤機率 (0~1)")
+    parser.add_argument('--error-status', type=int, default=503, help="錯誤時的 HTTP 狀態碼")
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args) -> FakeGeminiConfig:
+    return FakeGeminiConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        chunk_interval=args.chunk_interval,
+        chunks=args.chunks,
+        reply_length=args.reply_length,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = FakeGeminiServer(config_from_args(args), seed=args.seed)
+    print(f"🧪 模擬 Gemini 伺服器啟動於 http://{args.host}:{args.port}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,181 @@
+import glob
+import json
+import os
+import re
+from collections import defaultdict
+
+# 目前寫入中的紀錄檔 (JSON Lines，每行一筆操作紀錄)
+HISTORY_FILE = 'gban_history.jsonl'
+# 舊版的單一 JSON 陣列紀錄檔，第一次啟動時自動轉換
+LEGACY_HISTORY_FILE = 'gban_history.json'
+# 紀錄檔超過此大小 (bytes) 時封存成分段檔，改寫入新的檔案
+HISTORY_SEGMENT_BYTES = 1024 * 1024
+# 封存的分段檔超過此數量時，合併成單一封存檔
+HISTORY_MAX_SEGMENTS = 8
+
+
+class HistoryLog:
+    """只附加 (append-only) 的黑名單操作紀錄。
+
+    每次寫入只在檔案尾端附加一行，與既有紀錄數量無關；記憶體中只保存
+    「目標 ID / 執行者 ID → (檔案, 位移)」的索引，查詢時直接讀取對應的行，
+    成本與結果數量成正比。檔案過大時輪替成分段檔，分段檔過多時合併。
+    """
+
+    def __init__(self, path: str = HISTORY_FILE, legacy_path: str = LEGACY_HISTORY_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        base, ext = os.path.splitext(path)
+        self._segment_pattern = re.compile(re.escape(base) + r'\.(\d+)' + re.escape(ext) + '$')
+        self._segment_glob = f"{base}.*{ext}"
+        self.archive_path = f"{base}.archive{ext}"
+        self._by_target = defaultdict(list)
+        self._by_executor = defaultdict(list)
+        self._count = 0
+
+        self._migrate_legacy()
+        self._repair_tail()
+        self._rebuild_index()
+
+    # --- 檔案 ---
+    def _sealed_segments(self) -> list:
+        """依序回傳已封存的分段檔 (不含合併封存檔與目前的紀錄檔)。"""
+        numbered = []
+        for path in glob.glob(self._segment_glob):
+            found = self._segment_pattern.search(path)
+            if found:
+                numbered.append((int(found.group(1)), path))
+        return [path for _, path in sorted(numbered)]
+
+    def _all_files(self) -> list:
+        files = [self.archive_path] if os.path.exists(self.archive_path) else []
+        files.extend(self._sealed_segments())
+        if os.path.exists(self.path):
+            files.append(self.path)
+        return files
+
+    def _migrate_legacy(self):
+        """將舊版 gban_history.json 轉為 JSON Lines (只執行一次)。"""
+        if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            print(f"警告：{self.legacy_path} 檔案內容無效，略過舊紀錄轉換。")
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        print(f"✅ 已將 {len(entries)} 筆舊黑名單紀錄轉換為 {self.path}。")
+
+    def _repair_tail(self):
+        """寫入中斷時最後一行可能不完整，補上換行避免與下一筆紀錄黏在一起。"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    # --- 索引 ---
+    def _index_entry(self, entry: dict, position: tuple):
+        target_id = entry.get('target_id')
+        if target_id is not None:
+            self._by_target[str(target_id)].append(position)
+        # 批次操作 (例如匯入) 一筆紀錄包含多個目標
+        for target_id in entry.get('target_ids', ()):
+            self._by_target[str(target_id)].append(position)
+        executor_id = (entry.get('executor') or {}).get('id')
+        if executor_id is not None:
+            self._by_executor[str(executor_id)].append(position)
+        self._count += 1
+
+    def _rebuild_index(self):
+        self._by_target.clear()
+        self._by_executor.clear()
+        self._count = 0
+        for path in self._all_files():
+            with open(path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 寫入中斷造成的不完整行，略過
+                        entry = None
+                    if entry is not None:
+                        self._index_entry(entry, (path, offset))
+                    offset += len(line)
+
+    def _read(self, positions: list) -> list:
+        entries = []
+        handles = {}
+        try:
+            for path, offset in positions:
+                f = handles.get(path)
+                if f is None:
+                    f = handles[path] = open(path, 'rb')
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return entries
+
+    # --- 寫入 ---
+    def append(self, entry: dict):
+        """附加一筆操作紀錄。"""
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(line)
+        self._index_entry(entry, (self.path, offset))
+        if offset + len(line) >= HISTORY_SEGMENT_BYTES:
+            self._rotate()
+
+    def _rotate(self):
+        """封存目前的紀錄檔，分段檔過多時合併。"""
+        sealed = self._sealed_segments()
+        last_number = int(self._segment_pattern.search(sealed[-1]).group(1)) if sealed else 0
+        segment_path = self._segment_glob.replace('*', str(last_number + 1))
+        os.replace(self.path, segment_path)
+        if len(sealed) + 1 > HISTORY_MAX_SEGMENTS:
+            self.compact()
+            return
+        # 位移不變，只需把索引中的檔名換成分段檔
+        for index in (self._by_target, self._by_executor):
+            for key, positions in index.items():
+                index[key] = [(segment_path if path == self.path else path, offset) for path, offset in positions]
+
+    def compact(self):
+        """將合併封存檔與所有分段檔合併成新的封存檔，並移除損壞的行。"""
+        sources = ([self.archive_path] if os.path.exists(self.archive_path) else []) + self._sealed_segments()
+        temp_path = self.archive_path + '.tmp'
+        with open(temp_path, 'wb') as out:
+            for path in sources:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        try:
+                            json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        out.write(line if line.endswith(b"\n") else line + b"\n")
+        os.replace(temp_path, self.archive_path)
+        for path in sources:
+            if path != self.archive_path:
+                os.remove(path)
+        self._rebuild_index()
+
+    # --- 查詢 ---
+    def __len__(self):
+        return self._count
+
+    def by_target(self, target_id) -> list:
+        """回傳指定目標 ID 的所有操作紀錄 (依時間排序)。"""
+        return self._read(self._by_target.get(str(target_id), []))
+
+    def by_executor(self, executor_id) -> list:
+        """回傳指定執行者 ID 的所有操作紀錄 (依時間排序)。"""
+        return self._read(self._by_executor.get(str(executor_id), []))
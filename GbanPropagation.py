@@ -0,0 +1,158 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+import discord
+
+from RaidEnforcement import BULK_BAN_BATCH_SIZE, call_with_retries
+
+# 同時處理的伺服器數量
+PROPAGATION_GUILD_CONCURRENCY = 3
+# 同一伺服器兩批 bulk_ban 之間的間隔 (秒)
+PROPAGATION_BATCH_PAUSE = 1.0
+
+
+@dataclass
+class GuildPropagationResult:
+    guild_id: int
+    guild_name: str
+    matched: int = 0
+    checked: int = 0
+    banned: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    batches: int = 0
+
+
+@dataclass
+class PropagationReport:
+    results: list = field(default_factory=list)
+
+    @property
+    def banned(self) -> int:
+        return sum(result.banned for result in self.results)
+
+    @property
+    def failed(self) -> int:
+        return sum(result.failed for result in self.results)
+
+    @property
+    def matched(self) -> int:
+        return sum(result.matched for result in self.results)
+
+
+def find_blacklisted_members(guild: discord.Guild, blacklist, user_ids: Optional[Iterable[int]] = None) -> tuple:
+    """找出伺服器中在黑名單上的成員，回傳 (成員, 檢查的數量)。
+
+    指定 user_ids 時只檢查這些 ID (例如剛加入黑名單的用戶)；否則從黑名單與成員
+    兩者中較小的一方開始比對：黑名單較小時逐一 get_member，成員較少時才掃描成員。
+    """
+    if user_ids is None:
+        member_count = guild.member_count or len(guild.members)
+        if len(blacklist) > member_count:
+            members = [member for member in guild.members if member.id in blacklist]
+            return members, member_count
+        user_ids = [user_id for user_id, _ in blacklist.items()]
+
+    user_ids = list(user_ids)
+    members = (guild.get_member(user_id) for user_id in user_ids)
+    return [member for member in members if member is not None and member.id in blacklist], len(user_ids)
+
+
+async def propagate_guild(guild: discord.Guild, members: list, blacklist, reason_prefix: str,
+                          checked: int = 0) -> GuildPropagationResult:
+    """以 bulk_ban 封鎖單一伺服器中的黑名單成員 (依封鎖原因分組，每批最多 200 人)。"""
+    result = GuildPropagationResult(guild.id, guild.name, matched=len(members), checked=checked)
+    if not members:
+        return result
+
+    by_reason = defaultdict(list)
+    for member in members:
+        by_reason[(blacklist.get(member.id) or {}).get('reason', '未提供原因')].append(member)
+
+    for reason, group in by_reason.items():
+        for start in range(0, len(group), BULK_BAN_BATCH_SIZE):
+            batch = group[start:start + BULK_BAN_BATCH_SIZE]
+            if result.batches:
+                await asyncio.sleep(PROPAGATION_BATCH_PAUSE)
+            result.batches += 1
+            try:
+                ban_result = await call_with_retries(
+                    lambda: guild.bulk_ban(batch, reason=f"{reason_prefix} 原因: {reason}"[:512])
+                )
+            except discord.Forbidden:
+                result.failed += len(batch)
+                result.error = "權限不足"
+                return result
+            except discord.HTTPException as e:
+                result.failed += len(batch)
+                result.error = str(e)
+                continue
+            result.banned += len(ban_result.banned)
+            result.failed += len(ban_result.failed)
+    return result
+
+
+async def propagate_bans(guilds: Iterable[discord.Guild], blacklist, reason_prefix: str,
+                         user_ids: Optional[Iterable[int]] = None, skip_ids: Iterable[int] = (),
+                         watermarks: Optional[dict] = None,
+                         concurrency: int = PROPAGATION_GUILD_CONCURRENCY,
+                         progress: Callable[[GuildPropagationResult, int, int], Awaitable[None]] = None
+                         ) -> PropagationReport:
+    """在所有伺服器中封鎖黑名單成員，伺服器之間以 concurrency 限制並行數。
+
+    提供 watermarks ({str(guild_id): 黑名單版本}) 時為增量同步：有水位的伺服器只檢查
+    上次同步後新增的黑名單用戶，全部成功後將水位更新為目前的黑名單版本。
+    每完成一個伺服器會呼叫 progress(結果, 已完成數, 總數)。
+    """
+    guilds = list(guilds)
+    user_ids = list(user_ids) if user_ids is not None else None
+    skip_ids = set(skip_ids)
+    semaphore = asyncio.Semaphore(concurrency)
+    report = PropagationReport()
+    # 只有完整比對 (沒有指定 user_ids) 時才能推進水位
+    version = blacklist.version if watermarks is not None and user_ids is None else None
+
+    async def run(guild):
+        async with semaphore:
+            guild_user_ids = user_ids
+            if version is not None and str(guild.id) in watermarks:
+                guild_user_ids = blacklist.added_since(watermarks[str(guild.id)])
+            members, checked = find_blacklisted_members(guild, blacklist, guild_user_ids)
+            members = [member for member in members if member.id not in skip_ids and member.id != guild.owner_id]
+            result = await propagate_guild(guild, members, blacklist, reason_prefix, checked=checked)
+        if version is not None and result.error is None and not result.failed:
+            watermarks[str(guild.id)] = version
+        report.results.append(result)
+        if progress is not None:
+            try:
+                await progress(result, len(report.results), len(guilds))
+            except Exception as e:
+                # 回報進度失敗不應中斷其他伺服器的同步
+                print(f"回報同步進度時發生錯誤: {e}")
+
+    await asyncio.gather(*(run(guild) for guild in guilds))
+    return report
+
+
+def format_report(report: PropagationReport, limit: int = 3800) -> str:
+    """將有成員被封鎖或發生錯誤的伺服器整理成文字 (超過長度時截斷)。"""
+    lines = []
+    for result in sorted(report.results, key=lambda r: (-r.matched, r.guild_name)):
+        if not result.matched and not result.error:
+            continue
+        line = f"• **{result.guild_name}**：封鎖 {result.banned}/{result.matched}"
+        if result.failed:
+            line += f"，失敗 {result.failed}"
+        if result.error:
+            line += f" ({result.error})"
+        lines.append(line)
+
+    text = ""
+    for index, line in enumerate(lines):
+        if len(text) + len(line) + 1 > limit:
+            text += f"…另有 {len(lines) - index} 個伺服器"
+            break
+        text += line + "\n"
+    return text or "沒有伺服器中有需要封鎖的黑名單成員。"
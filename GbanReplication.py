@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import time
+from array import array
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+# 同步設定檔 (本機實例 ID、共享 token、其他實例的網址與讀取進度)
+REPLICATION_FILE = 'gban_replication.json'
+# 黑名單變更紀錄 (只附加，每行一筆變更)
+DELTA_LOG_FILE = 'gban_deltas.jsonl'
+# 每隔多久 (秒) 向其他實例拉取新的變更
+REPLICATION_POLL_SECONDS = 5
+# 每次請求最多回傳的變更數
+REPLICATION_PAGE_SIZE = 500
+# 向其他實例請求的逾時 (秒)
+REPLICATION_TIMEOUT_SECONDS = 10
+# 其他實例驗證身分用的標頭
+TOKEN_HEADER = 'X-Gban-Token'
+# HTTP 路徑
+DELTAS_ROUTE = '/gban/deltas'
+
+
+def load_replication_config():
+    """從 JSON 檔案載入同步設定，第一次使用時產生本機實例 ID。"""
+    try:
+        with open(REPLICATION_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    config.setdefault('instance_id', secrets.token_hex(4))
+    config.setdefault('token', '')
+    config.setdefault('peers', [])
+    config.setdefault('cursors', {})
+    return config
+
+def save_replication_config(config):
+    """將同步設定儲存到 JSON 檔案。"""
+    with open(REPLICATION_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
+
+
+class DeltaLog:
+    """只附加的黑名單變更紀錄。
+
+    每筆變更為 {"origin": 實例 ID, "seq": 該實例的變更序號, "ts": 時間, "op": "add"/"remove", ...}，
+    本機收到的順序即為 lsn (從 1 開始)，其他實例以 lsn 記錄讀取進度，只取得之後的變更。
+    記憶體中只保存每行的位移，回傳變更時直接從檔案讀取。
+    """
+
+    def __init__(self, path: str = DELTA_LOG_FILE):
+        self.path = path
+        self._offsets = array('Q')
+        # 每個實例已套用的最大序號 (版本向量)
+        self.versions = {}
+        # 每位用戶最後一次變更的 (ts, origin)，以「最後寫入者獲勝」解決衝突
+        self.clocks = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            offset = 0
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                except json.JSONDecodeError:
+                    # 寫入中斷造成的不完整行 (只可能是最後一行)，截斷後繼續使用
+                    f.truncate(offset)
+                    break
+                self._offsets.append(offset)
+                self._track(delta)
+                offset += len(line)
+
+    def _track(self, delta: dict):
+        origin = delta['origin']
+        self.versions[origin] = max(self.versions.get(origin, 0), delta['seq'])
+        stamp = (delta['ts'], origin)
+        for user_id in delta_user_ids(delta):
+            if stamp > self.clocks.get(user_id, (0, '')):
+                self.clocks[user_id] = stamp
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, delta: dict) -> int:
+        """附加一筆變更，回傳其 lsn。"""
+        line = (json.dumps(delta, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(self.path, 'ab') as f:
+            self._offsets.append(f.tell())
+            f.write(line)
+        self._track(delta)
+        return len(self._offsets)
+
+    def read_after(self, lsn: int, limit: int = REPLICATION_PAGE_SIZE) -> list:
+        """回傳 lsn 之後的最多 limit 筆變更。"""
+        if lsn >= len(self._offsets):
+            return []
+        deltas = []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[max(lsn, 0)])
+            for line in f:
+                deltas.append(json.loads(line))
+                if len(deltas) >= limit:
+                    break
+        return deltas
+
+
+def delta_user_ids(delta: dict) -> list:
+    if delta['op'] == 'add':
+        return list(delta['entries'])
+    return list(delta['user_ids'])
+
+
+class BlacklistReplicator:
+    """以變更紀錄在多個實例之間同步全域黑名單。
+
+    本機的新增/移除寫成一筆變更；其他實例定期以 GET /gban/deltas?after=<lsn> 拉取之後的變更，
+    依 (origin, seq) 去除已套用的變更、依 (ts, origin) 決定同一用戶的新舊，
+    套用後也寫入自己的紀錄，讓變更可以經由中間的實例轉送。
+    """
+
+    def __init__(self, blacklist, config: Optional[dict] = None, log_path: str = DELTA_LOG_FILE):
+        self.blacklist = blacklist
+        self.config = config if config is not None else load_replication_config()
+        self.instance_id = self.config['instance_id']
+        self.log = DeltaLog(log_path)
+        self._session = None
+        self.last_errors = {}
+        self.applied = 0
+
+        # 第一次啟用時將現有的黑名單寫成一筆快照，其他實例才會收到啟用前的資料
+        if not len(self.log) and len(blacklist):
+            self.record_add({user_id: data for user_id, data in blacklist.items()})
+        save_replication_config(self.config)
+
+    @property
+    def peers(self) -> list:
+        return self.config['peers']
+
+    # --- 本機變更 ---
+    def _record(self, delta: dict):
+        delta.update({
+            'origin': self.instance_id,
+            'seq': self.log.versions.get(self.instance_id, 0) + 1,
+            'ts': time.time(),
+        })
+        self.log.append(delta)
+
+    def record_add(self, entries: dict):
+        """記錄本機新增的用戶 ({user_id: 資料})，呼叫前黑名單應已寫入。"""
+        if entries:
+            self._record({'op': 'add', 'entries': {
+                str(user_id): {key: value for key, value in data.items() if key != 'seq'}
+                for user_id, data in entries.items()
+            }})
+
+    def record_remove(self, user_ids: list):
+        """記錄本機移除的用戶，呼叫前黑名單應已移除。"""
+        if user_ids:
+            self._record({'op': 'remove', 'user_ids': [str(user_id) for user_id in user_ids]})
+
+    # --- 套用其他實例的變更 ---
+    def apply(self, delta: dict, save: bool = True) -> int:
+        """套用一筆其他實例的變更，回傳實際改變的用戶數；已套用過的變更直接略過。
+
+        save=False 時不寫入黑名單檔案，由呼叫者套用完一批後再寫入。
+        """
+        origin = delta['origin']
+        if delta['seq'] <= self.log.versions.get(origin, 0):
+            return 0
+
+        stamp = (delta['ts'], origin)
+        # 只套用比本機已知的變更更新的用戶
+        newer = [user_id for user_id in delta_user_ids(delta) if stamp > self.log.clocks.get(user_id, (0, ''))]
+        changed = 0
+        if delta['op'] == 'add':
+            entries = {int(user_id): dict(delta['entries'][user_id]) for user_id in newer}
+            changed = len(entries)
+            if entries:
+                self.blacklist.add_many(entries, save=save)
+        else:
+            user_ids = [int(user_id) for user_id in newer if int(user_id) in self.blacklist]
+            changed = len(user_ids)
+            if user_ids:
+                self.blacklist.remove_many(user_ids, save=save)
+
+        self.log.append(delta)
+        self.applied += changed
+        return changed
+
+    async def pull(self, peer: str) -> int:
+        """從一個實例拉取並套用所有新的變更，回傳改變的用戶數。"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REPLICATION_TIMEOUT_SECONDS))
+        cursors = self.config['cursors']
+        changed = 0
+        while True:
+            params = {'after': cursors.get(peer, 0), 'limit': REPLICATION_PAGE_SIZE}
+            async with self._session.get(peer.rstrip('/') + DELTAS_ROUTE, params=params,
+                                         headers={TOKEN_HEADER: self.config['token']}) as response:
+                response.raise_for_status()
+                page = await response.json()
+            page_changed = 0
+            try:
+                for delta in page['deltas']:
+                    page_changed += self.apply(delta, save=False)
+            finally:
+                if page_changed:
+                    # 每頁只在背景執行緒寫入一次黑名單檔案
+                    await self.blacklist.save_async()
+            changed += page_changed
+            cursors[peer] = page['next']
+            if not page['more']:
+                break
+        save_replication_config(self.config)
+        return changed
+
+    async def pull_all(self) -> int:
+        """向所有設定的實例拉取變更，單一實例失敗不影響其他實例。"""
+        changed = 0
+        for peer in self.peers:
+            try:
+                changed += await self.pull(peer)
+                self.last_errors.pop(peer, None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                self.last_errors[peer] = str(e) or type(e).__name__
+        return changed
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    # --- HTTP ---
+    async def handle_deltas(self, request: web.Request) -> web.Response:
+        """GET /gban/deltas?after=<lsn>&limit=<n>：回傳本機紀錄中 lsn 之後的變更。"""
+        token = self.config['token']
+        # 沒有設定 token 時不開放同步，避免任何人都能讀取黑名單
+        if not token or not secrets.compare_digest(request.headers.get(TOKEN_HEADER, ''), token):
+            return web.json_response({'error': 'forbidden'}, status=403)
+        try:
+            after = max(int(request.query.get('after', 0)), 0)
+            limit = min(max(int(request.query.get('limit', REPLICATION_PAGE_SIZE)), 1), REPLICATION_PAGE_SIZE)
+        except ValueError:
+            return web.json_response({'error': 'invalid parameters'}, status=400)
+
+        if after > len(self.log):
+            # 本機紀錄比對方的進度還短 (紀錄被重建)，請對方從頭讀取；已套用的變更會依序號略過
+            after = 0
+        deltas = self.log.read_after(after, limit)
+        next_lsn = after + len(deltas)
+        return web.json_response({
+            'instance_id': self.instance_id,
+            'deltas': deltas,
+            'next': next_lsn,
+            'more': next_lsn < len(self.log),
+        })
+
+
+# --- 本機測試：以兩個 (或更多) 行程互相同步，不需要 Discord ---
+async def run_node(args, blacklist_index):
+    config = load_replication_config()
+    config['token'] = args.token
+    config['peers'] = args.peer
+    blacklist = blacklist_index()
+    replicator = BlacklistReplicator(blacklist, config)
+
+    app = web.Application()
+    app.router.add_get(DELTAS_ROUTE, replicator.handle_deltas)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+
+    for item in args.ban:
+        user_id, _, reason = item.partition(':')
+        data = {'reason': reason or '未提供原因', 'added_by': f'node-{replicator.instance_id}', 'timestamp': str(time.time())}
+        blacklist.add(int(user_id), data)
+        replicator.record_add({int(user_id): data})
+    for user_id in args.unban:
+        blacklist.remove(int(user_id))
+        replicator.record_remove([int(user_id)])
+
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        await asyncio.sleep(args.interval)
+        await replicator.pull_all()
+
+    await replicator.close()
+    await runner.cleanup()
+    print(json.dumps({
+        'instance_id': replicator.instance_id,
+        'ids': sorted(str(user_id) for user_id, _ in blacklist.items()),
+        'versions': replicator.log.versions,
+        'errors': replicator.last_errors,
+    }, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在本機執行一個黑名單同步節點 (測試用)。')
+    parser.add_argument('--dir', required=True, help='節點的資料目錄 (黑名單、變更紀錄)')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--peer', action='append', default=[], help='其他節點的網址，例如 http://127.0.0.1:9002')
+    parser.add_argument('--token', default='local-test')
+    parser.add_argument('--ban', action='append', default=[], help='啟動後加入黑名單的 ID[:原因]')
+    parser.add_argument('--unban', action='append', default=[], help='啟動後移除的 ID')
+    parser.add_argument('--seconds', type=float, default=5.0, help='執行多久後輸出結果並結束')
+    parser.add_argument('--interval', type=float, default=0.5, help='拉取間隔 (秒)')
+    args = parser.parse_args()
+
+    # 切換到資料目錄前先匯入 (黑名單與紀錄檔都以相對路徑讀寫)
+    from GlobalBan import BlacklistIndex
+    os.makedirs(args.dir, exist_ok=True)
+    os.chdir(args.dir)
+    asyncio.run(run_node(args, BlacklistIndex))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+import codecs
+import csv
+import io
+import json
+import tempfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+import aiohttp
+
+# Discord 用戶 ID (snowflake) 的合理範圍：最早的 ID 約為 17 位數，最多 20 位數
+MIN_USER_ID = 10 ** 15
+MAX_USER_ID = 2 ** 64 - 1
+# 匯入時每批寫入黑名單的用戶數 (每批只寫入一次檔案與一筆操作紀錄)
+IMPORT_BATCH_SIZE = 5000
+# 下載附件時每次讀取的大小 (bytes)
+IMPORT_CHUNK_BYTES = 64 * 1024
+# 匯出時 CSV 的欄位
+EXPORT_CSV_FIELDS = ('user_id', 'reason', 'added_by', 'timestamp')
+# 匯出檔案超過此大小 (bytes) 時改寫到磁碟上的暫存檔
+EXPORT_SPOOL_BYTES = 4 * 1024 * 1024
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+
+
+def parse_user_id(value) -> Optional[int]:
+    """將 ID 轉為 int，不是合理的 Discord 用戶 ID 時回傳 None。"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdigit():
+            return None
+    try:
+        user_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return user_id if MIN_USER_ID <= user_id <= MAX_USER_ID else None
+
+
+def guess_format(filename: str) -> Optional[str]:
+    """依副檔名判斷匯入格式 (.csv/.txt → csv，.json → json，.jsonl/.ndjson → jsonl)。"""
+    name = filename.lower()
+    if name.endswith(('.csv', '.txt')):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.json'):
+        return 'json'
+    return None
+
+
+def record_from_value(value, user_id=None) -> tuple:
+    """將 JSON 中的一筆資料轉為 (原始 ID, 資料)。
+
+    支援純 ID (數字或字串)、{"user_id"/"id": ..., "reason": ...}，
+    以及黑名單檔案格式 ({ID: {"reason": ...}}) 中的一個值。
+    """
+    if isinstance(value, dict):
+        if user_id is None:
+            user_id = value.get('user_id', value.get('id'))
+        return user_id, value
+    if user_id is None:
+        return value, {}
+    # {ID: "原因"} 的簡寫
+    return user_id, {'reason': value} if isinstance(value, str) else {}
+
+
+class CsvRecordParser:
+    """逐段餵入文字的 CSV 解析器。第一列的第一欄不是數字時視為標題列。
+
+    以完整的行為單位解析，欄位內的換行 (引號中的多行文字) 不支援。
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._columns = None
+
+    def _rows_to_records(self, lines: list) -> list:
+        records = []
+        for row in csv.reader(lines):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if self._columns is None:
+                self._columns = {}
+                if not row[0].strip().isdigit():
+                    self._columns = {name.strip().lower(): index for index, name in enumerate(row)}
+                    continue
+            id_column = self._columns.get('user_id', self._columns.get('id', 0))
+            reason_column = self._columns.get('reason', 1)
+            data = {}
+            if reason_column < len(row) and row[reason_column].strip():
+                data['reason'] = row[reason_column].strip()
+            records.append((row[id_column] if id_column < len(row) else None, data))
+        return records
+
+    def feed(self, text: str) -> list:
+        self._pending += text
+        lines = self._pending.split("\n")
+        self._pending = lines.pop()
+        return self._rows_to_records(lines)
+
+    def close(self) -> list:
+        lines, self._pending = [self._pending], ""
+        return self._rows_to_records(lines)
+
+
+class JsonLinesRecordParser:
+    """逐段餵入文字的 JSON Lines 解析器 (每行一個 ID 或物件)。"""
+
+    def __init__(self):
+        self._pending = ""
+        self.errors = 0
+
+    def _parse_lines(self, lines: list) -> list:
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(record_from_value(json.loads(line)))
+            except json.JSONDecodeError:
+                self.errors += 1
+        return records
+
+    def feed(self, text: str) -> list:
+        self._pending += text
+        lines = self._pending.split("\n")
+        self._pending = lines.pop()
+        return self._parse_lines(lines)
+
+    def close(self) -> list:
+        lines, self._pending = [self._pending], ""
+        return self._parse_lines(lines)
+
+
+class JsonRecordParser:
+    """逐段餵入文字的 JSON 解析器：頂層為陣列 ([ID 或物件, ...]) 或黑名單檔案格式的物件 ({ID: 資料})。
+
+    每次只解碼緩衝區中完整的元素，不需要把整個檔案載入成一個物件。
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._container = None
+        self._done = False
+
+    def _skip(self, position: int, separators: str = " \t\r\n") -> int:
+        while position < len(self._buffer) and self._buffer[position] in separators:
+            position += 1
+        return position
+
+    def _decode(self, position: int, final: bool):
+        """解碼一個值；資料不完整時回傳 None (值結尾剛好是緩衝區結尾時也等待更多資料，避免截斷數字)。"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        if end >= len(self._buffer) and not final:
+            return None
+        return value, end
+
+    def _parse(self, final: bool) -> list:
+        records = []
+        position = self._skip(0)
+        if self._container is None:
+            if position >= len(self._buffer):
+                return records
+            self._container = self._buffer[position]
+            if self._container not in '[{':
+                raise ValueError("JSON 檔案的頂層必須是陣列或物件。")
+            position += 1
+
+        closing = ']' if self._container == '[' else '}'
+        while not self._done:
+            position = self._skip(position, " \t\r\n,")
+            if position >= len(self._buffer):
+                break
+            if self._buffer[position] == closing:
+                self._done = True
+                break
+
+            if self._container == '[':
+                decoded = self._decode(position, final)
+                if decoded is None:
+                    break
+                value, position = decoded
+                records.append(record_from_value(value))
+                continue
+
+            decoded = self._decode(position, final)
+            if decoded is None:
+                break
+            key, key_end = decoded
+            colon = self._skip(key_end)
+            if colon >= len(self._buffer):
+                if final:
+                    raise ValueError("JSON 檔案不完整。")
+                break
+            if self._buffer[colon] != ':':
+                raise ValueError("JSON 物件格式錯誤。")
+            decoded = self._decode(self._skip(colon + 1), final)
+            if decoded is None:
+                break
+            value, position = decoded
+            records.append(record_from_value(value, key))
+
+        self._buffer = self._buffer[position:]
+        return records
+
+    def feed(self, text: str) -> list:
+        self._buffer += text
+        return self._parse(final=False)
+
+    def close(self) -> list:
+        records = self._parse(final=True)
+        if not self._done:
+            raise ValueError("JSON 檔案不完整。")
+        return records
+
+
+def make_parser(fmt: str):
+    if fmt == 'csv':
+        return CsvRecordParser()
+    if fmt == 'jsonl':
+        return JsonLinesRecordParser()
+    return JsonRecordParser()
+
+
+async def iter_import_records(chunks, fmt: str):
+    """將附件的 bytes 區塊 (非同步迭代器) 逐段解碼並解析，逐筆產生 (原始 ID, 資料)。"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    parser = make_parser(fmt)
+    async for chunk in chunks:
+        for record in parser.feed(decoder.decode(chunk)):
+            yield record
+    for record in parser.feed(decoder.decode(b"", final=True)) + parser.close():
+        yield record
+
+
+async def iter_attachment_chunks(url: str):
+    """以串流方式下載附件，逐段產生 bytes (不會一次把整個檔案讀入記憶體)。"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(IMPORT_CHUNK_BYTES):
+                yield chunk
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    added: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    existing: int = 0
+    batches: int = 0
+
+
+async def import_records(records, blacklist, defaults: dict,
+                         on_batch: Callable[[dict, ImportStats], Awaitable[None]] = None) -> ImportStats:
+    """驗證、去除重複後分批寫入黑名單 (每批 IMPORT_BATCH_SIZE 人，只寫入一次檔案)。
+
+    defaults 為檔案中沒有提供時使用的 reason / added_by / timestamp；
+    每寫入一批會呼叫 on_batch(該批資料, 統計)，例如寫入一筆操作紀錄並更新進度。
+    """
+    stats = ImportStats()
+    seen = set()
+    batch = {}
+
+    async def commit():
+        # 檔案在背景執行緒寫入，大型黑名單不會阻塞事件迴圈
+        blacklist.add_many(batch, save=False)
+        await blacklist.save_async()
+        stats.added += len(batch)
+        stats.batches += 1
+        if on_batch is not None:
+            await on_batch(dict(batch), stats)
+        batch.clear()
+
+    async for raw_id, data in records:
+        stats.read += 1
+        user_id = parse_user_id(raw_id)
+        if user_id is None:
+            stats.invalid += 1
+            continue
+        if user_id in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(user_id)
+        if user_id in blacklist:
+            stats.existing += 1
+            continue
+
+        batch[user_id] = {
+            'reason': str(data.get('reason') or defaults['reason'])[:512],
+            'added_by': str(data.get('added_by') or defaults['added_by']),
+            'timestamp': str(data.get('timestamp') or defaults['timestamp']),
+        }
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await commit()
+
+    if batch:
+        await commit()
+    return stats
+
+
+def write_export(f, entries: Iterable[tuple], fmt: str) -> int:
+    """將 (用戶 ID, 資料) 逐筆寫入已開啟的文字檔，回傳寫入的筆數。
+
+    json 格式與 global_blacklist.json 相同 ({ID: 資料})，可直接再匯入。
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_CSV_FIELDS)
+        for user_id, data in entries:
+            writer.writerow([user_id] + [data.get(name, '') for name in EXPORT_CSV_FIELDS[1:]])
+            count += 1
+        return count
+
+    f.write("{")
+    for user_id, data in entries:
+        data = {key: value for key, value in data.items() if key != 'seq'}
+        f.write(("\n" if not count else ",\n") + f"    {json.dumps(str(user_id))}: {json.dumps(data, ensure_ascii=False)}")
+        count += 1
+    f.write("\n}\n")
+    return count
+
+
+def export_to_file(entries: Iterable[tuple], fmt: str):
+    """逐筆寫入暫存檔 (較小時留在記憶體，超過 EXPORT_SPOOL_BYTES 才寫到磁碟)，回傳 (檔案, 筆數)。"""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+    count = write_export(text, entries, fmt)
+    text.flush()
+    text.detach()
+    spool.seek(0)
+    return spool, count
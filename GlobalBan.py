@@ -1,48 +1,211 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import json
 import datetime
 import asyncio
+import os
+import threading
+import aiohttp
+from bisect import bisect_right
 from typing import Optional
 
+from CompactBlacklist import (CompactBlacklist, build_compact_blacklist, install_compact_blacklist,
+                              remove_compact_blacklist)
+from GbanHistory import HistoryLog
+from GbanPropagation import format_report, propagate_bans, propagate_guild
+from GbanReplication import REPLICATION_POLL_SECONDS, BlacklistReplicator
+from GbanTransfer import (IMPORT_FORMATS, export_to_file, guess_format, import_records,
+                          iter_attachment_chunks, iter_import_records)
+from JoinPipeline import STAGE_BLACKLIST, get_join_pipeline
+from UserProfileCache import UserProfileCache
+
 # --- 設定部分 ---
 BLACKLIST_FILE = 'global_blacklist.json'
-HISTORY_FILE = 'gban_history.json'
+# 各伺服器最後同步到的黑名單版本 (增量同步用)
+SYNC_STATE_FILE = 'gban_sync_state.json'
+# 每隔多久 (秒) 檢查黑名單檔案是否被外部修改
+BLACKLIST_POLL_SECONDS = 10
+# /gban propagate 進度訊息的最短更新間隔 (秒)
+PROPAGATION_PROGRESS_INTERVAL = 2.0
+# /gban history 一次最多顯示的紀錄數 (Embed 最多 25 個欄位)
+HISTORY_EMBED_LIMIT = 25
+# /gban list 每頁顯示的用戶數
+LIST_PAGE_SIZE = 10
+# /gban list 翻頁按鈕的有效時間 (秒)
+LIST_VIEW_TIMEOUT = 300
+# /gban list 每頁內容的長度上限 (Embed description 最多 4096 字，3800 較安全)
+LIST_DESCRIPTION_LIMIT = 3800
+# /gban list 每個欄位顯示的長度上限 (每頁 10 人時總長度不會超過上限)
+LIST_REASON_LIMIT = 150
+LIST_FIELD_LIMIT = 64
+# 可執行影響所有伺服器的指令 (propagate、import、shared load/clear) 的伺服器 ID；
+# 機器人擁有者在任何伺服器都可以執行，其他伺服器的管理員只能使用只影響自己伺服器的指令
+TRUSTED_GUILD_IDS = set()
 
 # --- 資料處理函數 ---
 # 這些函數需要從 GlobalBan 類別中分離出來，作為輔助函數
 
-def load_blacklist():
+def load_blacklist(path: str = BLACKLIST_FILE):
     """從 JSON 檔案載入黑名單數據。"""
     try:
-        with open(BLACKLIST_FILE, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
     except json.JSONDecodeError:
-        print(f"警告：{BLACKLIST_FILE} 檔案內容無效，已創建空黑名單。")
+        print(f"警告：{path} 檔案內容無效，已創建空黑名單。")
         return {}
 
-def save_blacklist(data):
-    """將黑名單數據儲存到 JSON 檔案。"""
-    with open(BLACKLIST_FILE, 'w', encoding='utf-8') as f:
+def save_blacklist(data, path: str = BLACKLIST_FILE):
+    """將黑名單數據儲存到 JSON 檔案 (先寫入暫存檔再取代，避免寫入中斷損壞黑名單)。"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(temp_path, path)
 
-def load_history():
-    """從 JSON 檔案載入操作紀錄。"""
+def load_sync_state():
+    """從 JSON 檔案載入各伺服器的同步水位 ({guild_id: 黑名單版本})。"""
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+        with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        return []
+        return {}
+
+def save_sync_state(data):
+    """將各伺服器的同步水位儲存到 JSON 檔案。"""
+    with open(SYNC_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
 
-def log_action(log_entry):
-    """將操作紀錄新增到歷史紀錄檔案。"""
-    history_data = load_history()
-    history_data.append(log_entry)
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history_data, f, indent=4, ensure_ascii=False)
+class BlacklistIndex:
+    """全域黑名單的記憶體索引 (以 int 用戶 ID 為鍵)。
+
+    查詢只讀記憶體，不會碰到磁碟；檔案只在修改時間或大小改變時才重新解析。
+    透過此索引寫入時會同步更新記錄的檔案狀態，不會觸發自己的重新載入。
+    檔案格式維持不變 (字串 ID 為鍵的 JSON)，每筆資料另外記錄遞增的 seq，
+    version 為目前最大的 seq，可用 added_since() 取得某個版本之後新增的用戶。
+    大量寫入 (匯入、同步) 以 save_async() 在背景執行緒寫檔，不阻塞事件迴圈。
+    """
+
+    def __init__(self, path: str = BLACKLIST_FILE):
+        self.path = path
+        self._entries = {}
+        # 依 seq 排序的 (seq, user_id)，用二分搜尋找出某版本之後新增的用戶
+        self._seqs = []
+        self._seq_ids = []
+        self.version = 0
+        self._signature = None
+        # 寫檔在背景執行緒進行時依序寫入，且不會以較舊的快照覆蓋較新的檔案
+        self._write_lock = threading.Lock()
+        self._generation = 0
+        self._written_generation = 0
+        self._pending_writes = 0
+        self.refresh(force=True)
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self, force: bool = False) -> bool:
+        """檔案有變更時重新載入，回傳是否重新載入。"""
+        if not force and self._pending_writes:
+            # 背景寫檔尚未完成，檔案內容可能比記憶體舊
+            return False
+        signature = self._stat_signature()
+        if not force and signature == self._signature:
+            return False
+        self._entries = {int(user_id): data for user_id, data in load_blacklist(self.path).items()}
+        self._signature = signature
+
+        # 沒有 seq 的資料 (舊版檔案或手動編輯新增) 視為新的資料，補上 seq 後寫回
+        self.version = max((data.get('seq', 0) for data in self._entries.values()), default=0)
+        missing = [data for data in self._entries.values() if 'seq' not in data]
+        for data in missing:
+            self.version += 1
+            data['seq'] = self.version
+        if missing:
+            self.save()
+
+        ordered = sorted((data['seq'], user_id) for user_id, data in self._entries.items())
+        self._seqs = [seq for seq, _ in ordered]
+        self._seq_ids = [user_id for _, user_id in ordered]
+        return True
+
+    def _snapshot(self) -> tuple:
+        self._generation += 1
+        return {str(user_id): data for user_id, data in self._entries.items()}, self._generation
+
+    def _write(self, data: dict, generation: int):
+        with self._write_lock:
+            if generation <= self._written_generation:
+                # 已有較新的快照寫入
+                return
+            save_blacklist(data, self.path)
+            self._written_generation = generation
+            self._signature = self._stat_signature()
+
+    def save(self):
+        self._write(*self._snapshot())
+
+    async def save_async(self):
+        """在背景執行緒寫入檔案 (快照在事件迴圈中建立，之後的修改不影響這次寫入)。"""
+        data, generation = self._snapshot()
+        self._pending_writes += 1
+        try:
+            await asyncio.to_thread(self._write, data, generation)
+        finally:
+            self._pending_writes -= 1
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[dict]:
+        return self._entries.get(user_id)
+
+    def items(self):
+        return self._entries.items()
+
+    def added_since(self, version: int) -> list:
+        """回傳 seq 大於 version 且仍在黑名單中的用戶 ID。"""
+        start = bisect_right(self._seqs, version)
+        return [user_id for seq, user_id in zip(self._seqs[start:], self._seq_ids[start:])
+                if user_id in self._entries and self._entries[user_id]['seq'] == seq]
+
+    def add(self, user_id: int, data: dict):
+        self.version += 1
+        data['seq'] = self.version
+        self._entries[user_id] = data
+        self._seqs.append(self.version)
+        self._seq_ids.append(user_id)
+        self.save()
+
+    def add_many(self, entries: dict, save: bool = True):
+        """一次加入多位用戶 ({user_id: 資料})，只寫入一次檔案；save=False 時由呼叫者稍後以 save_async() 寫入。"""
+        for user_id, data in entries.items():
+            self.version += 1
+            data['seq'] = self.version
+            self._entries[user_id] = data
+            self._seqs.append(self.version)
+            self._seq_ids.append(user_id)
+        if save:
+            self.save()
+
+    def remove(self, user_id: int):
+        self._entries.pop(user_id, None)
+        self.save()
+
+    def remove_many(self, user_ids: list, save: bool = True):
+        """一次移除多位用戶，只寫入一次檔案；save=False 時由呼叫者稍後以 save_async() 寫入。"""
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        if save:
+            self.save()
 
 # -----------------------------------------------------------
 # --- GlobalBan Cog 核心邏輯 (已轉換為斜線指令) ---
@@ -53,29 +216,91 @@ class GlobalBan(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.global_blacklist = load_blacklist()
-        print(f'✅ GlobalBan Cog 載入成功，目前全域黑名單中有 {len(self.global_blacklist)} 位用戶。')
-
-    # --- 事件監聽 (用於自動封鎖新加入的黑名單用戶) ---
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        """當新成員加入伺服器時，檢查是否在全域黑名單中，並自動封鎖。"""
-        user_id_str = str(member.id)
-        
-        # 由於是事件，我們需要隨時檢查最新的黑名單
-        self.global_blacklist = load_blacklist()
-
-        if user_id_str in self.global_blacklist:
-            reason = self.global_blacklist[user_id_str].get('reason', '未提供原因')
-            print(f'🚨 黑名單用戶加入: {member.name} ({user_id_str})，執行自動封鎖。')
+        self.global_blacklist = BlacklistIndex()
+        # 只附加的操作紀錄 (依目標與執行者建立索引)
+        self.history = HistoryLog()
+        # 各伺服器最後同步到的黑名單版本 ({str(guild_id): version})
+        self.sync_state = load_sync_state()
+        # 用戶名稱的持久化快取 (供 /gban list 顯示)
+        self.user_cache = UserProfileCache(bot)
+        # 社群共享的大型黑名單 (唯讀、記憶體映射，只用於檢查與封鎖)
+        self.shared_blacklist = CompactBlacklist()
+        # 與其他機器人實例同步黑名單的變更紀錄
+        self.replication = BlacklistReplicator(self.global_blacklist)
+        print(f'✅ GlobalBan Cog 載入成功，目前全域黑名單中有 {len(self.global_blacklist)} 位用戶，共享黑名單中有 {len(self.shared_blacklist)} 位用戶。')
+
+    async def cog_load(self):
+        # 黑名單檢查是加入流程的第一個階段
+        get_join_pipeline(self.bot).register(STAGE_BLACKLIST, 'GlobalBan', self.check_blacklist_on_join)
+        self.watch_blacklist_file.start()
+        self.replicate_blacklist.start()
+
+    async def cog_unload(self):
+        get_join_pipeline(self.bot).unregister('GlobalBan')
+        self.watch_blacklist_file.cancel()
+        self.shared_blacklist.close()
+        self.replicate_blacklist.cancel()
+        await self.replication.close()
+
+    async def is_trusted(self, interaction: discord.Interaction) -> bool:
+        """是否可執行影響所有伺服器的操作 (機器人擁有者或信任的伺服器)。"""
+        return interaction.guild_id in TRUSTED_GUILD_IDS or await self.bot.is_owner(interaction.user)
+
+    async def ensure_trusted(self, interaction: discord.Interaction) -> bool:
+        """檢查是否可執行影響所有伺服器的指令，否則回覆錯誤。"""
+        if await self.is_trusted(interaction):
+            return True
+        await interaction.response.send_message(
+            "❌ 此指令會影響機器人所在的所有伺服器，只有機器人擁有者或信任的伺服器可以使用。", ephemeral=True
+        )
+        return False
+
+    @staticmethod
+    async def edit_or_send(interaction: discord.Interaction, message: discord.WebhookMessage, content=None, embed=None):
+        """以結果取代進度訊息；進度訊息已無法編輯時改為發送新訊息。"""
+        try:
+            await message.edit(content=content, embed=embed)
+        except discord.HTTPException:
+            await interaction.followup.send(content=content, embed=embed)
+
+    @tasks.loop(seconds=BLACKLIST_POLL_SECONDS)
+    async def watch_blacklist_file(self):
+        """檔案被外部修改 (例如手動編輯) 時才重新載入黑名單。"""
+        if self.global_blacklist.refresh():
+            print(f'🔄 偵測到 {BLACKLIST_FILE} 變更，已重新載入 {len(self.global_blacklist)} 位黑名單用戶。')
+        if self.shared_blacklist.refresh():
+            print(f'🔄 偵測到共享黑名單變更，已重新載入 {len(self.shared_blacklist)} 位用戶。')
+
+    @tasks.loop(seconds=REPLICATION_POLL_SECONDS)
+    async def replicate_blacklist(self):
+        """向其他實例拉取新的黑名單變更 (沒有設定其他實例時不做任何事)。"""
+        if self.replication.peers and await self.replication.pull_all():
+            print(f'🔄 已從其他實例同步黑名單變更，目前共有 {len(self.global_blacklist)} 位黑名單用戶。')
+
+    # --- 加入流程階段 (用於自動封鎖新加入的黑名單用戶) ---
+    async def check_blacklist_on_join(self, member: discord.Member) -> bool:
+        """當新成員加入伺服器時，檢查是否在全域黑名單中，並自動封鎖。回傳 False 表示已拒絕此成員。"""
+        # 只查詢記憶體索引 (檔案變更由 watch_blacklist_file 負責重新載入)
+        entry = self.global_blacklist.get(member.id)
+        prefix = "[全域黑名單自動封鎖]"
+        if entry is None:
+            # 共享黑名單：記憶體映射陣列的二分搜尋，命中時才讀取原因
+            entry = self.shared_blacklist.get(member.id)
+            prefix = "[共享黑名單自動封鎖]"
+
+        if entry is not None:
+            reason = entry.get('reason', '未提供原因')
+            print(f'🚨 黑名單用戶加入: {member.name} ({member.id})，執行自動封鎖。')
             
             try:
-                await member.guild.ban(member, reason=f"[全域黑名單自動封鎖] 原因: {reason}")
+                await member.guild.ban(member, reason=f"{prefix} 原因: {reason}")
                 
             except discord.Forbidden:
                 print(f'❌ 權限不足，無法在伺服器 {member.guild.name} 中封鎖用戶 {member.name}。')
             except Exception as e:
                 print(f'自動封鎖時發生錯誤: {e}')
+            return False
+        return True
 
     # --- 斜線指令群組 ---
     global_ban_group = app_commands.Group(name="gban", description="全域黑名單管理系統")
@@ -96,17 +321,18 @@ class GlobalBan(commands.Cog):
             
         await interaction.response.defer() # 預先回應，防止超時
         
-        if user_id in self.global_blacklist:
+        if user_id_int in self.global_blacklist:
             await interaction.followup.send(f'⚠️ 用戶 ID `{user_id}` 已經存在於黑名單中。')
             return
 
         # 1. 執行新增操作並儲存
-        self.global_blacklist[user_id] = {
+        ban_data = {
             'reason': reason,
             'added_by': str(interaction.user),
             'timestamp': str(datetime.datetime.now())
         }
-        save_blacklist(self.global_blacklist)
+        self.global_blacklist.add(user_id_int, ban_data)
+        self.replication.record_add({user_id_int: ban_data})
 
         # 2. 執行紀錄與追蹤 (日誌)
         executor = interaction.user
@@ -124,7 +350,7 @@ class GlobalBan(commands.Cog):
             },
             "ban_reason": reason
         }
-        log_action(log_entry)
+        self.history.append(log_entry)
         
         # 3. 創建 Embed 訊息 (美化回覆)
         embed_color = discord.Color.from_rgb(255, 0, 0) 
@@ -150,29 +376,34 @@ class GlobalBan(commands.Cog):
         
         await interaction.followup.send(embed=embed)
         
-        # 4. 執行本地同步封鎖 (新功能)
-        synced_count = 0
-        
-        # 遍歷當前伺服器的所有成員 (需要 Intents.members)
+        # 4. 同步封鎖：本伺服器同步整份黑名單，其他伺服器只封鎖剛加入黑名單的用戶
+        #    (只有機器人擁有者或信任的伺服器可以立即封鎖其他伺服器的成員，否則由加入時的黑名單檢查處理)
+        reason_prefix = "[全域黑名單同步封鎖]"
+        skip_ids = [self.bot.user.id]
+        trusted = await self.is_trusted(interaction)
+        report = None
+        if trusted:
+            other_guilds = [guild for guild in self.bot.guilds if guild.id != interaction.guild_id]
+            report = await propagate_bans(other_guilds, self.global_blacklist, reason_prefix,
+                                          user_ids=[user_id_int], skip_ids=skip_ids)
+
         if interaction.guild:
-            # 確保我們有最新的黑名單 ID 集合
-            blacklist_ids = set(self.global_blacklist.keys())
-            
-            for member in interaction.guild.members:
-                member_id_str = str(member.id)
-                
-                if member_id_str in blacklist_ids and member.id != self.bot.user.id:
-                    try:
-                        ban_reason = self.global_blacklist[member_id_str].get('reason', '未提供原因')
-                        await interaction.guild.ban(member, reason=f"[全域黑名單同步封鎖] 原因: {ban_reason}")
-                        synced_count += 1
-                    except Exception:
-                        pass # 忽略權限不足或其他錯誤
-
-            sync_msg = f"🔨 **本地同步完成：** 已在伺服器 `{interaction.guild.name}` 封鎖了 **{synced_count}** 位存在於全域黑名單中的用戶（包括剛才的目標用戶）。"
+            # 增量同步：只檢查此伺服器上次同步後新增的黑名單用戶 (包括剛才的目標用戶)
+            local = await propagate_bans([interaction.guild], self.global_blacklist, reason_prefix,
+                                         skip_ids=skip_ids, watermarks=self.sync_state)
+            save_sync_state(self.sync_state)
+            local_result = local.results[0]
+            sync_msg = f"🔨 **本地同步完成：** 已在伺服器 `{interaction.guild.name}` 封鎖了 **{local_result.banned}** 位存在於全域黑名單中的用戶（包括剛才的目標用戶）。"
+            if local_result.error:
+                sync_msg += f"\n⚠️ {local_result.error}"
         else:
             sync_msg = "ℹ️ 此指令無法在私訊中執行本地同步。"
 
+        if not trusted:
+            sync_msg += "\nℹ️ 其他伺服器會在此用戶加入時由黑名單檢查自動封鎖 (立即跨伺服器封鎖需要機器人擁有者或信任的伺服器)。"
+        elif report.matched:
+            sync_msg += f"\n🌐 **跨伺服器同步：** 另在 {len([r for r in report.results if r.banned])} 個伺服器封鎖了此用戶。\n{format_report(report, limit=1500)}"
+
         await interaction.followup.send(sync_msg)
 
 
@@ -190,13 +421,13 @@ class GlobalBan(commands.Cog):
             
         await interaction.response.defer() 
         
-        if user_id not in self.global_blacklist:
+        if user_id_int not in self.global_blacklist:
             await interaction.followup.send(f'⚠️ 用戶 ID `{user_id}` 不在黑名單中。')
             return
 
         # 執行移除操作
-        del self.global_blacklist[user_id]
-        save_blacklist(self.global_blacklist)
+        self.global_blacklist.remove(user_id_int)
+        self.replication.record_remove([user_id_int])
 
         # 記錄操作
         log_entry = {
@@ -209,7 +440,7 @@ class GlobalBan(commands.Cog):
                 "full_tag": str(interaction.user),
             },
         }
-        log_action(log_entry)
+        self.history.append(log_entry)
 
         # 創建 Embed 訊息
         embed_color = discord.Color.green() 
@@ -240,8 +471,9 @@ class GlobalBan(commands.Cog):
                 pass
 
     @global_ban_group.command(name='sync', description='[管理員指令] 手動在當前伺服器同步封鎖所有黑名單中的成員。')
+    @app_commands.describe(full='重新比對整份黑名單 (預設只檢查上次同步後新增的用戶)')
     @app_commands.default_permissions(administrator=True)
-    async def global_sync_cmd(self, interaction: discord.Interaction):
+    async def global_sync_cmd(self, interaction: discord.Interaction, full: bool = False):
         """手動掃描並在當前伺服器封鎖所有已存在於全域黑名單中的成員。"""
         
         if not interaction.guild:
@@ -250,137 +482,463 @@ class GlobalBan(commands.Cog):
 
         await interaction.response.defer()
         
-        self.global_blacklist = load_blacklist()
-        blacklist_ids = set(self.global_blacklist.keys())
-        synced_count = 0
+        self.global_blacklist.refresh()
         
         await interaction.followup.send("🔍 **開始本地同步：** 正在掃描伺服器中所有已列入全域黑名單的用戶...")
         
-        for member in interaction.guild.members:
-            member_id_str = str(member.id)
-            
-            if member_id_str in blacklist_ids and member.id != self.bot.user.id:
-                try:
-                    ban_reason = self.global_blacklist[member_id_str].get('reason', '未提供原因')
-                    await interaction.guild.ban(member, reason=f"[全域黑名單手動同步封鎖] 原因: {ban_reason}")
-                    synced_count += 1
-                except Exception:
-                    continue
+        if full:
+            self.sync_state.pop(str(interaction.guild_id), None)
+        report = await propagate_bans([interaction.guild], self.global_blacklist, "[全域黑名單手動同步封鎖]",
+                                      skip_ids=[self.bot.user.id], watermarks=self.sync_state)
+        save_sync_state(self.sync_state)
+        result = report.results[0]
+        synced_count = result.banned
         
-        if synced_count > 0:
+        if result.error:
+            await interaction.followup.send(f"❌ **同步失敗：** {result.error} (已封鎖 {synced_count}/{result.matched})")
+        elif synced_count > 0:
             await interaction.followup.send(
                 f"✅ **同步完成！** 伺服器 `{interaction.guild.name}` 成功封鎖了 **{synced_count}** 位存在於全域黑名單中的用戶。"
             )
         else:
             await interaction.followup.send(
-                f"ℹ️ **同步完成！** 伺服器 `{interaction.guild.name}` 中沒有發現需要封鎖的全域黑名單用戶。"
+                f"ℹ️ **同步完成！** 伺服器 `{interaction.guild.name}` 中沒有發現需要封鎖的全域黑名單用戶 (檢查了 {result.checked} 筆)。"
             )
 
-    @global_ban_group.command(name='history', description='[管理員指令] 查詢指定 ID 的黑名單歷史紀錄。')
-    @app_commands.describe(user_id='要查詢的用戶ID')
+    @global_ban_group.command(name='propagate', description='[管理員指令] 在機器人所在的所有伺服器同步封鎖黑名單成員。')
+    @app_commands.describe(full='重新比對整份黑名單 (預設每個伺服器只檢查上次同步後新增的用戶)')
     @app_commands.default_permissions(administrator=True)
-    async def global_history_cmd(self, interaction: discord.Interaction, user_id: str):
-        """查詢指定用戶 ID 的所有黑名單操作紀錄。"""
-        
-        await interaction.response.defer(ephemeral=True) 
-        
-        history_data = load_history()
-        related_logs = [
-            log for log in history_data if log.get('target_id') == user_id
-        ]
+    async def global_propagate_cmd(self, interaction: discord.Interaction, full: bool = False):
+        """在所有伺服器中找出黑名單成員並批次封鎖，逐一回報各伺服器的結果。"""
+        if not await self.ensure_trusted(interaction):
+            return
+
+        await interaction.response.defer()
+        self.global_blacklist.refresh()
+        if full:
+            self.sync_state.clear()
         
-        if not related_logs:
-            await interaction.followup.send(f'ℹ️ 找不到用戶 ID `{user_id}` 的黑名單操作紀錄。', ephemeral=True)
+        guilds = list(self.bot.guilds)
+        progress_message = await interaction.followup.send(
+            f"🌐 **開始跨伺服器同步：** 共 {len(guilds)} 個伺服器...", wait=True
+        )
+        last_update = 0.0
+
+        async def report_progress(result, done, total):
+            nonlocal last_update
+            now = asyncio.get_running_loop().time()
+            if done < total and now - last_update < PROPAGATION_PROGRESS_INTERVAL:
+                return
+            last_update = now
+            try:
+                await progress_message.edit(content=f"🌐 **跨伺服器同步中：** {done}/{total} 個伺服器 (最近完成：{result.guild_name})")
+            except discord.HTTPException:
+                # 進度訊息被刪除或編輯受限時略過，不中斷同步
+                pass
+
+        started = asyncio.get_running_loop().time()
+        report = await propagate_bans(guilds, self.global_blacklist, "[全域黑名單跨伺服器同步封鎖]",
+                                      skip_ids=[self.bot.user.id], watermarks=self.sync_state,
+                                      progress=report_progress)
+        save_sync_state(self.sync_state)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        embed = discord.Embed(
+            title="🌐 跨伺服器同步結果",
+            description=format_report(report),
+            color=discord.Color.red() if report.failed else discord.Color.green()
+        )
+        checked = sum(result.checked for result in report.results)
+        embed.set_footer(text=f"{len(guilds)} 個伺服器 | 檢查 {checked} | 封鎖 {report.banned} | 失敗 {report.failed} | 耗時 {elapsed:.1f} 秒")
+        await self.edit_or_send(interaction, progress_message, embed=embed)
+
+    @global_ban_group.command(name='import', description='[管理員指令] 從 CSV / JSON 檔案批次匯入黑名單。')
+    @app_commands.describe(
+        file='CSV (用戶ID,原因) 、JSON 或 JSON Lines 檔案',
+        file_format='檔案格式 (預設依副檔名判斷)',
+        reason='檔案中沒有提供原因時使用的封鎖原因'
+    )
+    @app_commands.choices(file_format=[app_commands.Choice(name=fmt, value=fmt) for fmt in IMPORT_FORMATS])
+    @app_commands.default_permissions(administrator=True)
+    async def global_import_cmd(self, interaction: discord.Interaction, file: discord.Attachment,
+                                file_format: Optional[app_commands.Choice[str]] = None, reason: str = "批次匯入"):
+        """以串流方式解析附件，驗證並去除重複後分批寫入黑名單，每批只記錄一筆操作紀錄。"""
+
+        if not await self.ensure_trusted(interaction):
+            return
+        fmt = file_format.value if file_format else guess_format(file.filename)
+        if fmt is None:
+            await interaction.response.send_message("❌ 無法判斷檔案格式，請指定 `file_format`。", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        self.global_blacklist.refresh()
+        progress_message = await interaction.followup.send(f"📥 **開始匯入：** 正在讀取 `{file.filename}`...", wait=True)
+
+        executor = interaction.user
+        defaults = {'reason': reason, 'added_by': str(executor), 'timestamp': str(datetime.datetime.now())}
+
+        async def commit_batch(batch, stats):
+            # 每批只寫入一筆操作紀錄與一筆同步變更
+            self.replication.record_add(batch)
+            self.history.append({
+                "timestamp": str(datetime.datetime.now()),
+                "action": "gban_import",
+                "command_used": f"/gban import {file.filename}",
+                "target_ids": [str(user_id) for user_id in batch],
+                "executor": {
+                    "id": str(executor.id),
+                    "username": executor.display_name,
+                    "full_tag": str(executor),
+                    "is_bot": executor.bot,
+                    "guild_id": str(interaction.guild_id) if interaction.guild_id else "DM"
+                },
+                "ban_reason": reason
+            })
+            try:
+                await progress_message.edit(content=f"📥 **匯入中：** 已讀取 {stats.read} 筆，已新增 {stats.added} 位用戶...")
+            except discord.HTTPException:
+                pass
+
+        try:
+            records = iter_import_records(iter_attachment_chunks(file.url), fmt)
+            stats = await import_records(records, self.global_blacklist, defaults, on_batch=commit_batch)
+        except (ValueError, aiohttp.ClientError) as e:
+            await self.edit_or_send(interaction, progress_message, content=f"❌ **匯入失敗：** {e}\n(已匯入的批次會保留)")
+            return
+
+        embed = discord.Embed(
+            title="📥 黑名單匯入完成",
+            description=(
+                f"**新增:** {stats.added} 位用戶 ({stats.batches} 批)\n"
+                f"**已在黑名單中:** {stats.existing}\n"
+                f"**檔案內重複:** {stats.duplicates}\n"
+                f"**無效 ID:** {stats.invalid}"
+            ),
+            color=discord.Color.green() if stats.added else discord.Color.orange()
+        )
+        embed.set_footer(text=f"共讀取 {stats.read} 筆 | 使用 /gban propagate 在所有伺服器封鎖新加入的用戶")
+        await self.edit_or_send(interaction, progress_message, embed=embed)
+
+    @global_ban_group.command(name='export', description='[管理員指令] 將全域黑名單匯出成 CSV 或 JSON 檔案。')
+    @app_commands.describe(file_format='匯出格式 (json 與黑名單檔案格式相同，可直接再匯入)')
+    @app_commands.choices(file_format=[app_commands.Choice(name='csv', value='csv'), app_commands.Choice(name='json', value='json')])
+    @app_commands.default_permissions(administrator=True)
+    async def global_export_cmd(self, interaction: discord.Interaction, file_format: Optional[app_commands.Choice[str]] = None):
+        """逐筆寫入暫存檔後以附件傳送，不需要先組出整份文字。"""
+
+        await interaction.response.defer(ephemeral=True)
+        self.global_blacklist.refresh()
+
+        fmt = file_format.value if file_format else 'csv'
+        # 在背景執行緒寫入，避免大量資料時阻塞事件迴圈；先複製一份避免寫入期間被修改
+        entries = list(self.global_blacklist.items())
+        spool, count = await asyncio.to_thread(export_to_file, entries, fmt)
+        with spool:
+            filename = f"global_blacklist_{datetime.datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+            await interaction.followup.send(
+                f"📤 已匯出 **{count}** 位黑名單用戶。",
+                file=discord.File(spool, filename=filename),
+                ephemeral=True
+            )
+
+    shared_group = app_commands.Group(name="shared", description="社群共享的大型黑名單", parent=global_ban_group)
+
+    @shared_group.command(name='load', description='[管理員指令] 從 CSV / JSON 檔案載入 (取代) 共享黑名單。')
+    @app_commands.describe(file='CSV (用戶ID,原因) 、JSON 或 JSON Lines 檔案', file_format='檔案格式 (預設依副檔名判斷)')
+    @app_commands.choices(file_format=[app_commands.Choice(name=fmt, value=fmt) for fmt in IMPORT_FORMATS])
+    @app_commands.default_permissions(administrator=True)
+    async def shared_load_cmd(self, interaction: discord.Interaction, file: discord.Attachment,
+                              file_format: Optional[app_commands.Choice[str]] = None):
+        """以串流方式讀取附件，建立排序好的 ID 陣列後取代目前的共享黑名單。"""
+        if not await self.ensure_trusted(interaction):
+            return
+        fmt = file_format.value if file_format else guess_format(file.filename)
+        if fmt is None:
+            await interaction.response.send_message("❌ 無法判斷檔案格式，請指定 `file_format`。", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        try:
+            records = iter_import_records(iter_attachment_chunks(file.url), fmt)
+            temp_path, stats = await build_compact_blacklist(records, self.shared_blacklist.path)
+        except (ValueError, aiohttp.ClientError) as e:
+            await interaction.followup.send(f"❌ **載入失敗：** {e}")
+            return
+        install_compact_blacklist(self.shared_blacklist, temp_path)
+
+        self.history.append({
+            "timestamp": str(datetime.datetime.now()),
+            "action": "gban_shared_load",
+            "command_used": f"/gban shared load {file.filename}",
+            "executor": {
+                "id": str(interaction.user.id),
+                "full_tag": str(interaction.user),
+            },
+            "ban_reason": f"共享黑名單 {stats['count']} 位用戶"
+        })
+        await interaction.followup.send(
+            f"✅ **共享黑名單已更新：** 共 **{stats['count']}** 位用戶 "
+            f"(讀取 {stats['read']} 筆，重複 {stats['duplicates']}，無效 {stats['invalid']})。\n"
+            f"新加入的成員會自動檢查；使用 `/gban shared sync` 封鎖目前伺服器中的成員。"
+        )
+
+    @shared_group.command(name='status', description='[管理員指令] 查看共享黑名單的狀態。')
+    @app_commands.default_permissions(administrator=True)
+    async def shared_status_cmd(self, interaction: discord.Interaction):
+        shared = self.shared_blacklist
+        if not len(shared):
+            await interaction.response.send_message("ℹ️ 目前沒有載入共享黑名單。", ephemeral=True)
+            return
+        size = os.path.getsize(shared.path) + (os.path.getsize(shared.meta_path) if os.path.exists(shared.meta_path) else 0)
+        await interaction.response.send_message(
+            f"🗂️ **共享黑名單：** {len(shared)} 位用戶，檔案大小 {size / 1024 / 1024:.1f} MB (記憶體映射，只在查詢時讀取)。",
+            ephemeral=True
+        )
+
+    @shared_group.command(name='sync', description='[管理員指令] 在當前伺服器封鎖所有在共享黑名單中的成員。')
+    @app_commands.default_permissions(administrator=True)
+    async def shared_sync_cmd(self, interaction: discord.Interaction):
+        if not interaction.guild:
+            await interaction.response.send_message("❌ 此指令僅限在伺服器中使用。", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        guild = interaction.guild
+        members = [member for member in guild.members if member.id not in (self.bot.user.id, guild.owner_id)]
+        # 一次向量化比對所有成員，不需要逐一查詢
+        hits = self.shared_blacklist.contains_many([member.id for member in members])
+        members = [member for member, hit in zip(members, hits) if hit]
+        result = await propagate_guild(guild, members, self.shared_blacklist, "[共享黑名單同步封鎖]")
+
+        if result.error:
+            await interaction.followup.send(f"❌ **同步失敗：** {result.error} (已封鎖 {result.banned}/{result.matched})")
+        else:
+            await interaction.followup.send(
+                f"✅ **同步完成！** 伺服器 `{guild.name}` 封鎖了 **{result.banned}** 位共享黑名單中的用戶。"
+            )
+
+    @shared_group.command(name='clear', description='[管理員指令] 移除共享黑名單。')
+    @app_commands.default_permissions(administrator=True)
+    async def shared_clear_cmd(self, interaction: discord.Interaction):
+        if not await self.ensure_trusted(interaction):
             return
+        count = len(self.shared_blacklist)
+        remove_compact_blacklist(self.shared_blacklist)
+        await interaction.response.send_message(f"🗑️ 已移除共享黑名單 ({count} 位用戶)。", ephemeral=True)
 
-        embed = discord.Embed(title=f"用戶 {user_id} 的黑名單歷史", color=discord.Color.blue())
+    @global_ban_group.command(name='replication', description='[管理員指令] 查看與其他機器人實例的黑名單同步狀態。')
+    @app_commands.default_permissions(administrator=True)
+    async def global_replication_cmd(self, interaction: discord.Interaction):
+        """顯示本機實例 ID、各實例的版本與讀取進度。"""
+        replication = self.replication
+        embed = discord.Embed(title="🔁 黑名單同步狀態", color=discord.Color.blue())
+        embed.add_field(name="本機實例", value=f"`{replication.instance_id}`", inline=True)
+        embed.add_field(name="變更紀錄", value=f"{len(replication.log)} 筆", inline=True)
+        embed.add_field(name="已套用的遠端變更", value=f"{replication.applied} 位用戶 (本次啟動)", inline=True)
+
+        versions = "\n".join(f"`{origin}`: {seq}" for origin, seq in sorted(replication.log.versions.items()))
+        embed.add_field(name="各實例版本", value=versions or "無", inline=False)
+
+        peers = []
+        for peer in replication.peers:
+            line = f"{peer} (進度 {replication.config['cursors'].get(peer, 0)})"
+            if peer in replication.last_errors:
+                line += f" ❌ {replication.last_errors[peer]}"
+            peers.append(line)
+        embed.add_field(name="其他實例", value="\n".join(peers)[:1024] if peers else "未設定 (請編輯 gban_replication.json 的 peers 與 token)", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    def build_history_embed(self, title: str, logs: list) -> discord.Embed:
+        """將操作紀錄轉為 Embed (只顯示最近 HISTORY_EMBED_LIMIT 筆，Embed 最多 25 個欄位)。"""
+        embed = discord.Embed(title=title, color=discord.Color.blue())
+        if len(logs) > HISTORY_EMBED_LIMIT:
+            embed.description = f"共 {len(logs)} 筆紀錄，只顯示最近 {HISTORY_EMBED_LIMIT} 筆。"
         
-        for i, log in enumerate(related_logs, 1):
-            action = "✅ 加入黑名單" if log['action'] == "gban_add" else "❌ 解除黑名單" if log['action'] == "gban_remove" else "❓ 未知操作"
+        start = max(0, len(logs) - HISTORY_EMBED_LIMIT)
+        for i, log in enumerate(logs[start:], start + 1):
+            action = "✅ 加入黑名單" if log['action'] == "gban_add" else "❌ 解除黑名單" if log['action'] == "gban_remove" else "📥 批次匯入" if log['action'] == "gban_import" else "🗂️ 載入共享黑名單" if log['action'] == "gban_shared_load" else "❓ 未知操作"
             reason = log.get('ban_reason', '無')
             executor_name = log['executor']['full_tag']
             timestamp = log['timestamp'].split('.')[0]
             command_used = log.get('command_used', 'N/A')
+            if 'target_ids' in log:
+                target = f"{len(log['target_ids'])} 位用戶"
+            else:
+                target = log.get('target_id', '未知')
 
             field_value = (
                 f'**時間:** {timestamp}\n'
+                f'**目標:** {target}\n'
                 f'**執行者:** {executor_name} ({log["executor"]["id"]})\n'
                 f'**原因:** {reason}\n'
                 f'**指令:** `{command_used}`'
             )
             embed.add_field(name=f"{i}. {action}", value=field_value, inline=False)
-            
+        return embed
+
+    @global_ban_group.command(name='history', description='[管理員指令] 查詢指定 ID 的黑名單歷史紀錄。')
+    @app_commands.describe(user_id='要查詢的用戶ID')
+    @app_commands.default_permissions(administrator=True)
+    async def global_history_cmd(self, interaction: discord.Interaction, user_id: str):
+        """查詢指定用戶 ID 的所有黑名單操作紀錄。"""
+        
+        await interaction.response.defer(ephemeral=True) 
+        
+        # 依目標 ID 索引直接讀取相關紀錄，不需要載入全部歷史
+        related_logs = self.history.by_target(user_id.strip())
+        
+        if not related_logs:
+            await interaction.followup.send(f'ℹ️ 找不到用戶 ID `{user_id}` 的黑名單操作紀錄。', ephemeral=True)
+            return
+
+        embed = self.build_history_embed(f"用戶 {user_id} 的黑名單歷史", related_logs)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @global_ban_group.command(name='actions', description='[管理員指令] 查詢指定管理員執行過的黑名單操作。')
+    @app_commands.describe(executor_id='執行操作的管理員用戶ID')
+    @app_commands.default_permissions(administrator=True)
+    async def global_actions_cmd(self, interaction: discord.Interaction, executor_id: str):
+        """查詢指定執行者的所有黑名單操作紀錄。"""
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        related_logs = self.history.by_executor(executor_id.strip())
+        
+        if not related_logs:
+            await interaction.followup.send(f'ℹ️ 找不到管理員 ID `{executor_id}` 的黑名單操作紀錄。', ephemeral=True)
+            return
+
+        embed = self.build_history_embed(f"管理員 {executor_id} 的黑名單操作", related_logs)
         await interaction.followup.send(embed=embed, ephemeral=True)
 
     @global_ban_group.command(name='list', description='[管理員指令] 顯示所有全域黑名單中的用戶。')
     @app_commands.default_permissions(administrator=True)
     async def global_list_cmd(self, interaction: discord.Interaction):
-        """讀取並顯示所有全域黑名單中的用戶 ID。"""
+        """以翻頁按鈕顯示全域黑名單，只查詢目前頁面的用戶資料。"""
 
         await interaction.response.defer()
         
-        self.global_blacklist = load_blacklist()
+        self.global_blacklist.refresh()
         
         if not self.global_blacklist:
             await interaction.followup.send("ℹ️ 目前全域黑名單為空。")
             return
 
-        entries = []
-        
-        # 為了效能，只做一次 gather
-        user_ids_to_fetch = [int(uid) for uid in self.global_blacklist.keys()]
-        users = await asyncio.gather(*[self.bot.fetch_user(uid) for uid in user_ids_to_fetch], return_exceptions=True)
-        
-        user_map = {str(u.id): u for u in users if isinstance(u, discord.User)}
-        
-        for user_id, data in self.global_blacklist.items():
-            user_obj = user_map.get(user_id)
+        view = BlacklistPageView(self, interaction.user.id, [user_id for user_id, _ in self.global_blacklist.items()])
+        # 先以快取中的資料立即顯示第一頁，再補上尚未快取的用戶名稱
+        view.message = await interaction.followup.send(embed=view.build_embed(), view=view, wait=True)
+        await view.resolve_current_page(view.message.edit)
+
+
+class BlacklistPageView(discord.ui.View):
+    """/gban list 的翻頁介面：保存指令當下的黑名單 ID，翻頁時才查詢該頁的用戶。"""
+
+    def __init__(self, cog: GlobalBan, owner_id: int, user_ids: list):
+        super().__init__(timeout=LIST_VIEW_TIMEOUT)
+        self.cog = cog
+        self.owner_id = owner_id
+        self.user_ids = user_ids
+        self.page = 0
+        self.message = None
+        self.total_pages = (len(user_ids) + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+        self.update_buttons()
+
+    def page_ids(self) -> list:
+        start = self.page * LIST_PAGE_SIZE
+        return self.user_ids[start:start + LIST_PAGE_SIZE]
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.total_pages - 1
+
+    def build_embed(self, profiles: Optional[dict] = None) -> discord.Embed:
+        """建立目前頁面的 Embed；profiles 未提供時只使用快取中的用戶資料。"""
+        content = ""
+        for user_id in self.page_ids():
+            profile = profiles.get(user_id) if profiles else self.cog.user_cache.peek(user_id)
             
             # 格式化顯示名稱 (實現提及 + ID 的效果)
-            if user_obj:
-                display_name = f"<@{user_id}> ({user_id})"
-            else:
+            if profile is None:
+                display_name = f"<@{user_id}> (查詢中… {user_id})"
+            elif profile.get('missing'):
                 display_name = f"@未知用戶 ({user_id})"
+            else:
+                display_name = f"<@{user_id}> ({profile['name']}, {user_id})"
+
+            # 已從黑名單移除的用戶仍保留在此分頁中，標示出來
+            data = self.cog.global_blacklist.get(user_id)
+            if data is None:
+                content += f"• ~~{display_name}~~ (已移除)\n"
+                continue
             
-            reason = data.get('reason', '無')
-            added_by = data.get('added_by', '未知')
-            timestamp = data.get('timestamp', '未知')
+            reason = str(data.get('reason', '無'))[:LIST_REASON_LIMIT]
+            added_by = str(data.get('added_by', '未知'))[:LIST_FIELD_LIMIT]
+            timestamp = str(data.get('timestamp', '未知')).split('.')[0][:LIST_FIELD_LIMIT]
             
             # 列表項目的格式
             entry = (
                 f"• **{display_name}**\n"
                 f"  > 原因: {reason}\n"
-                f"  > 新增者: {added_by} ({timestamp.split('.')[0]})\n"
+                f"  > 新增者: {added_by} ({timestamp})\n"
             )
-            entries.append(entry)
-            
-        
-        # 設置分頁邏輯
-        current_content = ""
-        embeds_content = []
-        MAX_LENGTH = 3800 # Embed description max is 4096. 3800 is safer.
-
-        for entry in entries:
-            if len(current_content) + len(entry) > MAX_LENGTH:
-                embeds_content.append(current_content)
-                current_content = entry
-            else:
-                current_content += entry
-                
-        if current_content:
-            embeds_content.append(current_content)
+            if len(content) + len(entry) > LIST_DESCRIPTION_LIMIT - 64:
+                # 保險起見仍以累計長度限制，超過時截斷此頁
+                content += "… (此頁內容過長，其餘用戶已省略)\n"
+                break
+            content += entry
+
+        list_embed = discord.Embed(
+            title="🌐 全域黑名單列表",
+            description=f"**全域黑名單 ({len(self.user_ids)} 人)**\n\n{content}",
+            color=discord.Color.from_rgb(47, 49, 54) 
+        )
+        list_embed.set_footer(text=f"第 {self.page + 1}/{self.total_pages} 頁 | 使用 /gban list 查詢所有黑名單用戶")
+        return list_embed
+
+    async def resolve_current_page(self, edit):
+        """查詢目前頁面尚未快取的用戶，完成後以 edit 更新訊息 (只在有缺少的資料時)。"""
+        page = self.page
+        page_ids = self.page_ids()
+        if all(self.cog.user_cache.peek(user_id) is not None for user_id in page_ids):
+            return
+        profiles = await self.cog.user_cache.resolve(page_ids)
+        # 查詢期間使用者已翻到其他頁面時，不覆蓋新的頁面
+        if page != self.page:
+            return
+        try:
+            await edit(embed=self.build_embed(profiles), view=self)
+        except discord.HTTPException:
+            pass
 
-        total_pages = len(embeds_content)
-        
-        # 發送所有分頁的 Embed 訊息
-        for i, content in enumerate(embeds_content, 1):
-            list_embed = discord.Embed(
-                title="🌐 全域黑名單列表",
-                description=f"**全域黑名單 ({len(self.global_blacklist)} 人)**\n\n{content}",
-                color=discord.Color.from_rgb(47, 49, 54) 
-            )
-            list_embed.set_footer(text=f"第 {i}/{total_pages} 頁 | 使用 /gban list 查詢所有黑名單用戶")
-            await interaction.followup.send(embed=list_embed)
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, self.total_pages - 1))
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+        await self.resolve_current_page(interaction.edit_original_response)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ 只有使用此指令的管理員可以翻頁。", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="上一頁", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="下一頁", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        """翻頁按鈕逾時後停用。"""
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except:
+            pass
 
 
 async def setup(bot):
@@ -0,0 +1,48 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Tuple
+
+
+class JoinTimeIndex:
+    """單一伺服器成員加入時間的排序索引。
+
+    以兩個平行的排序串列保存 (加入時間, 成員 ID)，範圍查詢只需兩次二分搜尋
+    加上輸出 k 筆結果，即 O(log n + k)。成員加入幾乎都是時間最新的一筆，
+    插入通常落在串列尾端。
+    """
+
+    __slots__ = ('times', 'ids', '_joined', 'complete')
+
+    def __init__(self, entries: Iterable[Tuple[float, int]] = (), complete: bool = False):
+        entries = sorted(entries)
+        self.times = [joined_at for joined_at, _ in entries]
+        self.ids = [member_id for _, member_id in entries]
+        # {member_id: joined_at}，移除時用來定位
+        self._joined = {member_id: joined_at for joined_at, member_id in entries}
+        # 是否由完整的成員快取建立 (未完整時需要重新建立)
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, member_id: int, joined_at: float):
+        if member_id in self._joined:
+            self.remove(member_id)
+        position = bisect_right(self.times, joined_at)
+        self.times.insert(position, joined_at)
+        self.ids.insert(position, member_id)
+        self._joined[member_id] = joined_at
+
+    def remove(self, member_id: int):
+        joined_at = self._joined.pop(member_id, None)
+        if joined_at is None:
+            return
+        position = bisect_left(self.times, joined_at)
+        # 加入時間相同的成員可能不只一位
+        while self.ids[position] != member_id:
+            position += 1
+        del self.times[position]
+        del self.ids[position]
+
+    def between(self, start: float, end: float) -> List[int]:
+        """回傳加入時間介於 [start, end] 的成員 ID (依加入時間排序)。"""
+        return self.ids[bisect_left(self.times, start):bisect_right(self.times, end)]
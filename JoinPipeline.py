@@ -0,0 +1,57 @@
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+# 各階段的執行順序 (數字越小越先執行)
+STAGE_BLACKLIST = 10   # 全域黑名單 (GlobalBan)
+STAGE_RAID = 20        # 帳號年齡、名稱、同批帳號與 Raid 模式 (RaidProtect)
+STAGE_AUTO_ROLE = 30   # 自動身分組
+STAGE_WELCOME = 40     # 歡迎訊息
+
+# 階段回傳 True 表示繼續，False 表示成員已被拒絕 (踢出/封鎖)，後續階段不再執行
+JoinStage = Callable[[discord.Member], Awaitable[bool]]
+
+
+class JoinPipeline:
+    """成員加入流程：依序執行已登記的階段，任一階段拒絕即停止。
+
+    取代多個各自獨立的 on_member_join 監聽器，避免黑名單或 Raid 帳號在被封鎖前
+    仍先收到自動身分組與歡迎訊息，也避免大量加入時彼此競爭的 REST 呼叫。
+    """
+
+    def __init__(self):
+        self._stages = []
+
+    def register(self, order: int, name: str, stage: JoinStage):
+        """登記 (或以同名取代) 一個階段。"""
+        self.unregister(name)
+        self._stages.append((order, name, stage))
+        self._stages.sort(key=lambda entry: entry[0])
+
+    def unregister(self, name: str):
+        self._stages = [entry for entry in self._stages if entry[1] != name]
+
+    @property
+    def stages(self) -> list:
+        """依執行順序排列的 (順序, 名稱, 階段)。"""
+        return list(self._stages)
+
+    async def run(self, member: discord.Member) -> Optional[str]:
+        """執行所有階段，回傳拒絕此成員的階段名稱；全部通過則回傳 None。"""
+        for _, name, stage in self._stages:
+            try:
+                if not await stage(member):
+                    return name
+            except Exception as e:
+                # 單一階段出錯不應讓後續的檢查被略過
+                print(f"❌ [加入流程] 階段 '{name}' 處理 {member} 時發生錯誤: {e}")
+        return None
+
+
+def get_join_pipeline(bot) -> JoinPipeline:
+    """取得 bot 共用的加入流程，第一次使用時建立。"""
+    pipeline = getattr(bot, 'join_pipeline', None)
+    if pipeline is None:
+        pipeline = JoinPipeline()
+        bot.join_pipeline = pipeline
+    return pipeline
@@ -0,0 +1,148 @@
+import re
+from collections import deque
+from typing import Iterable, Optional
+
+
+class AhoCorasick:
+    """Aho-Corasick 自動機：一次掃描即可同時比對所有關鍵字。"""
+
+    def __init__(self, keywords: Iterable[str]):
+        # 每個狀態的轉移表、失敗連結與輸出 (在此狀態結束的關鍵字)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+
+        for keyword in keywords:
+            if keyword:
+                self._insert(keyword)
+        self._build_links()
+
+    def _insert(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            state = next_state
+        self._output[state] = keyword
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # 沒有自己的輸出時沿用失敗連結上的輸出，找到任一關鍵字即可停止
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+    def search(self, text: str) -> Optional[str]:
+        """回傳 text 中第一個出現的關鍵字，沒有則回傳 None。"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class CompiledNameFilter:
+    """將一組名稱規則編譯成單一比對器：關鍵字自動機 + 合併後的正規表達式。
+
+    無法安全合併的規則 (全域旗標、具名群組、編號反向參照，或合併後編譯失敗) 會各自編譯、
+    逐一比對，確保任何規則都不會讓整個過濾器失效；本身就無效的規則才會被略過並印出警告。
+    """
+
+    def __init__(self, keywords: Iterable[str] = (), patterns: Iterable[str] = ()):
+        self.keywords = sorted({keyword.lower() for keyword in keywords if keyword})
+        self.patterns = list(dict.fromkeys(patterns))
+        self._automaton = AhoCorasick(self.keywords) if self.keywords else None
+
+        mergeable = [pattern for pattern in self.patterns if validate_pattern(pattern) is None]
+        self._regex = None
+        if mergeable:
+            try:
+                self._regex = compile_merged(mergeable)
+            except re.error:
+                mergeable = []
+        self._merged = mergeable
+
+        # 不能合併的規則各自編譯
+        self._separate = []
+        for pattern in self.patterns:
+            if pattern in mergeable:
+                continue
+            try:
+                self._separate.append((pattern, re.compile(pattern)))
+            except re.error as e:
+                print(f"警告：名稱規則 `{pattern}` 無效，已略過: {e}")
+
+    def match(self, name: str) -> Optional[str]:
+        """檢查名稱 (不分大小寫)，回傳命中的規則，沒有命中則回傳 None。"""
+        name = name.lower()
+        if self._automaton is not None:
+            keyword = self._automaton.search(name)
+            if keyword is not None:
+                return keyword
+        if self._regex is not None:
+            found = self._regex.search(name)
+            if found:
+                return self._merged[int(found.lastgroup[1:])]
+        for pattern, regex in self._separate:
+            if regex.search(name):
+                return pattern
+        return None
+
+
+def compile_merged(patterns: list) -> re.Pattern:
+    """將規則合併成一個正規表達式，每個規則包成具名群組，比對成功時可從 lastgroup 得知是哪一條。"""
+    return re.compile("|".join(f"(?P<r{index}>{pattern})" for index, pattern in enumerate(patterns)))
+
+
+# 合併後會失效的語法：全域旗標 (?i)、具名群組 (?P<name>…)/(?P=name)、條件參照 (?(1)…)
+UNMERGEABLE_SYNTAX = re.compile(r'\(\?[aiLmsux]+\)|\(\?P[<=]|\(\?\(')
+
+
+def validate_pattern(pattern: str) -> Optional[str]:
+    """檢查正規表達式是否可用且能與其他規則合併，回傳錯誤訊息或 None。"""
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return str(e)
+
+    # 跳過跳脫字元後再檢查，避免把 \( 之類的字面字元誤判為語法
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            if index + 1 < len(pattern) and pattern[index + 1] in '123456789':
+                return "不支援編號反向參照 (例如 \\1)"
+            index += 2
+            continue
+        if char == '(' and UNMERGEABLE_SYNTAX.match(pattern, index):
+            return "不支援全域旗標 (例如 (?i))、具名群組或條件參照，名稱已一律以小寫比對"
+        index += 1
+    return None
+
+
+def validate_merged(patterns: Iterable[str]) -> Optional[str]:
+    """檢查整組規則合併後能否編譯，回傳錯誤訊息或 None。"""
+    try:
+        compile_merged(list(dict.fromkeys(patterns)))
+    except re.error as e:
+        return str(e)
+    return None
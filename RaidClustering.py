@@ -0,0 +1,136 @@
+import time
+import zlib
+from collections import OrderedDict
+from itertools import groupby
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# 每個伺服器最多保留多少筆最近加入紀錄
+CLUSTER_WINDOW_SIZE = 1000
+# 加入紀錄保留多久 (秒)，慢速湧入也能被累積起來
+CLUSTER_WINDOW_SECONDS = 24 * 3600
+# 帳號創建時間相差在此範圍內 (秒) 視為同一批建立
+CLUSTER_CREATION_SPAN = 3600
+# 同一批帳號達到此數量才視為協同湧入 (預設值，各伺服器可調整)
+CLUSTER_MIN_SIZE = 6
+# 同一批帳號中名稱形狀相同的比例達到此值即標記；否則需要兩倍數量才標記
+CLUSTER_SHAPE_RATIO = 0.5
+# 最多同時追蹤多少個伺服器 (超過時淘汰最久沒有成員加入的伺服器)
+MAX_TRACKED_GUILDS = 5000
+
+
+def name_shape(name: str) -> int:
+    """將名稱轉為「形狀」雜湊：字元種類與連續長度，例如 John1234 → A1a304。"""
+    def char_class(char):
+        if char.isdigit():
+            return '0'
+        if char.isalpha():
+            return 'A' if char.isupper() else 'a'
+        return '_'
+
+    shape = "".join(f"{cls}{len(list(run))}" for cls, run in groupby(map(char_class, name)))
+    return zlib.crc32(shape.encode('utf-8'))
+
+
+class ClusterResult(NamedTuple):
+    member_ids: list
+    size: int
+    shape_ratio: float
+
+
+class GuildJoinWindow:
+    """單一伺服器最近加入紀錄，以 NumPy 陣列的環形緩衝區保存 (容量按需加倍)。"""
+
+    __slots__ = ('created', 'joined', 'shapes', 'ids', 'index', 'last_join')
+
+    def __init__(self, capacity: int = 64):
+        self.created = np.full(capacity, np.nan)
+        self.joined = np.zeros(capacity)
+        self.shapes = np.zeros(capacity, dtype=np.int64)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.index = 0
+        self.last_join = 0.0
+
+    def _grow(self, max_size: int):
+        capacity = len(self.created)
+        if self.index < capacity or capacity >= max_size:
+            return
+        new_capacity = min(capacity * 2, max_size)
+        self.created = np.concatenate([self.created, np.full(new_capacity - capacity, np.nan)])
+        self.joined = np.concatenate([self.joined, np.zeros(new_capacity - capacity)])
+        self.shapes = np.concatenate([self.shapes, np.zeros(new_capacity - capacity, dtype=np.int64)])
+        self.ids = np.concatenate([self.ids, np.zeros(new_capacity - capacity, dtype=np.int64)])
+
+    def add(self, member_id: int, created_at: float, shape: int, now: float, max_size: int):
+        self._grow(max_size)
+        slot = self.index % len(self.created)
+        self.created[slot] = created_at
+        self.joined[slot] = now
+        self.shapes[slot] = shape
+        self.ids[slot] = member_id
+        self.index += 1
+        self.last_join = now
+
+    def discard(self, mask: np.ndarray):
+        """移除已處置的紀錄 (NaN 不會與任何時間相符)。"""
+        self.created[mask] = np.nan
+
+
+class AccountClusterDetector:
+    """偵測「同一批建立的帳號」陸續加入，即使加入速度慢到不會觸發加入頻率門檻。
+
+    每次有成員加入時，以向量化運算找出最近加入紀錄中，帳號創建時間與其相差
+    CLUSTER_CREATION_SPAN 以內的帳號 (以該成員為中心的創建時間直方圖區間)，
+    再統計其中名稱形狀相同的比例。
+    """
+
+    def __init__(self, window_size: int = CLUSTER_WINDOW_SIZE, window_seconds: float = CLUSTER_WINDOW_SECONDS,
+                 creation_span: float = CLUSTER_CREATION_SPAN, max_guilds: int = MAX_TRACKED_GUILDS):
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.creation_span = creation_span
+        self.max_guilds = max_guilds
+        self._windows = OrderedDict()
+
+    def __len__(self):
+        return len(self._windows)
+
+    def _evict(self, now: float):
+        while self._windows:
+            oldest = next(iter(self._windows.values()))
+            if len(self._windows) <= self.max_guilds and now - oldest.last_join < self.window_seconds:
+                break
+            self._windows.popitem(last=False)
+
+    def record_join(self, guild_id, member_id: int, created_at: float, name: str,
+                    min_size: int = CLUSTER_MIN_SIZE, now: float = None) -> Optional[ClusterResult]:
+        """記錄一次成員加入 (created_at 為帳號創建的 epoch 秒)。
+
+        若此成員屬於可疑的同批帳號，回傳該批帳號 (包含此成員) 並將其移出紀錄，
+        避免同一批帳號重複被標記；否則回傳 None。
+        """
+        now = time.time() if now is None else now
+        window = self._windows.get(guild_id)
+        if window is None:
+            window = GuildJoinWindow()
+            self._windows[guild_id] = window
+        self._windows.move_to_end(guild_id)
+
+        shape = name_shape(name)
+        window.add(member_id, created_at, shape, now, self.window_size)
+        self._evict(now)
+
+        mask = ((np.abs(window.created - created_at) <= self.creation_span / 2)
+                & (window.joined >= now - self.window_seconds))
+        size = int(np.count_nonzero(mask))
+        if size < min_size:
+            return None
+
+        shape_ratio = np.count_nonzero(window.shapes[mask] == shape) / size
+        if shape_ratio < CLUSTER_SHAPE_RATIO and size < min_size * 2:
+            return None
+
+        member_ids = window.ids[mask].tolist()
+        window.discard(mask)
+        return ClusterResult(member_ids, size, float(shape_ratio))
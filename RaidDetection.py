@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+
+# 最多同時追蹤多少個伺服器的加入紀錄 (超過時淘汰最久沒有成員加入的伺服器)
+MAX_TRACKED_GUILDS = 5000
+# 伺服器多久 (秒) 沒有成員加入就清除其紀錄
+GUILD_IDLE_SECONDS = 3600
+
+
+class JoinRingBuffer:
+    """固定大小的環形緩衝區，只保存最近 threshold 次加入的時間。
+
+    第 N 次加入與往前數第 N 次加入的時間差若在視窗內，就代表視窗內
+    至少有 N 次加入。每次加入都是 O(1)，且不會重新配置串列。
+    """
+
+    __slots__ = ('times', 'index', 'count', 'last_join')
+
+    def __init__(self, size: int):
+        self.times = [0.0] * size
+        self.index = 0
+        self.count = 0
+        self.last_join = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.times)
+
+    def add(self, now: float, window: float) -> bool:
+        """記錄一次加入，回傳最近 size 次加入是否都落在視窗內。"""
+        self.times[self.index] = now
+        self.index = (self.index + 1) % len(self.times)
+        self.last_join = now
+        if self.count < len(self.times):
+            self.count += 1
+            if self.count < len(self.times):
+                return False
+        # 寫入後，下一個要覆寫的位置就是最近 size 次加入中最舊的一筆
+        return now - self.times[self.index] <= window
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+
+
+class RaidDetector:
+    """各伺服器的加入頻率偵測，伺服器狀態以 LRU 與閒置時間限制數量。"""
+
+    def __init__(self, max_guilds: int = MAX_TRACKED_GUILDS, idle_seconds: float = GUILD_IDLE_SECONDS):
+        self.max_guilds = max_guilds
+        self.idle_seconds = idle_seconds
+        self._buffers = OrderedDict()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def _evict(self, now: float):
+        while self._buffers:
+            oldest = next(iter(self._buffers.values()))
+            if len(self._buffers) <= self.max_guilds and now - oldest.last_join < self.idle_seconds:
+                break
+            self._buffers.popitem(last=False)
+
+    def record_join(self, guild_id, threshold: int, window: float, now: float = None) -> bool:
+        """記錄一次成員加入，若 window 秒內加入數達到 threshold 則回傳 True。"""
+        now = time.monotonic() if now is None else now
+        buffer = self._buffers.get(guild_id)
+        if buffer is None or buffer.size != threshold:
+            # 新伺服器或門檻被調整時才建立新的緩衝區
+            buffer = JoinRingBuffer(threshold)
+            self._buffers[guild_id] = buffer
+        self._buffers.move_to_end(guild_id)
+        triggered = buffer.add(now, window)
+        self._evict(now)
+        return triggered
+
+    def reset(self, guild_id):
+        """清除伺服器的加入紀錄 (觸發 Raid 模式後避免重複觸發)。"""
+        buffer = self._buffers.get(guild_id)
+        if buffer is not None:
+            buffer.reset()
@@ -0,0 +1,198 @@
+import asyncio
+import time
+
+import discord
+
+from AIRateLimit import TokenBucket
+
+# Discord bulk_ban 一次最多 200 位用戶
+BULK_BAN_BATCH_SIZE = 200
+# 收到第一位待處理帳號後，等待多久 (秒) 再送出，讓同一波加入的帳號合併成一批
+BATCH_LINGER_SECONDS = 1.0
+# 踢出模式下同時進行的踢出請求數
+KICK_CONCURRENCY = 5
+# 踢出模式下每個伺服器每分鐘最多送出的踢出請求數 (令牌桶，超過時由 discord.py 處理 429)
+KICK_RATE_PER_MINUTE = 600
+# REST 失敗 (非權限問題) 時的重試次數與起始退避時間
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+
+async def call_with_retries(call):
+    """執行 REST 呼叫，遇到暫時性錯誤時以指數退避重試。權限不足或目標不存在不重試。"""
+    delay = RETRY_BACKOFF_SECONDS
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await call()
+        except (discord.Forbidden, discord.NotFound):
+            raise
+        except discord.HTTPException:
+            if attempt == MAX_RETRIES:
+                raise
+            # 429 由 discord.py 自動等待；這裡處理 5xx 或限速重試後仍失敗的情況
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+class EnforcementStats:
+    """單一伺服器的處置統計。"""
+
+    __slots__ = ('enforced', 'failed', 'batches', 'busy_seconds', 'pending')
+
+    def __init__(self):
+        self.enforced = 0
+        self.failed = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.pending = 0
+
+    @property
+    def throughput(self) -> float:
+        """每秒處置的帳號數 (只計算實際處理的時間)。"""
+        return self.enforced / self.busy_seconds if self.busy_seconds else 0.0
+
+
+class RaidEnforcer:
+    """Raid 帳號的處置佇列：每個伺服器一個佇列，批次 bulk_ban 或限速並行踢出。"""
+
+    def __init__(self):
+        # {guild_id: {member_id: (member, action, reason)}}，以 dict 去除重複帳號
+        self._pending = {}
+        self._tasks = {}
+        self._kick_buckets = {}
+        # 已從佇列取出、正在送出的帳號數
+        self._in_flight = 0
+        self.stats = {}
+
+    def enqueue(self, guild: discord.Guild, member: discord.abc.Snowflake, action: str, reason: str):
+        """加入待處置的帳號；action 為 'ban' 或 'kick'。"""
+        pending = self._pending.setdefault(guild.id, {})
+        pending[member.id] = (member, action, reason)
+        stats = self.stats.setdefault(guild.id, EnforcementStats())
+        stats.pending = len(pending)
+
+        task = self._tasks.get(guild.id)
+        if task is None or task.done():
+            self._tasks[guild.id] = asyncio.create_task(self._worker(guild))
+
+    async def enforce_now(self, guild: discord.Guild, members: list, action: str, reason: str, progress=None):
+        """立即處置一批帳號 (例如 Raid 結束後的清理)，回傳 (成功數, 失敗數)。
+
+        每完成一批會呼叫 progress(已處理數, 總數)。
+        """
+        stats = self.stats.setdefault(guild.id, EnforcementStats())
+        enforced, failed = stats.enforced, stats.failed
+        entries = [(member, action, reason) for member in members]
+        for start in range(0, len(entries), BULK_BAN_BATCH_SIZE):
+            batch = entries[start:start + BULK_BAN_BATCH_SIZE]
+            started = time.perf_counter()
+            if action == 'ban':
+                await self._bulk_ban(guild, batch, stats)
+            else:
+                await self._kick_all(guild, batch, stats)
+            stats.busy_seconds += time.perf_counter() - started
+            if progress is not None:
+                try:
+                    await progress(start + len(batch), len(entries))
+                except Exception as e:
+                    # 回報進度失敗不應中斷清理
+                    print(f"回報處置進度時發生錯誤: {e}")
+        return stats.enforced - enforced, stats.failed - failed
+
+    @property
+    def idle(self) -> bool:
+        """所有伺服器的處置佇列都已處理完畢。"""
+        return all(task.done() for task in self._tasks.values())
+
+    def pending_actions(self) -> int:
+        """尚未完成的處置數 (佇列中 + 正在送出)。"""
+        return sum(len(pending) for pending in self._pending.values()) + self._in_flight
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """等待處置佇列清空，回傳是否在 timeout 秒內完成。"""
+        deadline = time.monotonic() + timeout
+        while not self.idle:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    def _take_batch(self, guild_id: int, action: str, size: int) -> list:
+        pending = self._pending.get(guild_id, {})
+        batch = []
+        for member_id in list(pending):
+            if pending[member_id][1] != action:
+                continue
+            batch.append(pending.pop(member_id))
+            if len(batch) >= size:
+                break
+        self.stats[guild_id].pending = len(pending)
+        return batch
+
+    async def _worker(self, guild: discord.Guild):
+        stats = self.stats[guild.id]
+        while self._pending.get(guild.id):
+            # 已經湊滿一批時直接送出，不需要等待更多帳號
+            if len(self._pending[guild.id]) < BULK_BAN_BATCH_SIZE:
+                await asyncio.sleep(BATCH_LINGER_SECONDS)
+            started = time.perf_counter()
+
+            for action, handler in (('ban', self._bulk_ban), ('kick', self._kick_all)):
+                batch = self._take_batch(guild.id, action, BULK_BAN_BATCH_SIZE)
+                if not batch:
+                    continue
+                self._in_flight += len(batch)
+                try:
+                    await handler(guild, batch, stats)
+                finally:
+                    self._in_flight -= len(batch)
+
+            stats.busy_seconds += time.perf_counter() - started
+        self._pending.pop(guild.id, None)
+
+    async def _bulk_ban(self, guild: discord.Guild, batch: list, stats: EnforcementStats):
+        members = [member for member, _, _ in batch]
+        reason = batch[0][2]
+        stats.batches += 1
+        try:
+            result = await call_with_retries(lambda: guild.bulk_ban(members, reason=reason))
+        except discord.Forbidden:
+            print(f"❌ [RaidProtect] 權限不足，無法在 {guild.name} 批次封鎖。")
+            stats.failed += len(members)
+            return
+        except discord.HTTPException as e:
+            print(f"❌ [RaidProtect] 在 {guild.name} 批次封鎖失敗: {e}")
+            stats.failed += len(members)
+            return
+
+        stats.enforced += len(result.banned)
+        stats.failed += len(result.failed)
+        print(f"🔨 [RaidProtect] 在 {guild.name} 批次封鎖 {len(result.banned)} 個帳號 (失敗 {len(result.failed)})。")
+
+    async def _kick_all(self, guild: discord.Guild, batch: list, stats: EnforcementStats):
+        semaphore = asyncio.Semaphore(KICK_CONCURRENCY)
+        bucket = self._kick_buckets.setdefault(guild.id, TokenBucket(KICK_RATE_PER_MINUTE))
+        stats.batches += 1
+
+        async def kick(member, reason):
+            async with semaphore:
+                # 以令牌桶限制速率：平時可立即送出，持續大量踢出時才等待
+                while not bucket.available(time.monotonic()):
+                    await asyncio.sleep(bucket.retry_after())
+                bucket.consume()
+                try:
+                    await call_with_retries(lambda: guild.kick(member, reason=reason))
+                    stats.enforced += 1
+                except discord.NotFound:
+                    # 帳號已自行離開
+                    pass
+                except discord.HTTPException:
+                    stats.failed += 1
+
+        await asyncio.gather(*(kick(member, reason) for member, _, reason in batch))
+        print(f"👢 [RaidProtect] 在 {guild.name} 踢出 {len(batch)} 個 Raid 帳號。")
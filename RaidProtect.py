@@ -1,142 +1,498 @@
-import discord
-from discord.ext import commands
-from discord import app_commands
-import asyncio
-import time
-from datetime import datetime, timedelta
-import re # 確保頂部有導入 re 模組
-
-# --- 新增和調整配置常數 ---
-# 在此時間範圍內 (秒)，如果加入的成員數量超過 RAID_THRESHOLD，則觸發 Raid 模式
-RAID_TIME_WINDOW = 5 
-# 觸發 Raid 模式的成員數量門檻
-RAID_THRESHOLD = 10 
-# 觸發 Raid 模式後，懲罰將持續的時間 (秒)
-RAID_PENALTY_DURATION = 600 # 10 分鐘
-
-# 帳號年齡限制：帳號創建時間必須超過此天數，否則被視為可疑
-MIN_ACCOUNT_AGE_DAYS = 7 
-
-# 新成員名稱中包含這些關鍵字，將會被踢出 (已移除非 ASCII 檢查，避免誤判)
-BANNED_NAME_PATTERNS = [
-    r'[0-9]{3,}',     # 連續三個以上數字 (可能是廣告機器人)
-    r'discord\.gg',   # 邀請連結
-    r'http(s)?:\/\/.' # 網址連結
-]
-
-class RaidProtect(commands.Cog):
-    """防禦系統：監控新成員加入，防範大規模惡意湧入 (Raid)。"""
-    
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        # 紀錄新成員加入時間的隊列: {guild_id: [timestamp1, timestamp2, ...]}
-        self.join_timestamps = {} 
-        # 紀錄 Raid 模式狀態: {guild_id: datetime_when_penalty_ends}
-        self.raid_mode_active = {} 
-        print("✅ RaidProtect Cog 載入成功，已新增帳號年齡檢查與 Webhook 防禦。")
-
-    
-    # --- 輔助函數：檢查新成員名稱是否可疑 ---
-    def check_suspicious_name(self, member: discord.Member) -> bool:
-        """檢查用戶名稱是否包含可疑模式。"""
-        for pattern in BANNED_NAME_PATTERNS:
-            if re.search(pattern, member.name.lower()):
-                return True
-        return False
-
-    # --- 輔助函數：檢查帳號年齡是否過低 ---
-    def check_account_age(self, member: discord.Member) -> bool:
-        """檢查帳號創建時間是否少於 MIN_ACCOUNT_AGE_DAYS。"""
-        required_age = timedelta(days=MIN_ACCOUNT_AGE_DAYS)
-        account_age = datetime.now(member.created_at.tzinfo) - member.created_at
-        return account_age < required_age
-
-    # --- 事件監聽：新成員加入 ---
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        guild = member.guild
-        current_time = time.time()
-        
-        # 0. 忽略 Bot 自己的操作
-        if member.id == self.bot.user.id:
-            return
-
-        # 1. 帳號年齡檢查 (Anti-Alts)
-        if self.check_account_age(member):
-            try:
-                await guild.kick(member, reason=f"[RaidProtect: Anti-Alts] 帳號創建時間少於 {MIN_ACCOUNT_AGE_DAYS} 天。")
-                print(f"🚨 [年齡防禦] 在伺服器 {guild.name} 踢出新帳號 {member.display_name} ({member.id})。")
-            except discord.Forbidden:
-                print(f"❌ [年齡防禦] 權限不足，無法在 {guild.name} 踢出 {member.display_name}。")
-            return
-            
-        # 2. 名稱檢查 (輕量級防禦)
-        if self.check_suspicious_name(member):
-            try:
-                await guild.kick(member, reason="[RaidProtect: Name] 名稱包含可疑關鍵字或廣告。")
-                print(f"🚨 [名稱防禦] 在伺服器 {guild.name} 踢出用戶 {member.display_name} ({member.id})。")
-            except discord.Forbidden:
-                print(f"❌ [名稱防禦] 權限不足，無法在 {guild.name} 踢出 {member.display_name}。")
-            return
-            
-        # 3. Raid 模式檢查 (防止湧入)
-        
-        # ... (以下為上次提供的 Raid 模式邏輯，保持不變) ...
-        if guild.id not in self.join_timestamps:
-            self.join_timestamps[guild.id] = []
-        
-        self.join_timestamps[guild.id] = [t for t in self.join_timestamps[guild.id] if current_time - t <= RAID_TIME_WINDOW]
-        self.join_timestamps[guild.id].append(current_time)
-        
-        if len(self.join_timestamps[guild.id]) >= RAID_THRESHOLD:
-            await self.trigger_raid_mode(guild, member)
-            
-        # 4. 處理 Raid 模式下的加入 (確保在 Raid 模式下的用戶被踢出)
-        if guild.id in self.raid_mode_active and datetime.now() < self.raid_mode_active[guild.id]:
-             try:
-                await guild.kick(member, reason="[RaidProtect: Flood] 伺服器處於 Raid 防禦模式。")
-                print(f"🚨 [Raid 模式] 在伺服器 {guild.name} 踢出用戶 {member.display_name} ({member.id})。")
-             except discord.Forbidden:
-                pass
-        
-    # --- 核心防禦邏輯 ---
-    async def trigger_raid_mode(self, guild: discord.Guild, triggering_member: discord.Member):
-        
-        if guild.id in self.raid_mode_active and datetime.now() < self.raid_mode_active[guild.id]:
-            self.raid_mode_active[guild.id] = datetime.now() + timedelta(seconds=RAID_PENALTY_DURATION)
-            print(f"⚠️ [RaidProtect] 伺服器 {guild.name} Raid 模式時間延長。")
-            return
-            
-        self.raid_mode_active[guild.id] = datetime.now() + timedelta(seconds=RAID_PENALTY_DURATION)
-        print(f"🔥 [RaidProtect] 伺服器 {guild.name} 觸發 Raid 模式！")
-        
-        # 1. 調整驗證等級 (提高到 'Highest' - 必須有電話驗證)
-        original_verification_level = guild.verification_level
-        try:
-            await guild.edit(verification_level=discord.VerificationLevel.highest, reason="[RaidProtect] 進入 Raid 防禦模式。")
-            print(f"✅ 在 {guild.name} 將驗證等級提高到 'Highest'。")
-        except discord.Forbidden:
-            print(f"❌ 權限不足，無法在 {guild.name} 更改驗證等級。")
-            
-        # 2. 移除新加入成員的紀錄，防止重複觸發
-        self.join_timestamps[guild.id] = [] 
-        
-        # 3. 啟動計時器以恢復設定
-        await asyncio.sleep(RAID_PENALTY_DURATION)
-        
-        # 4. 恢復設定
-        if guild.id in self.raid_mode_active and datetime.now() >= self.raid_mode_active[guild.id]:
-            try:
-                # 恢復原來的驗證等級 (這裡我們不能直接恢復 original_verification_level，因為沒有儲存)
-                # 實際應用中應該儲存原始等級，這裡暫時恢復為 Medium
-                await guild.edit(verification_level=discord.VerificationLevel.medium, reason="[RaidProtect] 結束 Raid 防禦模式，恢復設定。")
-                print(f"✅ 在 {guild.name} 恢復驗證等級。")
-            except discord.Forbidden:
-                pass
-            finally:
-                del self.raid_mode_active[guild.id]
-                print(f"✅ 在 {guild.name} 退出 Raid 模式。")
-                
-# --- 載入 Cog 函數 ---
-async def setup(bot):
+import discord
+from discord.ext import commands
+from discord import app_commands
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from JoinIndex import JoinTimeIndex
+from JoinPipeline import STAGE_RAID, get_join_pipeline
+from NameFilter import CompiledNameFilter, validate_merged, validate_pattern
+from RaidClustering import AccountClusterDetector, CLUSTER_MIN_SIZE
+from RaidDetection import RaidDetector
+from RaidEnforcement import RaidEnforcer
+from RaidScheduler import RaidScheduler
+
+# --- 新增和調整配置常數 ---
+# 在此時間範圍內 (秒)，如果加入的成員數量超過 RAID_THRESHOLD，則觸發 Raid 模式
+# (以下為預設值，各伺服器可使用 /raid config 調整)
+RAID_TIME_WINDOW = 5 
+# 觸發 Raid 模式的成員數量門檻
+RAID_THRESHOLD = 10 
+# 觸發 Raid 模式後，懲罰將持續的時間 (秒)
+RAID_PENALTY_DURATION = 600 # 10 分鐘
+# Raid 模式下對新加入帳號的處置方式：'kick' (踢出) 或 'ban' (批次封鎖)
+RAID_ACTION = 'kick'
+# 同批帳號偵測的預設狀態：偵測到時會回溯處置過去 24 小時內加入的成員，
+# 因此預設關閉，由管理員以 /raid cluster 在各伺服器啟用
+CLUSTER_DETECTION_DEFAULT = False
+
+# 帳號年齡限制：帳號創建時間必須超過此天數，否則被視為可疑
+MIN_ACCOUNT_AGE_DAYS = 7 
+
+# 新成員名稱中包含這些關鍵字，將會被踢出 (已移除非 ASCII 檢查，避免誤判)
+BANNED_NAME_PATTERNS = [
+    r'[0-9]{3,}',     # 連續三個以上數字 (可能是廣告機器人)
+    r'discord\.gg',   # 邀請連結
+    r'http(s)?:\/\/.' # 網址連結
+]
+
+# 各伺服器自訂的防禦設定 (名稱過濾規則等)
+RAID_SETTINGS_FILE = 'raid_settings.json'
+# 每個伺服器最多可設定的名稱規則數量
+MAX_NAME_RULES = 200
+
+# --- 資料處理函數 ---
+
+def load_raid_settings():
+    """從 JSON 檔案載入各伺服器的防禦設定。"""
+    try:
+        with open(RAID_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        print(f"警告：{RAID_SETTINGS_FILE} 檔案內容無效，使用空白設定。")
+        return {}
+
+def save_raid_settings(data):
+    """將各伺服器的防禦設定儲存到 JSON 檔案。"""
+    with open(RAID_SETTINGS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+
+class RaidProtect(commands.Cog):
+    """防禦系統：監控新成員加入，防範大規模惡意湧入 (Raid)。"""
+    
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # 各伺服器最近加入時間的環形緩衝區 (O(1) 更新，閒置伺服器自動淘汰)
+        self.raid_detector = RaidDetector()
+        # 最近加入帳號的創建時間與名稱形狀 (偵測慢速的同批帳號湧入)
+        self.cluster_detector = AccountClusterDetector()
+        # 各伺服器成員加入時間的排序索引 (事後清理時依時間範圍查詢)
+        self.join_indexes = {}
+        # Raid 模式狀態與原始設定 (持久化，由單一排程任務負責到期恢復)
+        self.raid_scheduler = RaidScheduler(self.restore_guild_settings)
+        # Raid 帳號的處置佇列 (每個伺服器批次封鎖或限速並行踢出)
+        self.raid_enforcer = RaidEnforcer()
+        # 各伺服器的防禦設定，以及編譯好的名稱過濾器快取 (規則變更時才重建)
+        self.raid_settings = load_raid_settings()
+        self.name_filters = {}
+        print("✅ RaidProtect Cog 載入成功，已新增帳號年齡檢查與 Webhook 防禦。")
+
+    
+    async def cog_load(self):
+        # 重啟後會繼續處理尚未結束的 Raid 模式
+        self.raid_scheduler.start()
+        # 年齡、名稱與 Raid 檢查排在黑名單之後、自動身分組與歡迎訊息之前
+        get_join_pipeline(self.bot).register(STAGE_RAID, 'RaidProtect', self.screen_member_join)
+
+    async def cog_unload(self):
+        get_join_pipeline(self.bot).unregister('RaidProtect')
+        self.raid_scheduler.stop()
+        self.raid_enforcer.stop()
+
+    # --- 輔助函數：伺服器設定 ---
+    def get_guild_raid_settings(self, guild_id: int) -> dict:
+        """取得伺服器的防禦設定，沒有時建立預設值。"""
+        guild_settings = self.raid_settings.setdefault(str(guild_id), {})
+        guild_settings.setdefault('name_keywords', [])
+        guild_settings.setdefault('name_patterns', [])
+        guild_settings.setdefault('raid_time_window', RAID_TIME_WINDOW)
+        guild_settings.setdefault('raid_threshold', RAID_THRESHOLD)
+        guild_settings.setdefault('raid_action', RAID_ACTION)
+        guild_settings.setdefault('cluster_detection', CLUSTER_DETECTION_DEFAULT)
+        guild_settings.setdefault('cluster_min_size', CLUSTER_MIN_SIZE)
+        return guild_settings
+
+    def get_raid_thresholds(self, guild_id: int):
+        """取得伺服器的 (時間範圍, 人數門檻)，沒有設定時使用預設值。"""
+        guild_settings = self.raid_settings.get(str(guild_id), {})
+        return (
+            guild_settings.get('raid_time_window', RAID_TIME_WINDOW),
+            guild_settings.get('raid_threshold', RAID_THRESHOLD),
+        )
+
+    def get_name_filter(self, guild_id: int) -> CompiledNameFilter:
+        """取得編譯好的名稱過濾器 (預設規則 + 伺服器自訂規則)。"""
+        name_filter = self.name_filters.get(guild_id)
+        if name_filter is None:
+            guild_settings = self.raid_settings.get(str(guild_id), {})
+            name_filter = CompiledNameFilter(
+                guild_settings.get('name_keywords', []),
+                BANNED_NAME_PATTERNS + guild_settings.get('name_patterns', [])
+            )
+            self.name_filters[guild_id] = name_filter
+        return name_filter
+
+    def update_name_rules(self, guild_id: int):
+        """名稱規則變更後儲存，並讓下一次檢查重新編譯過濾器。"""
+        save_raid_settings(self.raid_settings)
+        self.name_filters.pop(guild_id, None)
+
+    # --- 輔助函數：成員加入時間索引 ---
+    def get_join_index(self, guild: discord.Guild) -> JoinTimeIndex:
+        """取得伺服器的加入時間索引，第一次使用時由成員快取建立。"""
+        index = self.join_indexes.get(guild.id)
+        if index is None or (not index.complete and guild.chunked):
+            index = JoinTimeIndex(
+                ((member.joined_at.timestamp(), member.id) for member in guild.members if member.joined_at),
+                complete=guild.chunked
+            )
+            self.join_indexes[guild.id] = index
+        return index
+
+    # --- 輔助函數：檢查新成員名稱是否可疑 ---
+    def check_suspicious_name(self, member: discord.Member) -> bool:
+        """檢查用戶名稱是否命中任何名稱規則 (單次掃描，與規則數量無關)。"""
+        return self.get_name_filter(member.guild.id).match(member.name) is not None
+
+    # --- 輔助函數：檢查帳號年齡是否過低 ---
+    def check_account_age(self, member: discord.Member) -> bool:
+        """檢查帳號創建時間是否少於 MIN_ACCOUNT_AGE_DAYS。"""
+        required_age = timedelta(days=MIN_ACCOUNT_AGE_DAYS)
+        account_age = datetime.now(member.created_at.tzinfo) - member.created_at
+        return account_age < required_age
+
+    # --- 加入流程階段：新成員檢查 ---
+    async def screen_member_join(self, member: discord.Member) -> bool:
+        """加入流程的防禦階段，回傳 False 表示已拒絕此成員 (踢出或交給處置佇列)。"""
+        guild = member.guild
+        current_time = time.time()
+        
+        # 0. 忽略 Bot 自己的操作
+        if member.id == self.bot.user.id:
+            return True
+
+        # 已建立索引的伺服器才需要更新 (未建立時會在第一次使用時從成員快取建立)
+        index = self.join_indexes.get(guild.id)
+        if index is not None:
+            index.add(member.id, (member.joined_at or discord.utils.utcnow()).timestamp())
+
+        # 1. 帳號年齡檢查 (Anti-Alts)
+        if self.check_account_age(member):
+            try:
+                await guild.kick(member, reason=f"[RaidProtect: Anti-Alts] 帳號創建時間少於 {MIN_ACCOUNT_AGE_DAYS} 天。")
+                print(f"🚨 [年齡防禦] 在伺服器 {guild.name} 踢出新帳號 {member.display_name} ({member.id})。")
+            except discord.Forbidden:
+                print(f"❌ [年齡防禦] 權限不足，無法在 {guild.name} 踢出 {member.display_name}。")
+            return False
+            
+        # 2. 名稱檢查 (輕量級防禦)
+        if self.check_suspicious_name(member):
+            try:
+                await guild.kick(member, reason="[RaidProtect: Name] 名稱包含可疑關鍵字或廣告。")
+                print(f"🚨 [名稱防禦] 在伺服器 {guild.name} 踢出用戶 {member.display_name} ({member.id})。")
+            except discord.Forbidden:
+                print(f"❌ [名稱防禦] 權限不足，無法在 {guild.name} 踢出 {member.display_name}。")
+            return False
+            
+        # 3. 同批帳號檢查 (創建時間集中、名稱形狀相似的帳號陸續加入)
+        guild_settings = self.raid_settings.get(str(guild.id), {})
+        if guild_settings.get('cluster_detection', CLUSTER_DETECTION_DEFAULT):
+            cluster = self.cluster_detector.record_join(
+                guild.id, member.id, member.created_at.timestamp(), member.name,
+                min_size=guild_settings.get('cluster_min_size', CLUSTER_MIN_SIZE), now=current_time
+            )
+            if cluster:
+                action = guild_settings.get('raid_action', RAID_ACTION)
+                for member_id in cluster.member_ids:
+                    self.raid_enforcer.enqueue(guild, discord.Object(id=member_id), action,
+                                               "[RaidProtect: Cluster] 同一批建立的帳號集中加入。")
+                print(f"🚨 [同批帳號] 在伺服器 {guild.name} 偵測到 {cluster.size} 個同批帳號 "
+                      f"(名稱形狀相同比例 {cluster.shape_ratio:.0%})，已加入處置佇列。")
+                return False
+
+        # 4. Raid 模式檢查 (防止湧入)
+        
+        time_window, threshold = self.get_raid_thresholds(guild.id)
+        if self.raid_detector.record_join(guild.id, threshold, time_window, now=current_time):
+            await self.trigger_raid_mode(guild, member)
+            
+        # 5. 處理 Raid 模式下的加入 (交給處置佇列批次處理，不在事件中逐一等待)
+        if self.raid_scheduler.is_active(guild.id):
+            action = self.raid_settings.get(str(guild.id), {}).get('raid_action', RAID_ACTION)
+            self.raid_enforcer.enqueue(guild, member, action, "[RaidProtect: Flood] 伺服器處於 Raid 防禦模式。")
+            return False
+
+        return True
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        index = self.join_indexes.get(member.guild.id)
+        if index is not None:
+            index.remove(member.id)
+
+    # --- 核心防禦邏輯 ---
+    async def trigger_raid_mode(self, guild: discord.Guild, triggering_member: discord.Member):
+        
+        ends_at = time.time() + RAID_PENALTY_DURATION
+        if self.raid_scheduler.is_active(guild.id):
+            self.raid_scheduler.extend(guild.id, ends_at)
+            print(f"⚠️ [RaidProtect] 伺服器 {guild.name} Raid 模式時間延長。")
+            return
+            
+        print(f"🔥 [RaidProtect] 伺服器 {guild.name} 觸發 Raid 模式！")
+        
+        # 1. 先記錄原始設定，再提高驗證等級 (提高到 'Highest' - 必須有電話驗證)
+        original_settings = {"verification_level": guild.verification_level.value}
+        self.raid_scheduler.start_episode(guild.id, ends_at, original_settings)
+        try:
+            await guild.edit(verification_level=discord.VerificationLevel.highest, reason="[RaidProtect] 進入 Raid 防禦模式。")
+            print(f"✅ 在 {guild.name} 將驗證等級提高到 'Highest'。")
+        except discord.Forbidden:
+            print(f"❌ 權限不足，無法在 {guild.name} 更改驗證等級。")
+            
+        # 2. 移除新加入成員的紀錄，防止重複觸發
+        self.raid_detector.reset(guild.id)
+        
+        # 3. 到期後由 raid_scheduler 呼叫 restore_guild_settings 恢復設定
+
+    async def restore_guild_settings(self, guild_id: int, episode: dict):
+        """Raid 模式結束：將伺服器恢復為進入 Raid 模式前的設定。"""
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            print(f"⚠️ [RaidProtect] 找不到伺服器 {guild_id}，略過恢復設定。")
+            return
+        if self.raid_scheduler.get(guild_id) is not episode:
+            # 恢復前又觸發了新的 Raid 模式 (沿用同一份原始設定)，由新的紀錄到期時恢復
+            return
+
+        original_level = discord.VerificationLevel(episode['original']['verification_level'])
+        try:
+            if guild.verification_level != original_level:
+                await guild.edit(verification_level=original_level, reason="[RaidProtect] 結束 Raid 防禦模式，恢復設定。")
+                print(f"✅ 在 {guild.name} 恢復驗證等級為 '{original_level.name}'。")
+        except discord.Forbidden:
+            print(f"❌ 權限不足，無法在 {guild.name} 恢復驗證等級。")
+        finally:
+            print(f"✅ 在 {guild.name} 退出 Raid 模式。")
+                
+    # --- 斜線指令：Raid 防禦設定 ---
+    raid_group = app_commands.Group(name="raid", description="Raid 防禦設定")
+
+    @raid_group.command(name='config', description='[管理員指令] 設定觸發 Raid 模式的加入頻率門檻。')
+    @app_commands.describe(time_window='計算加入人數的時間範圍 (秒)', threshold='時間範圍內加入多少人即觸發 Raid 模式')
+    @app_commands.default_permissions(administrator=True)
+    async def raid_config_cmd(self, interaction: discord.Interaction,
+                              time_window: app_commands.Range[int, 1, 3600] = RAID_TIME_WINDOW,
+                              threshold: app_commands.Range[int, 2, 1000] = RAID_THRESHOLD):
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        guild_settings['raid_time_window'] = time_window
+        guild_settings['raid_threshold'] = threshold
+        save_raid_settings(self.raid_settings)
+        await interaction.response.send_message(
+            f"✅ Raid 門檻已更新：**{time_window}** 秒內加入 **{threshold}** 人即觸發 Raid 模式。",
+            ephemeral=True
+        )
+
+    @raid_group.command(name='action', description='[管理員指令] 設定 Raid 模式下對新加入帳號的處置方式。')
+    @app_commands.describe(action='踢出或封鎖 (封鎖會以每批最多 200 人的方式批次處理)')
+    @app_commands.choices(action=[
+        app_commands.Choice(name='踢出', value='kick'),
+        app_commands.Choice(name='封鎖', value='ban'),
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def raid_action_cmd(self, interaction: discord.Interaction, action: app_commands.Choice[str]):
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        guild_settings['raid_action'] = action.value
+        save_raid_settings(self.raid_settings)
+        await interaction.response.send_message(f"✅ Raid 模式下的新加入帳號將會被 **{action.name}**。", ephemeral=True)
+
+    @raid_group.command(name='cluster', description='[管理員指令] 設定同批建立帳號的偵測。')
+    @app_commands.describe(enabled='是否啟用同批帳號偵測', min_size='創建時間相近的帳號達到多少個即處置')
+    @app_commands.default_permissions(administrator=True)
+    async def raid_cluster_cmd(self, interaction: discord.Interaction, enabled: bool,
+                               min_size: app_commands.Range[int, 3, 100] = CLUSTER_MIN_SIZE):
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        guild_settings['cluster_detection'] = enabled
+        guild_settings['cluster_min_size'] = min_size
+        save_raid_settings(self.raid_settings)
+        if enabled:
+            message = f"✅ 已啟用同批帳號偵測：創建時間相近的帳號加入達 **{min_size}** 個即處置。"
+        else:
+            message = "✅ 已停用同批帳號偵測。"
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @raid_group.command(name='status', description='[管理員指令] 查看 Raid 模式狀態與處置統計。')
+    @app_commands.default_permissions(administrator=True)
+    async def raid_status_cmd(self, interaction: discord.Interaction):
+        guild_id = interaction.guild_id
+        time_window, threshold = self.get_raid_thresholds(guild_id)
+        action = self.raid_settings.get(str(guild_id), {}).get('raid_action', RAID_ACTION)
+
+        embed = discord.Embed(title="🛡️ Raid 防禦狀態", color=discord.Color.orange())
+        episode = self.raid_scheduler.get(guild_id)
+        if self.raid_scheduler.is_active(guild_id):
+            embed.add_field(name="Raid 模式", value=f"🔥 進行中，<t:{int(episode['ends_at'])}:R> 結束", inline=False)
+        else:
+            embed.add_field(name="Raid 模式", value="未啟動", inline=False)
+        embed.add_field(name="觸發門檻", value=f"{time_window} 秒內 {threshold} 人")
+        embed.add_field(name="處置方式", value="封鎖" if action == 'ban' else "踢出")
+
+        stats = self.raid_enforcer.stats.get(guild_id)
+        if stats is not None:
+            embed.add_field(
+                name="處置統計",
+                value=(f"已處置：{stats.enforced}｜失敗：{stats.failed}｜待處理：{stats.pending}\n"
+                       f"批次數：{stats.batches}｜速率：{stats.throughput:.1f} 帳號/秒"),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @raid_group.command(name='cleanup', description='[管理員指令] 處置在指定時間範圍內加入的成員 (Raid 事後清理)。')
+    @app_commands.describe(
+        since_minutes='處置幾分鐘前到現在 (或 until_minutes 之前) 加入的成員',
+        until_minutes='範圍結束於幾分鐘前 (預設為現在)',
+        action='踢出或封鎖',
+        max_account_age_days='只處置帳號創建少於此天數的成員',
+        name_rules_only='只處置名稱命中名稱過濾規則的成員',
+        preview='只顯示符合條件的人數，不實際處置'
+    )
+    @app_commands.choices(action=[
+        app_commands.Choice(name='踢出', value='kick'),
+        app_commands.Choice(name='封鎖', value='ban'),
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def raid_cleanup_cmd(self, interaction: discord.Interaction,
+                               since_minutes: app_commands.Range[int, 1, 43200],
+                               action: app_commands.Choice[str],
+                               until_minutes: app_commands.Range[int, 0, 43200] = 0,
+                               max_account_age_days: Optional[app_commands.Range[int, 1, 3650]] = None,
+                               name_rules_only: bool = False,
+                               preview: bool = False):
+        if until_minutes >= since_minutes:
+            await interaction.response.send_message("❌ `until_minutes` 必須小於 `since_minutes`。", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        guild = interaction.guild
+        if not guild.chunked:
+            await guild.chunk()
+
+        now = time.time()
+        member_ids = self.get_join_index(guild).between(now - since_minutes * 60, now - until_minutes * 60)
+
+        name_filter = self.get_name_filter(guild.id)
+        min_created = now - max_account_age_days * 86400 if max_account_age_days else None
+        targets = []
+        for member_id in member_ids:
+            member = guild.get_member(member_id)
+            if member is None or member.bot or member == interaction.user or member.guild_permissions.administrator:
+                continue
+            if min_created is not None and member.created_at.timestamp() < min_created:
+                continue
+            if name_rules_only and name_filter.match(member.name) is None:
+                continue
+            targets.append(member)
+
+        summary = f"{since_minutes} 分鐘前至 {until_minutes} 分鐘前加入" if until_minutes else f"最近 {since_minutes} 分鐘內加入"
+        if preview or not targets:
+            await interaction.followup.send(
+                f"🔍 {summary}的成員共 {len(member_ids)} 人，符合條件 **{len(targets)}** 人。", ephemeral=True
+            )
+            return
+
+        progress_message = await interaction.followup.send(
+            f"⏳ 正在{action.name} {len(targets)} 位成員...", ephemeral=True, wait=True
+        )
+
+        async def report(done, total):
+            try:
+                await progress_message.edit(content=f"⏳ 正在{action.name}成員：{done}/{total}")
+            except discord.HTTPException:
+                # 互動逾時或編輯受限時略過，不中斷清理
+                pass
+
+        started = time.perf_counter()
+        enforced, failed = await self.raid_enforcer.enforce_now(
+            guild, targets, action.value, f"[RaidProtect: Cleanup] 由 {interaction.user} 清理 Raid 帳號。", progress=report
+        )
+        result = (f"✅ 清理完成：{action.name} **{enforced}** 人，失敗 {failed} 人 "
+                  f"(耗時 {time.perf_counter() - started:.1f} 秒)。")
+        try:
+            await progress_message.edit(content=result)
+        except discord.HTTPException:
+            # 互動 token 已過期時無法再回覆，至少留下紀錄
+            print(f"ℹ️ [RaidProtect] 伺服器 {guild.name} {result}")
+
+    # --- 斜線指令：名稱過濾規則 ---
+    name_filter_group = app_commands.Group(name="namefilter", description="新成員名稱過濾規則")
+
+    @name_filter_group.command(name='add_keyword', description='[管理員指令] 新增名稱關鍵字，名稱包含此字的新成員會被踢出。')
+    @app_commands.describe(keyword='要過濾的關鍵字 (不分大小寫)')
+    @app_commands.default_permissions(administrator=True)
+    async def add_keyword_cmd(self, interaction: discord.Interaction, keyword: app_commands.Range[str, 1, 100]):
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        keyword = keyword.lower()
+        if keyword in guild_settings['name_keywords']:
+            await interaction.response.send_message(f"⚠️ 關鍵字 `{keyword}` 已經存在。", ephemeral=True)
+            return
+        if len(guild_settings['name_keywords']) + len(guild_settings['name_patterns']) >= MAX_NAME_RULES:
+            await interaction.response.send_message(f"❌ 每個伺服器最多只能設定 {MAX_NAME_RULES} 條規則。", ephemeral=True)
+            return
+
+        guild_settings['name_keywords'].append(keyword)
+        self.update_name_rules(interaction.guild_id)
+        await interaction.response.send_message(f"✅ 已新增名稱關鍵字 `{keyword}`。", ephemeral=True)
+
+    @name_filter_group.command(name='add_pattern', description='[管理員指令] 新增名稱正規表達式規則。')
+    @app_commands.describe(pattern='正規表達式 (會以小寫名稱比對)')
+    @app_commands.default_permissions(administrator=True)
+    async def add_pattern_cmd(self, interaction: discord.Interaction, pattern: app_commands.Range[str, 1, 200]):
+        error = validate_pattern(pattern)
+        if error:
+            await interaction.response.send_message(f"❌ 正規表達式無效：{error}", ephemeral=True)
+            return
+
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        if pattern in guild_settings['name_patterns'] or pattern in BANNED_NAME_PATTERNS:
+            await interaction.response.send_message(f"⚠️ 規則 `{pattern}` 已經存在。", ephemeral=True)
+            return
+        if len(guild_settings['name_keywords']) + len(guild_settings['name_patterns']) >= MAX_NAME_RULES:
+            await interaction.response.send_message(f"❌ 每個伺服器最多只能設定 {MAX_NAME_RULES} 條規則。", ephemeral=True)
+            return
+        # 以合併後的完整過濾器驗證，避免單獨有效的規則在合併後無法編譯
+        error = validate_merged(BANNED_NAME_PATTERNS + guild_settings['name_patterns'] + [pattern])
+        if error:
+            await interaction.response.send_message(f"❌ 正規表達式無法與現有規則合併：{error}", ephemeral=True)
+            return
+
+        guild_settings['name_patterns'].append(pattern)
+        self.update_name_rules(interaction.guild_id)
+        await interaction.response.send_message(f"✅ 已新增名稱規則 `{pattern}`。", ephemeral=True)
+
+    @name_filter_group.command(name='remove', description='[管理員指令] 移除一條名稱關鍵字或規則。')
+    @app_commands.describe(rule='要移除的關鍵字或正規表達式')
+    @app_commands.default_permissions(administrator=True)
+    async def remove_rule_cmd(self, interaction: discord.Interaction, rule: str):
+        guild_settings = self.get_guild_raid_settings(interaction.guild_id)
+        if rule.lower() in guild_settings['name_keywords']:
+            guild_settings['name_keywords'].remove(rule.lower())
+        elif rule in guild_settings['name_patterns']:
+            guild_settings['name_patterns'].remove(rule)
+        else:
+            await interaction.response.send_message(f"⚠️ 找不到規則 `{rule}` (內建規則無法移除)。", ephemeral=True)
+            return
+
+        self.update_name_rules(interaction.guild_id)
+        await interaction.response.send_message(f"✅ 已移除規則 `{rule}`。", ephemeral=True)
+
+    @name_filter_group.command(name='list', description='[管理員指令] 顯示本伺服器的名稱過濾規則。')
+    @app_commands.default_permissions(administrator=True)
+    async def list_rules_cmd(self, interaction: discord.Interaction):
+        guild_settings = self.raid_settings.get(str(interaction.guild_id), {})
+        keywords = guild_settings.get('name_keywords', [])
+        patterns = guild_settings.get('name_patterns', [])
+
+        embed = discord.Embed(title="🛡️ 名稱過濾規則", color=discord.Color.orange())
+        embed.add_field(name="內建規則", value="\n".join(f"`{p}`" for p in BANNED_NAME_PATTERNS), inline=False)
+        embed.add_field(name=f"關鍵字 ({len(keywords)})", value=", ".join(f"`{k}`" for k in keywords)[:1024] or "無", inline=False)
+        embed.add_field(name=f"正規表達式 ({len(patterns)})", value="\n".join(f"`{p}`" for p in patterns)[:1024] or "無", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# --- 載入 Cog 函數 ---
+async def setup(bot):
     await bot.add_cog(RaidProtect(bot))
\ No newline at end of file
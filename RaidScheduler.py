@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+# Raid 模式的進行中紀錄 (重啟後仍可恢復原始設定)
+RAID_EPISODES_FILE = 'raid_episodes.json'
+# 延長 Raid 模式時，結束時間至少要往後移多少秒才會更新 (避免湧入時每次加入都寫入檔案)
+RAID_EXTEND_MIN_STEP_SECONDS = 30
+
+
+class RaidScheduler:
+    """持久化的 Raid 模式排程器。
+
+    每個伺服器的 Raid 模式 (結束時間與原始設定) 存在 JSON 檔案中，並以一個
+    依結束時間排序的 heap 由單一背景任務負責到期恢復。延長懲罰只會更新結束
+    時間並放入新的 heap 項目，舊的項目在取出時會被略過，不需要額外的等待任務。
+    """
+
+    def __init__(self, restore_callback: Callable[[int, dict], Awaitable[None]],
+                 path: str = RAID_EPISODES_FILE):
+        self.restore_callback = restore_callback
+        self.path = path
+        # {guild_id: {"ends_at": epoch 秒, "started_at": epoch 秒, "original": {...}}}
+        self.episodes = self._load()
+        self._heap = [(episode['ends_at'], guild_id) for guild_id, episode in self.episodes.items()]
+        heapq.heapify(self._heap)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # 寫檔在背景執行緒進行，期間的多次變更合併為一次寫入
+        self._save_task = None
+        self._dirty = False
+
+    # --- 持久化 ---
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            episodes = {int(guild_id): episode for guild_id, episode in data.items()}
+            for episode in episodes.values():
+                float(episode['ends_at'])
+            return episodes
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # 保留無效的檔案供手動恢復原始設定，避免下次寫入時被覆蓋
+            backup_path = self.path + '.corrupt'
+            try:
+                os.replace(self.path, backup_path)
+            except OSError:
+                backup_path = None
+            print(f"警告：無法載入 {self.path} ({type(e).__name__}: {e})，已忽略進行中的 Raid 模式紀錄"
+                  + (f"，原檔案已移至 {backup_path}。" if backup_path else "。"))
+            return {}
+
+    def _snapshot(self) -> dict:
+        return {str(guild_id): dict(episode) for guild_id, episode in self.episodes.items()}
+
+    def _write(self, data: dict):
+        """寫入進行中的紀錄 (先寫入暫存檔再取代，避免寫入中斷損壞紀錄)。"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def _save(self):
+        """要求寫入檔案；在事件迴圈中時交給背景執行緒，尚未寫完時的變更會合併到下一次寫入。"""
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._write(self._snapshot())
+            return
+        self._save_task = loop.create_task(self._flush())
+
+    async def _flush(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, self._snapshot())
+            except OSError as e:
+                print(f"❌ [RaidProtect] 寫入 {self.path} 時發生錯誤: {e}")
+
+    # --- 查詢 ---
+    def is_active(self, guild_id: int, now: float = None) -> bool:
+        episode = self.episodes.get(guild_id)
+        now = time.time() if now is None else now
+        return episode is not None and now < episode['ends_at']
+
+    def get(self, guild_id: int) -> Optional[dict]:
+        return self.episodes.get(guild_id)
+
+    # --- 排程 ---
+    def start_episode(self, guild_id: int, ends_at: float, original: dict) -> dict:
+        """開始一次 Raid 模式，original 為進入前的伺服器設定 (結束時原樣恢復)。
+
+        上一次 Raid 模式已到期但尚未恢復完成時，沿用其原始設定，
+        避免把仍在限制中的設定記成原始設定而永遠無法恢復。
+        """
+        previous = self.episodes.get(guild_id)
+        if previous is not None:
+            original = previous['original']
+        episode = {"ends_at": ends_at, "started_at": time.time(), "original": original}
+        self.episodes[guild_id] = episode
+        self._save()
+        self._push(ends_at, guild_id)
+        return episode
+
+    def extend(self, guild_id: int, ends_at: float):
+        """延長進行中的 Raid 模式 (只會往後延，且至少延長 RAID_EXTEND_MIN_STEP_SECONDS 才更新)。"""
+        episode = self.episodes.get(guild_id)
+        if episode is None or ends_at < episode['ends_at'] + RAID_EXTEND_MIN_STEP_SECONDS:
+            return
+        previous_ends_at = episode['ends_at']
+        episode['ends_at'] = ends_at
+        self._save()
+        # 以新的期限取代原本的 heap 項目，而不是再放入一個
+        try:
+            index = self._heap.index((previous_ends_at, guild_id))
+        except ValueError:
+            self._push(ends_at, guild_id)
+            return
+        self._heap[index] = (ends_at, guild_id)
+        heapq.heapify(self._heap)
+
+    def _push(self, ends_at: float, guild_id: int):
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (ends_at, guild_id))
+        if earliest is None or ends_at < earliest:
+            # 新的最早期限，喚醒排程任務重新計算等待時間
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            ends_at, guild_id = self._heap[0]
+            delay = ends_at - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            episode = self.episodes.get(guild_id)
+            if episode is None or episode['ends_at'] != ends_at:
+                # 已被延長或已結束的舊項目
+                continue
+
+            try:
+                await self.restore_callback(guild_id, episode)
+            except Exception as e:
+                print(f"❌ [RaidProtect] 恢復伺服器 {guild_id} 設定時發生錯誤: {e}")
+            finally:
+                # 恢復期間若又被延長，保留新的紀錄
+                if self.episodes.get(guild_id) is episode and episode['ends_at'] == ends_at:
+                    del self.episodes[guild_id]
+                    self._save()
@@ -0,0 +1,466 @@
+"""成員加入路徑壓力測試：以模擬的伺服器與成員大量觸發 on_member_join。
+
+每位模擬成員都交給與 app.py 相同的加入流程 (GlobalBan 黑名單 → RaidProtect 檢查，
+加上 --app 時再經過自動身分組與歡迎訊息)，每個加入事件各自成為一個任務。Discord REST
+呼叫 (踢出、封鎖、批次封鎖、修改伺服器、賦予身分組、發送訊息) 以記錄時間的
+假物件代替，並可設定模擬延遲。
+
+量測項目：整個加入流程與各階段的決策延遲百分位數、各階段拒絕的人數、事件迴圈延遲、REST 動作數量與最大
+同時進行數、最後一位成員加入後處置完成所需時間，以及記憶體使用量。
+
+輸出為 JSON，可用 --compare 與上一次的結果比較，找出版本之間的效能退化。
+
+使用方式：
+  python RaidSimulator.py --joins 5000 --rate 200 --raid-fraction 0.3 --output raid.json
+  python RaidSimulator.py --joins 5000 --rate 200 --raid-fraction 0.3 --compare raid.json
+  python RaidSimulator.py --app   # 同時測試 app.py 的自動身分組與歡迎訊息階段 (需要在 token.txt 所在的目錄執行)
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+from JoinPipeline import STAGE_AUTO_ROLE, STAGE_WELCOME, get_join_pipeline
+
+# 事件迴圈延遲的取樣間隔 (秒)
+LOOP_LAG_INTERVAL = 0.01
+# 最後一位成員加入後，最多等待處置完成的時間 (秒)
+DRAIN_TIMEOUT = 120
+
+
+def percentiles(values, points=(0.5, 0.95, 0.99)) -> dict:
+    if not values:
+        return {f"p{int(p * 100)}": None for p in points} | {"max": None}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        result[f"p{int(p * 100)}"] = round(ordered[index] * 1000, 3)
+    result["max"] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+class RestRecorder:
+    """記錄模擬的 Discord REST 呼叫，並以固定延遲模擬網路往返。"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.actions = Counter()
+        self.affected = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.last_finished = 0.0
+
+    async def call(self, action: str, affected: int = 1):
+        self.actions[action] += 1
+        self.affected[action] += affected
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+            self.last_finished = time.perf_counter()
+
+
+class FakeRole:
+    def __init__(self, role_id: int, position: int):
+        self.id = role_id
+        self.name = f"role-{role_id}"
+        self.position = position
+
+    def __ge__(self, other):
+        return self.position >= other.position
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, rest: RestRecorder):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.rest = rest
+
+    def permissions_for(self, member):
+        return SimpleNamespace(send_messages=True)
+
+    async def send(self, *args, **kwargs):
+        await self.rest.call('send_message')
+
+
+class FakeGuild:
+    """模擬 discord.Guild：成員快取與會被呼叫的 REST 方法。"""
+
+    def __init__(self, guild_id: int, rest: RestRecorder):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.rest = rest
+        self.verification_level = discord.VerificationLevel.low
+        self.chunked = True
+        self._members = {}
+        self.me = SimpleNamespace(top_role=FakeRole(0, 100))
+        self.system_channel = FakeChannel(guild_id * 10, rest)
+        self.text_channels = [self.system_channel]
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return None
+
+    def get_channel(self, channel_id):
+        return self.system_channel if channel_id == self.system_channel.id else None
+
+    async def chunk(self):
+        return self.members
+
+    async def kick(self, user, reason=None):
+        self._members.pop(user.id, None)
+        await self.rest.call('kick')
+
+    async def ban(self, user, reason=None, **kwargs):
+        self._members.pop(user.id, None)
+        await self.rest.call('ban')
+
+    async def bulk_ban(self, users, reason=None, **kwargs):
+        users = list(users)
+        for user in users:
+            self._members.pop(user.id, None)
+        await self.rest.call('bulk_ban', affected=len(users))
+        return SimpleNamespace(banned=[discord.Object(id=user.id) for user in users], failed=[])
+
+    async def edit(self, verification_level=None, reason=None, **kwargs):
+        if verification_level is not None:
+            self.verification_level = verification_level
+        await self.rest.call('edit_guild')
+
+
+class FakeMember:
+    def __init__(self, member_id: int, name: str, created_at: datetime, guild: FakeGuild):
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.created_at = created_at
+        self.joined_at = discord.utils.utcnow()
+        self.guild = guild
+        self.bot = False
+        self.mention = f"<@{member_id}>"
+        self.display_avatar = SimpleNamespace(url="https://cdn.discordapp.com/embed/avatars/0.png")
+        self.guild_permissions = discord.Permissions.none()
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.rest.call('add_roles')
+
+
+class FakeBot:
+    """模擬 commands.Bot，只提供 cog 會用到的屬性。"""
+
+    def __init__(self, guilds):
+        self.user = SimpleNamespace(id=1, name="RaidSimulator")
+        self._guilds = {guild.id: guild for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    async def wait_until_ready(self):
+        return None
+
+
+class JoinScenario:
+    """產生模擬加入事件：一般帳號、新帳號、黑名單帳號，以及同一批建立的 Raid 帳號。"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.now = datetime.now(timezone.utc)
+        # Raid 帳號在同一小時內建立，名稱形狀相同
+        self.raid_created = self.now - timedelta(days=self.random.randint(30, 400))
+        self.next_id = 10 ** 17
+
+    def make_member(self, guild: FakeGuild, blacklist_ids: list) -> tuple:
+        roll = self.random.random()
+        args = self.args
+        if roll < args.raid_fraction:
+            kind = 'raid'
+            member_id = self._new_id()
+            created_at = self.raid_created + timedelta(seconds=self.random.random() * 1800)
+            name = f"freenitro{self.random.randint(1000, 9999)}"
+        elif roll < args.raid_fraction + args.young_fraction:
+            kind = 'young'
+            member_id = self._new_id()
+            created_at = self.now - timedelta(hours=self.random.random() * 72)
+            name = self._random_name()
+        elif roll < args.raid_fraction + args.young_fraction + args.blacklisted_fraction and blacklist_ids:
+            kind = 'blacklisted'
+            member_id = self.random.choice(blacklist_ids)
+            created_at = self.now - timedelta(days=self.random.randint(30, 3000))
+            name = self._random_name()
+        else:
+            kind = 'normal'
+            member_id = self._new_id()
+            created_at = self.now - timedelta(days=self.random.randint(30, 3000), seconds=self.random.randint(0, 86400))
+            name = self._random_name()
+        return kind, FakeMember(member_id, name, created_at, guild)
+
+    def _new_id(self) -> int:
+        self.next_id += self.random.randint(1, 1000)
+        return self.next_id
+
+    def _random_name(self) -> str:
+        letters = "abcdefghijklmnopqrstuvwxyz_."
+        return "".join(self.random.choice(letters) for _ in range(self.random.randint(4, 14)))
+
+
+class RaidSimulator:
+    def __init__(self, args, pipeline, cogs, guilds, rest, blacklist_ids):
+        self.args = args
+        self.pipeline = pipeline
+        self.cogs = cogs
+        self.guilds = guilds
+        self.rest = rest
+        self.blacklist_ids = blacklist_ids
+        self.scenario = JoinScenario(args)
+
+        self.stage_names = [name for _, name, _ in pipeline.stages]
+        self.decision_latency = {name: [] for name in ['join_pipeline'] + self.stage_names}
+        self.loop_lag = []
+        self.kinds = Counter()
+        self.rejected_by = Counter()
+        self.errors = Counter()
+        self.max_enforcement_pending = 0
+
+        # 包裝每個階段以量測各自的決策延遲
+        for order, name, stage in pipeline.stages:
+            pipeline.register(order, name, self._timed_stage(name, stage))
+
+    def _enforcement_pending(self) -> int:
+        raid_protect = self.cogs.get('RaidProtect')
+        if raid_protect is None:
+            return 0
+        return sum(stats.pending for stats in raid_protect.raid_enforcer.stats.values())
+
+    async def _monitor(self, stop: asyncio.Event):
+        """量測事件迴圈延遲並取樣處置佇列長度。"""
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag.append(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+            self.max_enforcement_pending = max(self.max_enforcement_pending, self._enforcement_pending())
+
+    def _timed_stage(self, name, stage):
+        async def timed(member):
+            started = time.perf_counter()
+            try:
+                return await stage(member)
+            except Exception as e:
+                self.errors[f"{name}: {type(e).__name__}"] += 1
+                raise
+            finally:
+                self.decision_latency[name].append(time.perf_counter() - started)
+        return timed
+
+    async def _run_join(self, member):
+        started = time.perf_counter()
+        rejected_by = await self.pipeline.run(member)
+        self.decision_latency['join_pipeline'].append(time.perf_counter() - started)
+        self.rejected_by[rejected_by or 'accepted'] += 1
+
+    async def _drain(self) -> bool:
+        """等待背景處置 (Raid 處置佇列) 完成，回傳是否在 DRAIN_TIMEOUT 內完成。"""
+        raid_protect = self.cogs.get('RaidProtect')
+        if raid_protect is None:
+            return True
+        return await raid_protect.raid_enforcer.wait_idle(DRAIN_TIMEOUT)
+
+    async def run(self) -> dict:
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(self._monitor(stop))
+        interval = 1 / self.args.rate if self.args.rate > 0 else 0
+        tasks = []
+
+        started = time.perf_counter()
+        for index in range(self.args.joins):
+            guild = self.guilds[index % len(self.guilds)]
+            kind, member = self.scenario.make_member(guild, self.blacklist_ids)
+            self.kinds[kind] += 1
+            guild._members[member.id] = member
+            # 與 discord.py 的 dispatch 相同：每個加入事件各自成為一個任務
+            tasks.append(asyncio.create_task(self._run_join(member)))
+            if interval:
+                # 依目標速率排程，而不是每次固定 sleep，避免累積誤差
+                delay = started + (index + 1) * interval - time.perf_counter()
+                # 落後時仍讓出事件迴圈，與 gateway 逐一分派事件的情況相同
+                await asyncio.sleep(max(delay, 0))
+            else:
+                await asyncio.sleep(0)
+        joins_done = time.perf_counter()
+        await asyncio.gather(*tasks)
+        drained = await self._drain()
+        finished = max(time.perf_counter(), self.rest.last_finished)
+
+        stop.set()
+        await monitor
+
+        raid_protect = self.cogs.get('RaidProtect')
+        report = {
+            "config": {
+                "joins": self.args.joins,
+                "rate_per_second": self.args.rate,
+                "guilds": self.args.guilds,
+                "raid_fraction": self.args.raid_fraction,
+                "young_fraction": self.args.young_fraction,
+                "blacklisted_fraction": self.args.blacklisted_fraction,
+                "blacklist_size": self.args.blacklist_size,
+                "rest_latency": self.args.rest_latency,
+                "stages": self.stage_names,
+                "seed": self.args.seed,
+            },
+            "elapsed_seconds": round(joins_done - started, 3),
+            "drain_seconds": round(finished - joins_done, 3),
+            # 逾時時 drain_seconds 只是等待的時間，並不代表處置已完成
+            "drain_timed_out": not drained,
+            "drain_pending_actions": raid_protect.raid_enforcer.pending_actions() if raid_protect else 0,
+            "joins_by_kind": dict(self.kinds),
+            "rejected_by": dict(self.rejected_by),
+            "decision_latency_ms": {name: percentiles(values) for name, values in self.decision_latency.items()},
+            "loop_lag_ms": percentiles(self.loop_lag),
+            "rest_actions": dict(self.rest.actions),
+            "rest_affected_members": dict(self.rest.affected),
+            "rest_max_in_flight": self.rest.max_in_flight,
+            "max_enforcement_pending": self.max_enforcement_pending,
+            "members_remaining": sum(len(guild._members) for guild in self.guilds),
+            "listener_errors": dict(self.errors),
+        }
+        if raid_protect is not None:
+            report["raid_mode_guilds"] = sum(
+                1 for guild in self.guilds if raid_protect.raid_scheduler.get(guild.id) is not None
+            )
+        return report
+
+
+def compare_reports(current: dict, baseline: dict, prefix: str = "") -> list:
+    """比較兩份報告中的數值，回傳 (欄位, 基準值, 目前值, 變化百分比)。"""
+    rows = []
+    for key, value in current.items():
+        if key == "config":
+            continue
+        path = f"{prefix}{key}"
+        old = baseline.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            rows.extend(compare_reports(value, old, f"{path}."))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            change = (value - old) / old * 100 if old else None
+            rows.append((path, old, value, change))
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="成員加入路徑壓力測試 (Raid 模擬)")
+    parser.add_argument('--joins', type=int, default=2000, help="模擬加入總數")
+    parser.add_argument('--rate', type=float, default=100, help="每秒加入數 (0 表示一次全部加入)")
+    parser.add_argument('--guilds', type=int, default=1, help="模擬伺服器數量 (加入平均分配)")
+    parser.add_argument('--raid-fraction', type=float, default=0.3, help="同一批建立的 Raid 帳號比例")
+    parser.add_argument('--young-fraction', type=float, default=0.05, help="創建不到 3 天的帳號比例")
+    parser.add_argument('--blacklisted-fraction', type=float, default=0.02, help="全域黑名單帳號比例")
+    parser.add_argument('--blacklist-size', type=int, default=10000, help="全域黑名單的大小")
+    parser.add_argument('--rest-latency', type=float, default=0.05, help="模擬 Discord REST 延遲 (秒)")
+    parser.add_argument('--app', action='store_true', help="同時測試 app.py 的自動身分組與歡迎訊息階段 (需要在 token.txt 所在的目錄執行)")
+    parser.add_argument('--no-cluster', action='store_true', help="不啟用同批帳號偵測 (預設在模擬伺服器中啟用)")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="不量測記憶體 (減少量測本身的負擔)")
+    parser.add_argument('--verbose', action='store_true', help="顯示 cog 的輸出")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="將結果寫入 JSON 檔案")
+    parser.add_argument('--compare', default=None, help="與先前的 JSON 結果比較")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    import GlobalBan
+    import RaidProtect
+
+    app = None
+    if args.app:
+        try:
+            import app
+        except SystemExit:
+            print("⚠️ 無法載入 app.py (缺少 token.txt)，略過自動身分組與歡迎訊息階段。", file=sys.stderr)
+
+    # cog 以相對路徑讀寫 JSON，在暫存目錄中執行，避免動到實際資料；結束時刪除暫存目錄
+    previous_cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory(prefix='raidsim-')
+    os.chdir(workdir.name)
+    try:
+        rest = RestRecorder(args.rest_latency)
+        rng = random.Random(args.seed + 1)
+        blacklist_ids = [rng.randrange(10 ** 16, 10 ** 17) for _ in range(args.blacklist_size)]
+        GlobalBan.save_blacklist({str(user_id): {"reason": "模擬"} for user_id in blacklist_ids})
+
+        guilds = [FakeGuild(1000 + index, rest) for index in range(args.guilds)]
+        bot = FakeBot(guilds)
+
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        if not args.no_tracemalloc:
+            tracemalloc.start()
+        with output:
+            raid_protect = RaidProtect.RaidProtect(bot)
+            # 同批帳號偵測預設關閉，模擬時與管理員執行 /raid cluster 相同地啟用
+            for guild in guilds:
+                raid_protect.get_guild_raid_settings(guild.id)['cluster_detection'] = not args.no_cluster
+            global_ban = GlobalBan.GlobalBan(bot)
+            await raid_protect.cog_load()
+            await global_ban.cog_load()
+            cogs = {'RaidProtect': raid_protect, 'GlobalBan': global_ban}
+            pipeline = get_join_pipeline(bot)
+            if app is not None:
+                pipeline.register(STAGE_AUTO_ROLE, 'auto_role', app.assign_auto_role)
+                pipeline.register(STAGE_WELCOME, 'welcome', app.send_welcome_message)
+
+            simulator = RaidSimulator(args, pipeline, cogs, guilds, rest, blacklist_ids)
+            report = await simulator.run()
+            await raid_protect.cog_unload()
+            await global_ban.cog_unload()
+
+        if not args.no_tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report["memory_kb"] = {"current": round(current / 1024, 1), "peak": round(peak / 1024, 1)}
+        report["raid_detector_guilds"] = len(raid_protect.raid_detector)
+        return report
+    finally:
+        os.chdir(previous_cwd)
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    # main() 會切換到暫存目錄，先將輸出路徑轉為絕對路徑
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\n--- 與基準結果比較 ---")
+        for path, old, new, change in compare_reports(report, baseline):
+            change_text = f"{change:+.1f}%" if change is not None else "n/a"
+            print(f"{path:<45} {old:>12} → {new:<12} {change_text}")
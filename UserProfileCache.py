@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import time
+from typing import Iterable, Optional
+
+import discord
+
+from RaidEnforcement import call_with_retries
+
+# 用戶資料快取檔案
+USER_CACHE_FILE = 'user_profile_cache.json'
+# 每筆用戶資料的存活時間 (秒)
+USER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# 查無此用戶 (帳號已刪除) 的結果保留時間 (秒)
+USER_CACHE_MISSING_TTL_SECONDS = 24 * 3600
+# 同時進行的 fetch_user 請求數 (所有查詢共用)
+USER_FETCH_CONCURRENCY = 4
+
+
+class UserProfileCache:
+    """用戶名稱的持久化快取：{user_id: {'name', 'display_name', 'fetched_at'}}，TTL 過期後重新查詢。
+
+    查詢順序為 快取 → bot 內建的用戶快取 → fetch_user (以共用的 semaphore 限制並行數)，
+    避免一次對大量 ID 呼叫 fetch_user 而觸發速率限制。
+    """
+
+    def __init__(self, bot, path: str = USER_CACHE_FILE,
+                 ttl: float = USER_CACHE_TTL_SECONDS, missing_ttl: float = USER_CACHE_MISSING_TTL_SECONDS):
+        self.bot = bot
+        self.path = path
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._semaphore = asyncio.Semaphore(USER_FETCH_CONCURRENCY)
+        self._entries = {}
+        self._dirty = False
+        self.fetches = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = time.time()
+        self._entries = {int(user_id): entry for user_id, entry in data.items() if not self._expired(entry, now)}
+
+    def save(self):
+        """有變更時寫回檔案 (先寫入暫存檔再取代，避免寫入中斷損壞快取)。"""
+        if not self._dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(user_id): entry for user_id, entry in self._entries.items()}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        ttl = self.missing_ttl if entry.get('missing') else self.ttl
+        return entry.get('fetched_at', 0) + ttl <= now
+
+    def _store(self, user_id: int, user: Optional[discord.abc.User]):
+        if user is None:
+            entry = {'missing': True}
+        else:
+            entry = {'name': user.name, 'display_name': user.display_name}
+        entry['fetched_at'] = time.time()
+        self._entries[user_id] = entry
+        self._dirty = True
+        return entry
+
+    def peek(self, user_id: int) -> Optional[dict]:
+        """只查詢本地快取 (不發出任何請求)，沒有或已過期時回傳 None。"""
+        entry = self._entries.get(user_id)
+        if entry is not None and not self._expired(entry, time.time()):
+            return entry
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return self._store(user_id, user)
+        return None
+
+    async def _fetch(self, user_id: int) -> dict:
+        async with self._semaphore:
+            # 等待期間可能已被其他查詢寫入
+            entry = self.peek(user_id)
+            if entry is not None:
+                return entry
+            self.fetches += 1
+            try:
+                user = await call_with_retries(lambda: self.bot.fetch_user(user_id))
+            except discord.NotFound:
+                user = None
+            except discord.HTTPException:
+                # 暫時性錯誤不寫入快取，下次再試
+                return {'missing': True}
+            return self._store(user_id, user)
+
+    async def resolve(self, user_ids: Iterable[int]) -> dict:
+        """回傳 {user_id: 用戶資料}；快取中沒有的 ID 以限制並行數的 fetch_user 查詢。"""
+        resolved = {}
+        to_fetch = []
+        for user_id in user_ids:
+            entry = self.peek(user_id)
+            if entry is None:
+                to_fetch.append(user_id)
+            else:
+                resolved[user_id] = entry
+        if to_fetch:
+            entries = await asyncio.gather(*(self._fetch(user_id) for user_id in to_fetch))
+            resolved.update(zip(to_fetch, entries))
+        self.save()
+        return resolved
@@ -15,6 +15,21 @@ import requests
 from aiohttp import web
 import logging
 from discord.ui import View, Button
+from AIGateway import (
+    AI_BUSY_MESSAGE, AI_TIMEOUT_MESSAGE, AIGateway, AIQueueFullError, AITimeoutError, stream_ai_reply
+)
+from AICache import AIResponseCache, normalize_prompt
+from AIMemory import ChannelMemoryStore
+from AntiSpam import (
+    AntiSpamEngine, SpamFingerprintSketch, bulk_delete_messages,
+    DEFAULT_THRESHOLDS as ANTISPAM_DEFAULT_THRESHOLDS,
+)
+from AIRateLimit import (
+    AIRateLimiter, RequestCoalescer,
+    DEFAULT_USER_RATE_PER_MINUTE, DEFAULT_GUILD_RATE_PER_MINUTE,
+)
+from GbanReplication import DELTAS_ROUTE
+from JoinPipeline import STAGE_AUTO_ROLE, STAGE_WELCOME, get_join_pipeline
 
 # 配置 logging
 logging.basicConfig(level=logging.INFO)
@@ -54,9 +69,27 @@ EARTHQUAKE_CHECK_INTERVAL_SECONDS = 300 # 5 分鐘檢查一次
 CWA_TOKEN = None
 EARTHQUAKE_DATA_URL = "" # 初始為空
 
+# AI 閘道設定
+AI_MODEL = 'gemini-2.5-flash'
+AI_MAX_CONCURRENCY = 4          # 同時送往 Gemini 的請求上限
+AI_MAX_QUEUE = 32               # 等待中的 AI 請求上限，超過即拒絕
+AI_REQUEST_TIMEOUT_SECONDS = 30 # 單一 AI 請求逾時
+AI_CACHE_MAX_ENTRIES = 512      # AI 回覆快取的最大筆數
+AI_CACHE_TTL_SECONDS = 3600     # AI 回覆快取的存活時間
+AI_GLOBAL_RATE_PER_MINUTE = 120 # 整個機器人每分鐘的 AI 請求上限
+AI_MEMORY_MAX_TURNS = 12        # 每個頻道保留的對話則數
+AI_MEMORY_TOKEN_BUDGET = 2000   # 每個頻道歷史對話的估計 token 上限
+AI_MEMORY_MAX_CHANNELS = 500    # 最多同時記住幾個頻道的對話
+AI_MEMORY_IDLE_SECONDS = 1800   # 頻道閒置多久後清除對話記憶
+
 # 全域變數來儲存所有伺服器設定
 server_settings = {} 
 
+# 防刷屏引擎 (每位用戶的滑動視窗，閒置用戶會被自動淘汰)
+antispam_engine = AntiSpamEngine()
+# 跨帳號 / 跨伺服器散播訊息偵測 (整個程序共用，只保存雜湊)
+spam_sketch = SpamFingerprintSketch()
+
 # 全域變數：動態語音頻道追蹤
 # {guild_id: {created_channel_id: owner_id}}
 DYNAMIC_CHANNELS = {} 
@@ -99,10 +132,14 @@ def get_guild_settings(guild_id):
         "log_channel_id": None,     
         "ticket_role_id": None,
         "ai_channel_id": None,
+        "ai_cache_enabled": True,
+        "ai_user_rate_per_minute": DEFAULT_USER_RATE_PER_MINUTE,
+        "ai_guild_rate_per_minute": DEFAULT_GUILD_RATE_PER_MINUTE,
         "role_buttons": [],
         "dynamic_voice_channel_id": None,
         "antispam_enabled": False,       
         "antispam_timeout_minutes": 10,
+        **ANTISPAM_DEFAULT_THRESHOLDS,
         "auto_role_id": None, 
         "earthquake_channel_id": None,  
         "earthquake_enabled": False,    
@@ -193,6 +230,57 @@ if AI_ENABLED:
 else:
      client = None
 
+# 所有 AI 呼叫都透過閘道進行 (非阻塞、限制並行數與佇列長度)
+ai_gateway = AIGateway(
+    client,
+    model=AI_MODEL,
+    max_concurrency=AI_MAX_CONCURRENCY,
+    max_queue=AI_MAX_QUEUE,
+    timeout=AI_REQUEST_TIMEOUT_SECONDS,
+    cache=AIResponseCache(max_entries=AI_CACHE_MAX_ENTRIES, ttl=AI_CACHE_TTL_SECONDS),
+) if client else None
+
+# AI 請求頻率限制 (全域 / 伺服器 / 用戶) 與相同問題合併
+ai_rate_limiter = AIRateLimiter(global_rate_per_minute=AI_GLOBAL_RATE_PER_MINUTE)
+ai_coalescer = RequestCoalescer()
+
+# 每個頻道的 AI 對話記憶 (環形緩衝區 + token 預算 + LRU 淘汰)
+ai_memory = ChannelMemoryStore(
+    max_sessions=AI_MEMORY_MAX_CHANNELS,
+    idle_ttl=AI_MEMORY_IDLE_SECONDS,
+    max_turns=AI_MEMORY_MAX_TURNS,
+    token_budget=AI_MEMORY_TOKEN_BUDGET,
+)
+
+AI_RATE_LIMIT_MESSAGES = {
+    'user': "🐢 你的 AI 請求太頻繁了，請在 {retry:.0f} 秒後再試。",
+    'guild': "🐢 本伺服器的 AI 請求太頻繁了，請在 {retry:.0f} 秒後再試。",
+    'global': "🐢 機器人目前的 AI 請求量已達上限，請在 {retry:.0f} 秒後再試。",
+}
+
+def check_ai_rate_limit(guild_id, user_id):
+    """檢查 AI 頻率限制；被限制時回傳要顯示給用戶的訊息，否則回傳 None。"""
+    if guild_id is not None:
+        settings = get_guild_settings(guild_id)
+        user_rate = settings.get('ai_user_rate_per_minute', DEFAULT_USER_RATE_PER_MINUTE)
+        guild_rate = settings.get('ai_guild_rate_per_minute', DEFAULT_GUILD_RATE_PER_MINUTE)
+    else:
+        user_rate, guild_rate = DEFAULT_USER_RATE_PER_MINUTE, DEFAULT_GUILD_RATE_PER_MINUTE
+
+    limited = ai_rate_limiter.check(guild_id, user_id, user_rate, guild_rate)
+    if limited is None:
+        return None
+    scope, retry_after = limited
+    return AI_RATE_LIMIT_MESSAGES[scope].format(retry=max(1, retry_after))
+
+def ai_cache_scope(guild_id):
+    """取得 AI 快取範圍；伺服器關閉快取時回傳 None。"""
+    if guild_id is None:
+        return "DM"
+    if not get_guild_settings(guild_id).get('ai_cache_enabled', True):
+        return None
+    return guild_id
+
 # --- 讀取 CWA TOKEN ---
 try:
     with open(CWA_KEY_FILE, 'r') as file:
@@ -218,6 +306,8 @@ intents.guilds = True
 intents.voice_states = True
 
 bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+# 成員加入流程 (黑名單 → Raid/年齡檢查 → 自動身分組 → 歡迎訊息)，各 Cog 載入時登記自己的階段
+join_pipeline = get_join_pipeline(bot)
 
 
 # --- UI 類別：客服單按鈕 (Ticket View) ---
@@ -395,18 +485,21 @@ class GiveawayView(discord.ui.View):
 class AICog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.ai_client = genai.Client(api_key=AI_KEY) if AI_ENABLED else None
-        self.chat_sessions = {} 
+        self.ai_client = ai_gateway
+        self.chat_sessions = ai_memory
 
-    def get_ai_response(self, prompt, client):
-        """獲取 Gemini AI 的回覆"""
-        model = 'gemini-2.5-flash'
+    async def get_ai_response(self, prompt, gateway, cache_scope=None, channel_id=None):
+        """透過 AI 閘道獲取 Gemini AI 的回覆，成功時寫入頻道的對話記憶"""
         try:
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt
-            )
-            return response.text
+            contents = self.chat_sessions.build_contents(channel_id, prompt) if channel_id else prompt
+            response_text = await gateway.generate(contents, cache_scope=cache_scope)
+            if channel_id and response_text:
+                self.chat_sessions.record(channel_id, prompt, response_text)
+            return response_text
+        except AIQueueFullError:
+            return AI_BUSY_MESSAGE
+        except AITimeoutError:
+            return AI_TIMEOUT_MESSAGE
         except Exception as e:
             logger.error(f"Gemini API 錯誤: {e}")
             return "❌ AI 服務目前無法回應，請稍後再試。"
@@ -434,9 +527,16 @@ class AICog(commands.Cog):
                     await message.channel.send("您好，我是 Gemini AI 智能 Bot，請問有什麼可以為您服務的呢？", reference=message)
                     return
 
+                limited_message = check_ai_rate_limit(message.guild.id, message.author.id)
+                if limited_message:
+                    await message.channel.send(limited_message, reference=message, delete_after=5)
+                    return
+
                 try:
                     # 執行 AI 請求 (非同步)
-                    ai_response = await asyncio.to_thread(self.get_ai_response, message_content, self.ai_client)
+                    ai_response = await self.get_ai_response(
+                        message_content, self.ai_client, ai_cache_scope(message.guild.id), message.channel.id
+                    )
                     
                     # **已修改：將純文字回覆替換為 Embed 遷入訊息**
                     embed = discord.Embed(
@@ -636,6 +736,12 @@ async def on_ready():
         # 載入失敗時，最好明確指出是哪裡出錯
         print(f"❌ Cog 載入失敗: {e}")
         
+    # 啟動 Web 伺服器 (狀態檢查與黑名單同步)；on_ready 可能因重新連線而多次觸發，只啟動一次
+    global web_server_started
+    if not web_server_started:
+        web_server_started = True
+        await start_web_server()
+
     try:
         # 3. 同步斜線指令 (放在所有 Cog 載入後)
         synced = await bot.tree.sync()
@@ -691,9 +797,8 @@ async def on_guild_join(guild):
     await new_channel.send(action_message)
     print(f"已在 {guild.name} 成功發送歡迎訊息到頻道 {new_channel.name}")
 
-@bot.event
-async def on_member_join(member):
-    """自動化任務: 自動歡迎 **及自動賦予身分組**"""
+async def assign_auto_role(member):
+    """加入流程階段: 自動賦予身分組"""
     settings = get_guild_settings(member.guild.id)
     
     # -----------------------------------------------------
@@ -714,36 +819,12 @@ async def on_member_join(member):
                     print(f"❌ 警告：在 {member.guild.name} 中，無法自動賦予身分組 '{auto_role.name}'，權限不足。")
                 except Exception as e:
                      print(f"❌ 賦予身分組時發生未知錯誤: {e}")
+    return True
 
-# --- 事件：機器人準備就緒 ---
-    async def on_ready(self):
-        """當機器人完成登入並準備就緒時觸發"""
-        global LAST_SYNC_TIME
-        
-        # 打印上線信息
-        print(f'機器人已上線：{self.user.name}#{self.user.discriminator} (ID: {self.user.id})')
-
-        # 檢查是否需要同步指令
-        if LAST_SYNC_TIME is None or (datetime.now() - LAST_SYNC_TIME) > timedelta(hours=1):
-            await self.sync_commands_task()
-        
-        # ⬇️ 精確整合：設置機器人狀態為 閒置 (Idle - 月亮圖標) ⬇️
-        try:
-            # 這裡使用 self.user.name 作為初始活動名稱
-            await self.change_presence(
-                status=discord.Status.idle,             
-                activity=discord.Game(name=self.user.name) 
-            )
-            print("✅ 機器人狀態已成功設定為 '閒置' (Idle/月亮)")
-        except Exception as e:
-            logger.error(f"❌ 設定狀態時發生錯誤: {e}")
-        # ⬆️ 精確整合：設置機器人狀態為 閒置 (Idle - 月亮圖標) ⬆️
-
-        print('--------------------------')
+async def send_welcome_message(member):
+    """加入流程階段: 自動歡迎新成員"""
+    settings = get_guild_settings(member.guild.id)
 
-    # -----------------------------------------------------
-    # 歡迎訊息邏輯
-    # -----------------------------------------------------
     welcome_channel = None
 
     if settings.get('welcome_channel_id'):
@@ -763,6 +844,15 @@ async def on_member_join(member):
         welcome_embed.set_footer(text=f"這是您的第 {len(member.guild.members)} 位成員！")
         
         await welcome_channel.send(content=f"嗨，{member.mention}！", embed=welcome_embed)
+    return True
+
+join_pipeline.register(STAGE_AUTO_ROLE, 'auto_role', assign_auto_role)
+join_pipeline.register(STAGE_WELCOME, 'welcome', send_welcome_message)
+
+@bot.event
+async def on_member_join(member):
+    """自動化任務: 依序執行加入流程 (被拒絕的成員不會收到身分組與歡迎訊息)"""
+    await join_pipeline.run(member)
 
 @bot.event
 async def on_message(message):
@@ -778,7 +868,7 @@ async def on_message(message):
     settings = get_guild_settings(message.guild.id)
     
     # 1. AI 聊天邏輯
-    if AI_ENABLED and client:
+    if AI_ENABLED and ai_gateway:
         should_reply_ai = False
         user_question = message.content
 
@@ -799,45 +889,75 @@ async def on_message(message):
                 users=False, 
                 roles=False 
             )
+            limited_message = check_ai_rate_limit(message.guild.id, message.author.id)
+            if limited_message:
+                await message.reply(limited_message, mention_author=False, allowed_mentions=safe_mentions, delete_after=5)
+                return
+
+            async def send_first(text):
+                return await message.reply(text, mention_author=False, allowed_mentions=safe_mentions)
+
+            async def send_followup(text):
+                return await message.channel.send(text, allowed_mentions=safe_mentions)
+
+            # 帶入本頻道的對話記憶 (沒有歷史時與單次提問相同，可使用快取)
+            contents = ai_memory.build_contents(message.channel.id, user_question)
             async with message.channel.typing():
-                try:
-                    response = client.models.generate_content(model='gemini-2.5-flash', contents=user_question)
-                    if response.text:
-                        await message.reply(response.text, mention_author=False, allowed_mentions=safe_mentions) 
-                    else:
-                        await message.reply("抱歉，我無法理解您的問題。", mention_author=False, allowed_mentions=safe_mentions)
-                except Exception as e:
-                    print(f"AI 回覆時發生錯誤: {e}")
-                    await message.reply("❌ AI 服務發生錯誤。", mention_author=False, allowed_mentions=safe_mentions)
+                reply_text = await stream_ai_reply(
+                    ai_gateway, contents, send_first, send_followup, "抱歉，我無法理解您的問題。",
+                    cache_scope=ai_cache_scope(message.guild.id),
+                    coalescer=ai_coalescer,
+                    coalesce_key=(message.channel.id, normalize_prompt(user_question))
+                )
+            if reply_text:
+                ai_memory.record(message.channel.id, user_question, reply_text)
             if settings.get('ai_channel_id') == message.channel.id:
                 return
     
     # 2. 防刷屏系統
+    # 散播指紋統計所有伺服器的訊息，處罰只在開啟防刷屏的伺服器執行
+    is_spread_spam = spam_sketch.observe(message.author.id, message.content)
     if settings.get("antispam_enabled"):
-        content = message.content.lower()
         timeout_minutes = settings.get("antispam_timeout_minutes", 10) 
-        
-        if len(content) > 20:
-            most_common = max(set(content), key=content.count, default='')
-            if most_common and content.count(most_common) / len(content) > 0.5:
-                
-                try:
-                    await message.delete()
-                except discord.Forbidden:
-                    await message.channel.send(f"⚠️ {message.author.mention}：請勿刷屏！機器人沒有刪除訊息的權限。", delete_after=5)
-                    await bot.process_commands(message) 
-                    return
-                
-                try:
-                    duration = discord.utils.utcnow() + timedelta(minutes=timeout_minutes)
-                    await message.author.timeout(duration, reason=f"自動防刷屏：重複字元刷屏 (Timeout {timeout_minutes}m)")
-                    await message.channel.send(
-                        f"🚫 防刷屏系統啟用：{message.author.mention} 因刷屏被禁言 **{timeout_minutes} 分鐘**。", 
-                        delete_after=10
-                    )
-                except discord.Forbidden:
-                    pass
-                
+        mention_count = len(message.raw_mentions) + len(message.raw_role_mentions) + (1 if message.mention_everyone else 0)
+        spam_reason = antispam_engine.check(
+            message.guild.id, message.author.id, message.content, mention_count, settings,
+            channel_id=message.channel.id, message_id=message.id
+        )
+        if not spam_reason and is_spread_spam:
+            spam_reason = "多個帳號散播相同訊息"
+
+        if spam_reason:
+            # 先禁言阻止繼續刷屏，再批次清除該用戶最近在各頻道的訊息 (包含本則)
+            timed_out = False
+            try:
+                duration = discord.utils.utcnow() + timedelta(minutes=timeout_minutes)
+                await message.author.timeout(duration, reason=f"自動防刷屏：{spam_reason} (Timeout {timeout_minutes}m)")
+                timed_out = True
+            except discord.Forbidden:
+                pass
+
+            # 只清除觸發偵測的視窗內的訊息 (散播訊息的統計視窗較長，最多涵蓋兩個輪替週期)
+            window_seconds = antispam_engine.window_seconds(settings)
+            if spam_reason == "多個帳號散播相同訊息":
+                window_seconds = max(window_seconds, spam_sketch.window_seconds * 2)
+            recent_messages = antispam_engine.take_recent_messages(message.guild.id, message.author.id, window_seconds)
+            try:
+                deleted_count = await bulk_delete_messages(message.guild, recent_messages)
+            except discord.Forbidden:
+                await message.channel.send(f"⚠️ {message.author.mention}：請勿刷屏！機器人沒有刪除訊息的權限。", delete_after=5)
+                await bot.process_commands(message) 
+                return
+            except discord.HTTPException as e:
+                print(f"❌ 批次清除刷屏訊息時發生錯誤: {e}")
+                deleted_count = 0
+
+            penalty = f"被禁言 **{timeout_minutes} 分鐘**，" if timed_out else ""
+            await message.channel.send(
+                f"🚫 防刷屏系統啟用：{message.author.mention} 因{spam_reason}{penalty}已清除 **{deleted_count}** 則訊息。", 
+                delete_after=10
+            )
+            
 
 
 # --- 動態語音頻道事件處理 ---
@@ -958,6 +1078,51 @@ async def 設定_AI_頻道(interaction: discord.Interaction, 頻道: discord.Tex
     save_settings()
     await interaction.response.send_message(f"✅ AI 智能回覆專屬頻道已設定為 {頻道.mention}。\n在該頻道中，用戶發送非指令訊息時，Bot 將會自動回覆。", ephemeral=True)
 
+@bot.tree.command(name="開關ai快取", description="開關本伺服器的 AI 回覆快取 (管理員專用)。")
+@app_commands.describe(開關="選擇 '開啟' 或 '關閉'")
+@app_commands.choices(開關=[
+    app_commands.Choice(name="開啟", value="on"),
+    app_commands.Choice(name="關閉", value="off")
+])
+@app_commands.checks.has_permissions(administrator=True)
+async def 開關ai快取(interaction: discord.Interaction, 開關: str):
+    settings = get_guild_settings(interaction.guild_id)
+
+    is_enabled = 開關 == "on"
+    settings['ai_cache_enabled'] = is_enabled
+    save_settings()
+
+    if is_enabled:
+        await interaction.response.send_message("✅ AI 回覆快取已 **開啟**，重複的問題將直接使用快取回覆。", ephemeral=True)
+    else:
+        if ai_gateway and ai_gateway.cache:
+            ai_gateway.cache.clear(interaction.guild_id)
+        await interaction.response.send_message("✅ AI 回覆快取已 **關閉**，並已清除本伺服器的快取。", ephemeral=True)
+
+@bot.tree.command(name="清除ai對話", description="清除 AI 在本頻道的對話記憶。")
+@app_commands.checks.has_permissions(manage_messages=True)
+async def 清除ai對話(interaction: discord.Interaction):
+    ai_memory.clear(interaction.channel_id)
+    await interaction.response.send_message("✅ 已清除 AI 在本頻道的對話記憶。", ephemeral=True)
+
+@bot.tree.command(name="設定ai頻率限制", description="設定本伺服器 AI 請求的頻率限制 (管理員專用)。")
+@app_commands.describe(
+    每位用戶每分鐘="每位用戶每分鐘最多可發出的 AI 請求數 (1-60)",
+    整個伺服器每分鐘="整個伺服器每分鐘最多可發出的 AI 請求數 (1-600)"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def 設定ai頻率限制(interaction: discord.Interaction,
+                        每位用戶每分鐘: app_commands.Range[int, 1, 60] = DEFAULT_USER_RATE_PER_MINUTE,
+                        整個伺服器每分鐘: app_commands.Range[int, 1, 600] = DEFAULT_GUILD_RATE_PER_MINUTE):
+    settings = get_guild_settings(interaction.guild_id)
+    settings['ai_user_rate_per_minute'] = 每位用戶每分鐘
+    settings['ai_guild_rate_per_minute'] = 整個伺服器每分鐘
+    save_settings()
+    await interaction.response.send_message(
+        f"✅ AI 頻率限制已更新：每位用戶每分鐘 **{每位用戶每分鐘}** 次，整個伺服器每分鐘 **{整個伺服器每分鐘}** 次。",
+        ephemeral=True
+    )
+
 @bot.tree.command(name="開關防刷屏", description="開關防刷屏系統，並設定刷屏後的禁言時間 (管理員專用)。")
 @app_commands.describe(
     開關="選擇 '開啟' 或 '關閉'", 
@@ -986,6 +1151,35 @@ async def 開關防刷屏(interaction: discord.Interaction, 開關: str, 禁言
         await interaction.response.send_message("✅ 防刷屏系統已 **關閉**。", ephemeral=True)
 
 
+@bot.tree.command(name="設定防刷屏門檻", description="調整防刷屏系統的偵測門檻 (管理員專用)。")
+@app_commands.describe(
+    視窗秒數="計算頻率的滑動視窗長度 (秒)",
+    訊息數="視窗內最多可發送的訊息數",
+    重複訊息數="視窗內相同內容最多可出現的次數",
+    提及數="視窗內最多可提及的次數",
+    連結數="視窗內最多可發送的連結數"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def 設定防刷屏門檻(interaction: discord.Interaction,
+                          視窗秒數: app_commands.Range[int, 1, 300] = ANTISPAM_DEFAULT_THRESHOLDS["antispam_window_seconds"],
+                          訊息數: app_commands.Range[int, 1, 100] = ANTISPAM_DEFAULT_THRESHOLDS["antispam_max_messages"],
+                          重複訊息數: app_commands.Range[int, 1, 50] = ANTISPAM_DEFAULT_THRESHOLDS["antispam_max_duplicates"],
+                          提及數: app_commands.Range[int, 1, 100] = ANTISPAM_DEFAULT_THRESHOLDS["antispam_max_mentions"],
+                          連結數: app_commands.Range[int, 1, 100] = ANTISPAM_DEFAULT_THRESHOLDS["antispam_max_links"]):
+    settings = get_guild_settings(interaction.guild_id)
+    settings['antispam_window_seconds'] = 視窗秒數
+    settings['antispam_max_messages'] = 訊息數
+    settings['antispam_max_duplicates'] = 重複訊息數
+    settings['antispam_max_mentions'] = 提及數
+    settings['antispam_max_links'] = 連結數
+    save_settings()
+    await interaction.response.send_message(
+        f"✅ 防刷屏門檻已更新 (每 **{視窗秒數}** 秒)：\n"
+        f"訊息 **{訊息數}** 則 | 重複內容 **{重複訊息數}** 次 | 提及 **{提及數}** 次 | 連結 **{連結數}** 個",
+        ephemeral=True
+    )
+
+
 # --- 動態語音頻道設定指令 ---
 
 @bot.tree.command(name="設定動態語音頻道", description="設定一個語音頻道作為動態頻道創建的入口 (管理員專用)。")
@@ -1079,7 +1273,7 @@ async def 指令清單(interaction: discord.Interaction):
         color=0x4a90e2
     )
     
-    ai_status = "`/智能回覆`, `/擲骰子`, `/發起投票`\n*AI 可在專屬頻道或提及 Bot (@他) 使用*"
+    ai_status = "`/智能回覆`, `/ai狀態`, `/擲骰子`, `/發起投票`\n*AI 可在專屬頻道或提及 Bot (@他) 使用*"
     if not AI_ENABLED:
         ai_status = "*AI 功能目前未啟用或 Key 未設置*"
 
@@ -1088,13 +1282,13 @@ async def 指令清單(interaction: discord.Interaction):
     help_embed.add_field(name="**✨ 伺服器配置與自動化**", value=(
         "`/發布身分組按鈕` (永久按鈕領取)\n"
         "`/設定動態語音頻道`, `/清除動態語音頻道`\n"
-        "`/開關防刷屏` (防刷屏設定)\n"
+        "`/開關防刷屏`, `/設定防刷屏門檻` (防刷屏設定)\n"
         "`/設定自動身分組`, `/清除自動身分組` (新成員自動賦予身分組)\n"
         "`/計時器`, `/抽獎`"
     ), inline=False) 
     
     help_embed.add_field(name="**系統 / 設定**", value=(
-        "`/設定歡迎頻道`, `/設定智能回覆頻道`\n"
+        "`/設定歡迎頻道`, `/設定智能回覆頻道`, `/開關ai快取`, `/設定ai頻率限制`, `/清除ai對話`\n"
         "`/設定客服角色`, `/發布客服按鈕`, `/關閉客服單`\n"
         "`/設定地震頻道`, `/開啟地震速報`, `/關閉地震速報`\n"
     ), inline=False)
@@ -1125,8 +1319,12 @@ async def latency_command(interaction: discord.Interaction):
 @bot.tree.command(name="智能回覆", description="使用 Google Gemini AI 智能回覆您的問題。")
 @app_commands.describe(問題="您想問 AI 的問題。")
 async def 智能回覆(interaction: discord.Interaction, 問題: str):
-    if not client:
+    if not ai_gateway:
         return await interaction.response.send_message("❌ AI 服務尚未初始化成功 (請檢查 google_key.txt)。", ephemeral=True)
+
+    limited_message = check_ai_rate_limit(interaction.guild_id, interaction.user.id)
+    if limited_message:
+        return await interaction.response.send_message(limited_message, ephemeral=True)
     await interaction.response.defer()
     
     safe_mentions = discord.AllowedMentions(
@@ -1135,14 +1333,46 @@ async def 智能回覆(interaction: discord.Interaction, 問題: str):
         roles=False
     )
     
-    try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=問題)
-        if response.text:
-            await interaction.followup.send(response.text, allowed_mentions=safe_mentions) 
-        else:
-            await interaction.followup.send("抱歉，我無法生成有效的回答。", allowed_mentions=safe_mentions)
-    except Exception as e:
-        await interaction.followup.send("❌ AI 服務發生錯誤。", allowed_mentions=safe_mentions)
+    async def send_reply(text):
+        return await interaction.followup.send(text, allowed_mentions=safe_mentions, wait=True)
+
+    await stream_ai_reply(
+        ai_gateway, 問題, send_reply, send_reply, "抱歉，我無法生成有效的回答。",
+        cache_scope=ai_cache_scope(interaction.guild_id),
+        coalescer=ai_coalescer,
+        coalesce_key=(interaction.channel_id, normalize_prompt(問題))
+    )
+
+@bot.tree.command(name="ai狀態", description="查看 AI 服務的佇列深度與回應延遲。")
+async def ai狀態(interaction: discord.Interaction):
+    if not ai_gateway:
+        return await interaction.response.send_message("❌ AI 服務尚未初始化成功 (請檢查 google_key.txt)。", ephemeral=True)
+
+    stats = ai_gateway.stats()
+    embed = discord.Embed(title="🤖 AI 服務狀態", color=discord.Color.from_rgb(0, 150, 255))
+    embed.add_field(name="執行中", value=f"{stats['active']}/{stats['max_concurrency']}", inline=True)
+    embed.add_field(name="等待中", value=f"{stats['queue_depth']}/{stats['max_queue']}", inline=True)
+    embed.add_field(name="延遲 (p50 / p95)", value=f"{stats['p50_ms']:.0f} ms / {stats['p95_ms']:.0f} ms", inline=False)
+    embed.add_field(name="首段回應 (p50)", value=f"{stats['first_chunk_p50_ms']:.0f} ms", inline=False)
+    if ai_gateway.cache:
+        cache_stats = ai_gateway.cache.stats()
+        embed.add_field(
+            name="回覆快取",
+            value=(
+                f"命中率 {cache_stats['hit_rate']:.1%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']}) | "
+                f"{cache_stats['entries']}/{cache_stats['max_entries']} 筆 | 淘汰 {cache_stats['evictions']}"
+            ),
+            inline=False
+        )
+    embed.add_field(
+        name="累計",
+        value=(
+            f"請求 {stats['total_requests']} | 拒絕 {stats['total_rejected']} | "
+            f"逾時 {stats['total_timeouts']} | 錯誤 {stats['total_errors']}"
+        ),
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name='大量刪除訊息', description="批量刪除當前頻道中最多 100 條訊息 (14天內)。")
 @app_commands.describe(數量="要刪除的訊息數量 (1-100)", 頻道="要刪除訊息的頻道 (可選, 預設為當前頻道)")
@@ -1408,6 +1638,8 @@ async def 關閉客服單(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 此頻道不是客服單頻道。", ephemeral=True)
 
 # --- Web 伺服器所需函數 ---
+web_server_started = False
+
 async def status_handler(request):
     """
     處理 /status 請求，返回機器人運行狀態
@@ -1415,6 +1647,15 @@ async def status_handler(request):
     # 這裡可以加入更詳細的檢查，確保 Bot 已經登入
     return web.Response(text="Bot is running and healthy", status=200)
 
+async def gban_deltas_handler(request):
+    """
+    提供黑名單變更紀錄給其他機器人實例 (需要 gban_replication.json 中的 token)
+    """
+    cog = bot.get_cog('GlobalBan')
+    if cog is None:
+        return web.json_response({'error': 'GlobalBan not loaded'}, status=503)
+    return await cog.replication.handle_deltas(request)
+
 async def start_web_server():
     """
     啟動 AIOHTTP Web 伺服器並顯示公開網址提示
@@ -1423,6 +1664,8 @@ async def start_web_server():
     # 將根路徑和 /status 路徑都設為狀態檢查
     app.router.add_get('/', status_handler) 
     app.router.add_get('/status', status_handler)
+    # 多個實例之間的黑名單同步
+    app.router.add_get(DELTAS_ROUTE, gban_deltas_handler)
     
     # 從環境變數中獲取 PORT 和 HOST
     port = int(os.environ.get('PORT', 8080))
@@ -1460,7 +1703,8 @@ async def start_web_server():
 
 # --- 啟動機器人 ---
 
-if TOKEN:
+# 只在直接執行時啟動 (讓 RaidSimulator 等工具可以匯入加入流程的階段)
+if __name__ == '__main__' and TOKEN:
     # 確保所有必要的檔案都存在
     for filename in [SETTINGS_FILE, TOKEN_FILE, AI_KEY_FILE, CWA_KEY_FILE]:
         if not os.path.exists(filename):
@@ -0,0 +1,41 @@
+from AntiSpam import FINGERPRINT_AUTHOR_THRESHOLD, SpamFingerprintSketch
+
+SPAM = "free nitro giveaway click the link in my profile now"
+
+
+def feed_background(sketch, count, now):
+    for i in range(count):
+        sketch.observe(1_000_000 + i, f"ordinary background chat message number {i}", now=now)
+
+
+def spam_authors_until_flagged(sketch, now, authors=40):
+    """回傳第幾位不同用戶發送時被標記 (從 1 開始)，沒有被標記時回傳 None。"""
+    for index in range(authors):
+        if sketch.observe(index, SPAM, now=now):
+            return index + 1
+    return None
+
+
+def test_flags_at_threshold_under_expected_rate():
+    sketch = SpamFingerprintSketch()
+    feed_background(sketch, 20_000, now=0.0)
+    assert spam_authors_until_flagged(sketch, now=1.0) == FINGERPRINT_AUTHOR_THRESHOLD
+
+
+def test_flags_at_threshold_beyond_capacity():
+    # 一個視窗內的訊息量超過容量 (60 秒 x 1000 則)，應提前輪替而不是飽和
+    sketch = SpamFingerprintSketch()
+    feed_background(sketch, 150_000, now=0.0)
+    assert sketch.early_rotations >= 2
+    assert spam_authors_until_flagged(sketch, now=1.0) == FINGERPRINT_AUTHOR_THRESHOLD
+
+
+def test_background_messages_are_not_flagged():
+    sketch = SpamFingerprintSketch()
+    feed_background(sketch, 100_000, now=0.0)
+    assert sketch.flag_count == 0
+
+
+def test_single_author_repeating_is_not_flagged():
+    sketch = SpamFingerprintSketch()
+    assert not any(sketch.observe(1, SPAM, now=float(i)) for i in range(100))